@@ -0,0 +1,140 @@
+import math
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Tuple
+
+from .metrics import ADMISSION_DECISIONS
+
+SCOPES = ("user", "agent")
+
+# Buckets are swept for idle (full) ones once there are this many
+SWEEP_THRESHOLD = 10000
+
+
+class RateLimited(Exception):
+    """Raised when a request is over one of its tenant limits"""
+
+    def __init__(self, limit: str, scope: str, retry_after: Optional[float] = None):
+        self.limit = limit
+        self.scope = scope
+        self.retry_after = retry_after
+        super().__init__(f"Too many requests: {limit} limit reached for this {scope}")
+
+    def retry_after_header(self) -> Dict[str, str]:
+        """Headers for the 429 response"""
+        if self.retry_after is None:
+            return {}
+        return {"Retry-After": str(max(1, math.ceil(self.retry_after)))}
+
+    def frame(self) -> dict:
+        """A WebSocket error frame for the rejection"""
+        frame = {"type": "error", "code": "rate_limited", "limit": self.limit, "content": str(self)}
+        if self.retry_after is not None:
+            frame["retry_after"] = round(self.retry_after, 2)
+        return frame
+
+
+class RateLimit:
+    """Token buckets per user and per agent for one kind of work.
+
+    Each bucket refills continuously at ``per_minute`` tokens a minute and
+    holds at most one minute's worth, so bursts up to the per-minute limit
+    go through. A request must fit in both its user's and its agent's
+    bucket and is charged to both, or to neither when rejected. One request
+    bigger than a whole bucket (a large upload) is admitted when the bucket
+    is full and leaves it in debt. A limit of 0 disables that scope.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        per_user_per_minute: float,
+        per_agent_per_minute: float,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.name = name
+        self.limits = {"user": per_user_per_minute, "agent": per_agent_per_minute}
+        self.clock = clock
+        # (scope, key) -> (tokens, last refill time)
+        self.buckets: Dict[Tuple[str, str], Tuple[float, float]] = {}
+
+    def _tokens(self, scope: str, key: str, now: float) -> float:
+        capacity = self.limits[scope]
+        tokens, updated = self.buckets.get((scope, key), (capacity, now))
+        return min(capacity, tokens + (now - updated) * capacity / 60.0)
+
+    def take(self, user_id: str, agent_id: str, amount: float = 1.0):
+        """Charge ``amount`` to both buckets or raise ``RateLimited``"""
+        now = self.clock()
+        keys = {"user": user_id, "agent": agent_id}
+        balances = {}
+        for scope in SCOPES:
+            capacity = self.limits[scope]
+            if not capacity:
+                continue
+            tokens = self._tokens(scope, keys[scope], now)
+            if tokens < min(amount, capacity):
+                ADMISSION_DECISIONS.inc(limit=self.name, scope=scope, result="rejected")
+                retry_after = (min(amount, capacity) - tokens) * 60.0 / capacity
+                raise RateLimited(self.name, scope, retry_after)
+            balances[scope] = tokens
+
+        for scope, tokens in balances.items():
+            self.buckets[(scope, keys[scope])] = (tokens - amount, now)
+            ADMISSION_DECISIONS.inc(limit=self.name, scope=scope, result="allowed")
+        if len(self.buckets) > SWEEP_THRESHOLD:
+            self._sweep(now)
+
+    def _sweep(self, now: float):
+        """Forget buckets that have refilled completely; they start full anyway"""
+        for scope, key in list(self.buckets):
+            if self._tokens(scope, key, now) >= self.limits[scope]:
+                del self.buckets[(scope, key)]
+
+
+class ConcurrencyLimit:
+    """At most N operations in flight per user and per agent.
+
+    Over the limit, ``acquire`` rejects right away instead of queueing, so
+    clients get a 429 or an error frame rather than a hung request. A
+    limit of 0 disables that scope.
+    """
+
+    def __init__(self, name: str, per_user: int, per_agent: int):
+        self.name = name
+        self.limits = {"user": per_user, "agent": per_agent}
+        self.active: Dict[Tuple[str, str], int] = {}
+        self.in_flight = 0
+
+    def acquire(self, user_id: str, agent_id: str):
+        keys = {"user": user_id, "agent": agent_id}
+        for scope in SCOPES:
+            limit = self.limits[scope]
+            if limit and self.active.get((scope, keys[scope]), 0) >= limit:
+                ADMISSION_DECISIONS.inc(limit=self.name, scope=scope, result="rejected")
+                raise RateLimited(self.name, scope)
+        for scope in SCOPES:
+            if self.limits[scope]:
+                key = (scope, keys[scope])
+                self.active[key] = self.active.get(key, 0) + 1
+                ADMISSION_DECISIONS.inc(limit=self.name, scope=scope, result="allowed")
+        self.in_flight += 1
+
+    def release(self, user_id: str, agent_id: str):
+        self.in_flight -= 1
+        keys = {"user": user_id, "agent": agent_id}
+        for scope in SCOPES:
+            key = (scope, keys[scope])
+            count = self.active.get(key, 0)
+            if count <= 1:
+                self.active.pop(key, None)
+            else:
+                self.active[key] = count - 1
+
+    @contextmanager
+    def hold(self, user_id: str, agent_id: str):
+        self.acquire(user_id, agent_id)
+        try:
+            yield
+        finally:
+            self.release(user_id, agent_id)
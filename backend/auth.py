@@ -1,26 +1,17 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from supabase import create_client, Client
 from pydantic import BaseModel
-import os
+import asyncio
 from typing import Optional
 from dotenv import load_dotenv
 load_dotenv()
 import logging
 
-logger = logging.getLogger(__name__)
-
-# Initialize Supabase client
-supabase_url = os.getenv("SUPABASE_URL")
-supabase_key = os.getenv("SUPABASE_ANON_KEY")  # For auth verification, we use anon key
-
-print(f"[AGENTIC DEBUG] Initializing Supabase client with URL: {supabase_url}")
-print(f"[AGENTIC DEBUG] Using anon key: {supabase_key[:20]}..." if supabase_key else "[AGENTIC DEBUG] No anon key found")
+from .metrics import AUTH_VERIFY_SECONDS, ERRORS
+from .services import services
+from .tracing import span
 
-if not supabase_url or not supabase_key:
-    raise ValueError("SUPABASE_URL and SUPABASE_ANON_KEY must be set")
-
-supabase: Client = create_client(supabase_url, supabase_key)
+logger = logging.getLogger(__name__)
 
 security = HTTPBearer(auto_error=False)  # Don't auto-error, let us handle it
 
@@ -50,7 +41,8 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         print("[AGENTIC DEBUG] Token:", token[:50] + "..." if len(token) > 50 else token)  # Truncate for security
         
         # Verify token with Supabase
-        user_data = supabase.auth.get_user(token)
+        with AUTH_VERIFY_SECONDS.time(transport="http"), span("auth"):
+            user_data = await asyncio.to_thread(services.auth_client.auth.get_user, token)
         print("[AGENTIC DEBUG] user_data:", user_data)  # AGENTIC DEBUG: Print user data for troubleshooting
         
         if not user_data.user:
@@ -64,7 +56,9 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         # Get user profile from database (optional - don't fail if no profile)
         role = None
         try:
-            profile = supabase.table("profiles").select("*").eq("id", user_data.user.id).single().execute()
+            profile = await asyncio.to_thread(
+                services.auth_client.table("profiles").select("*").eq("id", user_data.user.id).single().execute
+            )
             role = profile.data.get("role") if profile.data else None
         except Exception as profile_error:
             print(f"[AGENTIC DEBUG] Profile fetch failed (continuing anyway): {profile_error}")
@@ -81,6 +75,7 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         print(f"[AGENTIC DEBUG] HTTP Exception in auth: {http_exc.detail}")
         raise http_exc
     except Exception as e:
+        ERRORS.inc(stage="auth")
         print(f"[AGENTIC DEBUG] Unexpected error in authentication: {e}")
         print(f"[AGENTIC DEBUG] Error type: {type(e)}")
         import traceback
@@ -0,0 +1,60 @@
+import re
+from typing import Iterable, List, Optional, Pattern, Tuple
+
+from fastapi import HTTPException
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .serialization import FastJSONResponse
+
+
+def _too_large(limit: int) -> str:
+    return f"Request body too large (max {limit / (1024 * 1024):.0f}MB)"
+
+
+class BodySizeLimitMiddleware:
+    """Cap request bodies on selected paths, before and while they arrive.
+
+    ``limits`` pairs a path regex with a maximum body size in bytes. A
+    declared Content-Length over the limit is answered with 413 before any
+    of the body is read. Bodies without one (chunked uploads), or with a
+    wrong one, are counted as they stream in and cut off with 413 as soon
+    as they pass the limit, instead of being spooled in full first.
+    """
+
+    def __init__(self, app: ASGIApp, limits: Iterable[Tuple[str, int]]):
+        self.app = app
+        self.limits: List[Tuple[Pattern, int]] = [(re.compile(pattern), max_bytes) for pattern, max_bytes in limits]
+
+    def limit_for(self, path: str) -> Optional[int]:
+        for pattern, max_bytes in self.limits:
+            if pattern.match(path):
+                return max_bytes
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        limit = self.limit_for(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        declared = Headers(scope=scope).get("content-length", "")
+        if declared.isdigit() and int(declared) > limit:
+            response = FastJSONResponse({"detail": _too_large(limit)}, status_code=413)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Raised inside the form parser; FastAPI passes
+                    # HTTPExceptions through and the app answers 413
+                    raise HTTPException(status_code=413, detail=_too_large(limit))
+            return message
+
+        await self.app(scope, limited_receive, send)
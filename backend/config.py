@@ -1,6 +1,6 @@
 import os
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import List, Optional
 
 class Settings(BaseSettings):
     # Supabase Configuration
@@ -8,9 +8,25 @@ class Settings(BaseSettings):
     supabase_anon_key: str
     supabase_service_role_key: str
     
+    # Storage Backend
+    # "supabase" (PostgREST over the network) or "sqlite" (embedded, in-process).
+    # Authentication always goes through Supabase.
+    storage_backend: str = "supabase"
+    sqlite_path: str = "data/app.db"
+    
     # Ollama Configuration
     ollama_base_url: str = "http://localhost:11434"
     ollama_model: str = "llama2"
+    # How long Ollama keeps a model loaded after each request: a duration
+    # ("30m", "24h"), -1 to never unload, 0 to unload right away; empty
+    # leaves Ollama's default (5m)
+    ollama_keep_alive: str = "30m"
+    # Load the chat model, and any extra models listed, in the background at startup
+    ollama_warmup: bool = True
+    ollama_warmup_models: List[str] = []
+    # While chat sessions are open, refresh the model's keep-alive this often
+    # so it is not unloaded between turns; 0 disables
+    ollama_keepalive_interval_s: float = 300.0
     
     # Server Configuration
     host: str = "0.0.0.0"
@@ -19,6 +35,87 @@ class Settings(BaseSettings):
     
     # Embedding Model Configuration
     embedding_model: str = "all-MiniLM-L6-v2"
+    # "torch" (sentence-transformers) or "onnx" (ONNX Runtime on the model
+    # exported with run_backend.py --export-onnx, no torch needed to serve)
+    embedding_backend: str = "torch"
+    embedding_onnx_dir: Optional[str] = None  # default: models/<embedding_model>-onnx
+    embedding_onnx_quantized: bool = True  # dynamic int8 model instead of fp32
+    embedding_threads: int = 0  # ONNX intra-op threads; 0 = the process's share of the cores
+    # Bulk embedding buckets texts by length; each encode call holds at most
+    # this many padded tokens (the memory budget) and this many texts
+    embedding_batch_tokens: int = 8192
+    embedding_max_batch_size: int = 256
+    # Re-embedding after EMBEDDING_MODEL changes (POST /admin/reindex or
+    # run_backend.py --reindex); 0 chunks/s runs it unthrottled
+    reindex_batch_size: int = 256
+    reindex_max_chunks_per_second: float = 100.0
+    
+    # Services created in a background warmup at startup instead of on first
+    # use (see backend/services.py); "embedding_service" also loads the model
+    warmup_services: List[str] = ["embedding_service"]
+    
+    # WebSocket Streaming Configuration
+    # Tokens are coalesced into one frame per interval or per size limit;
+    # set both to 0 to send one frame per token.
+    ws_flush_interval_ms: int = 25
+    ws_flush_max_bytes: int = 512
+    ws_default_framing: str = "json"  # "json", "msgpack" or "binary"
+    
+    # HTTP Response Compression
+    # JSON and text bodies at least this large are sent brotli (if installed)
+    # or gzip compressed, as the client's Accept-Encoding allows; 0 disables
+    response_compression_min_bytes: int = 1024
+    
+    # WebSocket Connection Registry
+    ws_max_connections_per_user: int = 5
+    ws_heartbeat_interval_s: float = 30.0
+    ws_idle_timeout_s: float = 300.0  # evict sockets silent for this long (pongs count)
+    
+    # Conversation memory: prompts carry a rolling summary of older messages
+    # plus the messages it does not cover yet (at least chat_history_messages,
+    # fewer than chat_history_messages + chat_summary_batch_messages). Older
+    # messages are folded into the summary in the background, in batches.
+    # chat_history_messages = 0 sends no history at all.
+    chat_history_messages: int = 6
+    chat_history_message_chars: int = 2000  # longer messages are cut in the prompt
+    chat_summary_enabled: bool = True
+    chat_summary_batch_messages: int = 4
+    chat_summary_max_wait_s: float = 30.0  # how long a summary waits for chat generations to finish
+    
+    # Speculative retrieval on "draft" frames: once a draft has been left
+    # alone for the debounce, its KB context is retrieved and reused if the
+    # message matches it or the draft covers min_coverage of the message
+    chat_drafts_enabled: bool = True
+    chat_draft_debounce_ms: int = 300
+    chat_draft_min_chars: int = 8
+    chat_draft_min_coverage: float = 0.8
+    
+    # Tenant Limits (token buckets and concurrency caps per user and per
+    # agent; 0 disables a limit)
+    chat_messages_per_minute_per_user: int = 30
+    chat_messages_per_minute_per_agent: int = 300
+    chat_concurrent_generations_per_user: int = 2
+    chat_concurrent_generations_per_agent: int = 10
+    upload_mb_per_minute_per_user: float = 50.0
+    upload_mb_per_minute_per_agent: float = 100.0
+    ingestion_concurrent_per_user: int = 2
+    ingestion_concurrent_per_agent: int = 2
+    
+    # Local Vector Index
+    # Directory of per-agent snapshots (built with run_backend.py --build-index);
+    # loaded memory-mapped at startup when set
+    vector_index_dir: Optional[str] = None
+    # Two-stage search for large agents: score every chunk on a PCA projection
+    # of this many dimensions (0 disables), then re-score the best
+    # retrieval_candidates at full dimension
+    retrieval_prefilter_dims: int = 64
+    retrieval_candidates: int = 256
+    retrieval_two_stage_min_chunks: int = 10000
+    
+    # Observability
+    metrics_enabled: bool = True  # serve Prometheus metrics on GET /metrics
+    trace_slow_threshold_ms: float = 1000.0  # traces slower than this are logged at INFO
+    profiler_max_seconds: float = 60.0  # upper bound for GET /admin/profile
     
     # CORS Configuration
     allowed_origins: List[str] = ["http://localhost:3000", "http://localhost:5173"]
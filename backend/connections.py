@@ -0,0 +1,172 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from typing import Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Close code sent to sockets evicted for missing heartbeats
+IDLE_CLOSE_CODE = 4008
+
+class ConnectionLimitExceeded(Exception):
+    """Raised when a user already has the maximum number of open sockets"""
+
+
+class Connection:
+    """A registered WebSocket session"""
+
+    __slots__ = ("id", "websocket", "sender", "user_id", "agent_id", "connected_at", "last_seen")
+
+    def __init__(self, websocket, user_id: str, agent_id: str):
+        self.id = uuid.uuid4().hex
+        self.websocket = websocket
+        # FrameSender for the negotiated framing, set once the socket is accepted
+        self.sender = None
+        self.user_id = user_id
+        self.agent_id = agent_id
+        self.connected_at = time.monotonic()
+        self.last_seen = self.connected_at
+
+
+class ConnectionRegistry:
+    """Track WebSocket sessions by connection id with user and agent indexes.
+
+    Several tabs per user are allowed up to ``max_connections_per_user``.
+    A background heartbeat sends ``{"type": "ping"}`` frames and evicts
+    sockets that have not sent anything (including ``pong``) for
+    ``idle_timeout`` seconds.
+    """
+
+    def __init__(
+        self,
+        max_connections_per_user: int = 5,
+        heartbeat_interval: float = 30.0,
+        idle_timeout: float = 300.0,
+    ):
+        self.max_connections_per_user = max_connections_per_user
+        self.heartbeat_interval = heartbeat_interval
+        self.idle_timeout = idle_timeout
+        self.connections: Dict[str, Connection] = {}
+        self.by_user: Dict[str, Set[str]] = {}
+        self.by_agent: Dict[str, Set[str]] = {}
+        self.evicted_total = 0
+        self.rejected_total = 0
+        self._heartbeat_task: Optional[asyncio.Task] = None
+
+    def register(self, websocket, user_id: str, agent_id: str) -> Connection:
+        user_connections = self.by_user.get(user_id, set())
+        if self.max_connections_per_user and len(user_connections) >= self.max_connections_per_user:
+            self.rejected_total += 1
+            raise ConnectionLimitExceeded(
+                f"User already has {len(user_connections)} open connections"
+            )
+
+        connection = Connection(websocket, user_id, agent_id)
+        self.connections[connection.id] = connection
+        self.by_user.setdefault(user_id, set()).add(connection.id)
+        self.by_agent.setdefault(agent_id, set()).add(connection.id)
+        return connection
+
+    def unregister(self, connection_id: str):
+        connection = self.connections.pop(connection_id, None)
+        if connection is None:
+            return
+        self._discard_index(self.by_user, connection.user_id, connection_id)
+        self._discard_index(self.by_agent, connection.agent_id, connection_id)
+
+    @staticmethod
+    def _discard_index(index: Dict[str, Set[str]], key: str, connection_id: str):
+        ids = index.get(key)
+        if ids is None:
+            return
+        ids.discard(connection_id)
+        if not ids:
+            del index[key]
+
+    def touch(self, connection_id: str):
+        connection = self.connections.get(connection_id)
+        if connection is not None:
+            connection.last_seen = time.monotonic()
+
+    def for_user(self, user_id: str) -> List[Connection]:
+        return [self.connections[cid] for cid in self.by_user.get(user_id, ())]
+
+    def for_agent(self, agent_id: str) -> List[Connection]:
+        return [self.connections[cid] for cid in self.by_agent.get(agent_id, ())]
+
+    async def send_to_user(self, user_id: str, message: str):
+        """Send a text frame to every open session of a user"""
+        for connection in self.for_user(user_id):
+            try:
+                await connection.websocket.send_text(message)
+            except Exception as e:
+                logger.warning(f"Failed to send to connection {connection.id}: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "active_connections": len(self.connections),
+            "connected_users": len(self.by_user),
+            "connected_agents": len(self.by_agent),
+            "evicted_total": self.evicted_total,
+            "rejected_total": self.rejected_total,
+        }
+
+    # Heartbeats and idle eviction
+    def start(self):
+        if self._heartbeat_task is None and self.heartbeat_interval > 0:
+            self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+
+    async def stop(self):
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            await asyncio.gather(self._heartbeat_task, return_exceptions=True)
+            self._heartbeat_task = None
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"Connection heartbeat sweep failed: {e}")
+
+    async def sweep(self):
+        """Evict idle connections and ping the rest"""
+        now = time.monotonic()
+        idle, live = [], []
+        for connection in list(self.connections.values()):
+            if self.idle_timeout and now - connection.last_seen > self.idle_timeout:
+                idle.append(connection)
+            else:
+                live.append(connection)
+
+        for connection in idle:
+            self.unregister(connection.id)
+            self.evicted_total += 1
+        if idle:
+            logger.info(f"Evicting {len(idle)} idle WebSocket connections")
+            await asyncio.gather(
+                *(self._close_idle(connection) for connection in idle),
+                return_exceptions=True
+            )
+
+        results = await asyncio.gather(
+            *(self._ping(connection) for connection in live),
+            return_exceptions=True
+        )
+        # A failed ping means the socket is gone even if the handler never noticed
+        for connection, result in zip(live, results):
+            if isinstance(result, Exception):
+                self.unregister(connection.id)
+                self.evicted_total += 1
+
+    async def _ping(self, connection: Connection):
+        if connection.sender is not None:
+            await connection.sender.send({"type": "ping"})
+        else:
+            await connection.websocket.send_text(json.dumps({"type": "ping"}))
+
+    async def _close_idle(self, connection: Connection):
+        await connection.websocket.close(code=IDLE_CLOSE_CODE, reason="Idle timeout")
@@ -1,63 +1,119 @@
-from supabase import create_client, Client
 from typing import List, Dict, Any, Optional
-import os
+import asyncio
 import logging
-from datetime import datetime
-import numpy as np
+import time
+from datetime import datetime, timezone
+
+from .metrics import GET_AGENT_SECONDS, KB_SEARCH_SECONDS
+from .pagination import DEFAULT_PAGE_SIZE, Page, decode_cursor, make_page
+from .prompt_generation import PROMPT_STATUS_FALLBACK
+from .storage import LEGACY_EMBEDDING_MODEL, StorageBackend, create_storage
+from .tracing import span
+from .vector_index import parse_embedding, vector_index
 
 logger = logging.getLogger(__name__)
 
 class DatabaseManager:
-    def __init__(self):
-        self.supabase_url = os.getenv("SUPABASE_URL")
-        self.supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")  # Use service role for backend
-        
+    """Data access for the routes, backed by a pluggable ``StorageBackend``.
+
+    The backend (Supabase or embedded SQLite, see ``STORAGE_BACKEND``) only
+    stores rows; sanitization, the local vector index and the search
+    fallbacks live here so every backend behaves the same.
+
+    ``embedding_model`` is the configured model: new agents search with it
+    and chunks are tagged with it unless the caller names another.
+    """
+
+    def __init__(self, storage: Optional[StorageBackend] = None, embedding_model: Optional[str] = None):
         # Initialize immediately to avoid async issues in routes
-        if not self.supabase_url or not self.supabase_key:
-            raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set")
-        
-        self.client = create_client(self.supabase_url, self.supabase_key)
-        logger.info("Database manager initialized")
+        self.storage = storage or create_storage()
+        self.embedding_model = embedding_model or LEGACY_EMBEDDING_MODEL
+        logger.info(f"Database manager initialized ({self.storage.name} storage)")
         
     async def initialize(self):
-        """Initialize Supabase client - keeping for backward compatibility"""
-        # Already initialized in __init__
-        pass
+        """Initialize the storage backend"""
+        await self.storage.initialize()
     
     async def close(self):
         """Close database connections"""
-        # Supabase client doesn't need explicit closing
-        pass
+        await self.storage.close()
     
     # Agent operations
-    async def create_agent(self, user_id: str, name: str, system_prompt: str) -> Dict[str, Any]:
+    async def create_agent(
+        self,
+        user_id: str,
+        name: str,
+        system_prompt: str,
+        prompt_status: str = "ready"
+    ) -> Dict[str, Any]:
         """Create a new agent"""
         try:
-            result = self.client.table("agents").insert({
+            return await self.storage.create_agent({
                 "user_id": user_id,
                 "name": name,
-                "system_prompt": system_prompt
-            }).execute()
-            
-            return result.data[0] if result.data else None
+                "system_prompt": system_prompt,
+                "prompt_status": prompt_status,
+                "embedding_model": self.embedding_model
+            })
         except Exception as e:
             logger.error(f"Error creating agent: {e}")
             raise
     
+    async def update_agent_system_prompt(
+        self,
+        agent_id: str,
+        system_prompt: Optional[str],
+        prompt_status: str
+    ) -> Optional[Dict[str, Any]]:
+        """Store a generated system prompt; only the status changes when the prompt is None"""
+        try:
+            update = {"prompt_status": prompt_status}
+            if system_prompt is not None:
+                update["system_prompt"] = system_prompt
+            
+            return await self.storage.update_agent(agent_id, update)
+        except Exception as e:
+            logger.error(f"Error updating agent system prompt: {e}")
+            raise
+    
+    async def release_pending_prompts(self, started_at: datetime) -> List[str]:
+        """Mark agents whose prompt generation died with an earlier process as ``fallback``.
+        
+        Generation runs in the process that created the agent, so an agent
+        created before ``started_at`` and still pending is never picked up
+        again; it keeps the fallback prompt it was created with.
+        """
+        try:
+            created_before = started_at.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f+00:00")
+            return await self.storage.update_pending_prompts(PROMPT_STATUS_FALLBACK, created_before)
+        except Exception as e:
+            logger.error(f"Error releasing pending system prompts: {e}")
+            raise
+    
     async def get_user_agents(self, user_id: str) -> List[Dict[str, Any]]:
         """Get all agents for a user"""
         try:
-            result = self.client.table("agents").select("*").eq("user_id", user_id).execute()
-            return result.data
+            return await self.storage.list_agents(user_id)
         except Exception as e:
             logger.error(f"Error getting user agents: {e}")
             raise
     
+    async def delete_agent(self, agent_id: str, user_id: str) -> bool:
+        """Delete an agent with everything that belongs to it (with ownership check)"""
+        try:
+            deleted = await self.storage.delete_agent(agent_id, user_id)
+            if deleted:
+                vector_index.drop_agent(agent_id)
+            return deleted
+        except Exception as e:
+            logger.error(f"Error deleting agent: {e}")
+            raise
+    
     async def get_agent(self, agent_id: str, user_id: str) -> Optional[Dict[str, Any]]:
         """Get a specific agent (with ownership check)"""
         try:
-            result = self.client.table("agents").select("*").eq("id", agent_id).eq("user_id", user_id).execute()
-            return result.data[0] if result.data else None
+            with GET_AGENT_SECONDS.time(), span("get_agent"):
+                return await self.storage.get_agent(agent_id, user_id)
         except Exception as e:
             logger.error(f"Error getting agent: {e}")
             raise
@@ -66,22 +122,53 @@ class DatabaseManager:
     async def create_kb_file(self, agent_id: str, file_name: str, file_url: str) -> Dict[str, Any]:
         """Create a KB file record"""
         try:
-            result = self.client.table("kb_files").insert({
+            return await self.storage.create_kb_file({
                 "agent_id": agent_id,
                 "file_name": file_name,
                 "file_url": file_url
-            }).execute()
-            
-            return result.data[0] if result.data else None
+            })
         except Exception as e:
             logger.error(f"Error creating KB file: {e}")
             raise
     
-    async def create_kb_chunks(self, agent_id: str, contents: List[str], embeddings: List[List[float]]) -> List[Dict[str, Any]]:
-        """Create KB chunks with embeddings"""
+    async def create_kb_files(self, agent_id: str, file_names: List[str]) -> List[Dict[str, Any]]:
+        """Create KB file records for several uploads in one insert"""
         try:
+            return await self.storage.create_kb_files([
+                {"agent_id": agent_id, "file_name": file_name, "file_url": ""}
+                for file_name in file_names
+            ])
+        except Exception as e:
+            logger.error(f"Error creating KB files: {e}")
+            raise
+    
+    async def delete_kb_file(self, agent_id: str, file_id: str) -> Optional[int]:
+        """Delete a KB file and its chunks; the number of chunks removed, or None if not found"""
+        try:
+            chunk_ids = await self.storage.delete_kb_file(agent_id, file_id)
+            if chunk_ids and await self._kb_changed(agent_id):
+                vector_index.remove_chunks(agent_id, chunk_ids)
+            return None if chunk_ids is None else len(chunk_ids)
+        except Exception as e:
+            logger.error(f"Error deleting KB file: {e}")
+            raise
+    
+    async def create_kb_chunks(
+        self,
+        agent_id: str,
+        contents: List[str],
+        embeddings: List[List[float]],
+        file_ids: Optional[List[Optional[str]]] = None,
+        embedding_model: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Create KB chunks with embeddings from ``embedding_model`` (the configured
+        model by default); ``file_ids`` gives each chunk's source file"""
+        try:
+            embedding_model = embedding_model or self.embedding_model
+            if file_ids is None:
+                file_ids = [None] * len(contents)
             chunks_data = []
-            for content, embedding in zip(contents, embeddings):
+            for content, embedding, file_id in zip(contents, embeddings, file_ids):
                 # Validate content before insertion
                 if not content or not content.strip():
                     continue  # Skip empty content
@@ -94,8 +181,11 @@ class DatabaseManager:
                 # Try to detect if we're using vector or JSONB column
                 chunk_data = {
                     "agent_id": agent_id,
-                    "content": clean_content
+                    "content": clean_content,
+                    "embedding_model": embedding_model
                 }
+                if file_id is not None:
+                    chunk_data["file_id"] = file_id
                 
                 # Try vector column first, fallback to JSONB
                 try:
@@ -109,12 +199,38 @@ class DatabaseManager:
             if not chunks_data:
                 raise ValueError("No valid chunks to insert after sanitization")
             
-            result = self.client.table("kb_chunks").insert(chunks_data).execute()
-            return result.data
+            created = await self.storage.create_kb_chunks(chunks_data)
+            
+            # Keep the in-process vector index in step with the database
+            if created and await self._kb_changed(agent_id) and vector_index.has_agent(agent_id, embedding_model):
+                vector_index.add_chunks(
+                    agent_id,
+                    [row["id"] for row in created],
+                    [chunk["content"] for chunk in chunks_data],
+                    [chunk["embedding"] for chunk in chunks_data]
+                )
+            return created
         except Exception as e:
             logger.error(f"Error creating KB chunks: {e}")
             raise
     
+    async def delete_kb_chunks(self, agent_id: str, chunk_ids: List[str]) -> int:
+        """Delete an agent's chunks by id in one set-based delete; the number removed"""
+        try:
+            deleted = await self.storage.delete_kb_chunks(agent_id, chunk_ids)
+            if deleted and await self._kb_changed(agent_id):
+                vector_index.remove_chunks(agent_id, deleted)
+            return len(deleted)
+        except Exception as e:
+            logger.error(f"Error deleting KB chunks: {e}")
+            raise
+    
+    async def _kb_changed(self, agent_id: str) -> bool:
+        """Bump the agent's kb_version after a change to its chunks; whether
+        the local vector index should apply the change (see ``VectorIndex.advance``)"""
+        version = await self.storage.bump_kb_version(agent_id)
+        return vector_index.advance(agent_id, version)
+    
     def _sanitize_chunk_content(self, content: str) -> str:
         """Sanitize content for database storage"""
         if not content:
@@ -138,103 +254,171 @@ class DatabaseManager:
         
         return content
     
-    async def get_kb_chunks(self, agent_id: str) -> List[Dict[str, Any]]:
-        """Get all KB chunks for an agent"""
+    async def get_kb_chunks(
+        self,
+        agent_id: str,
+        limit: int = DEFAULT_PAGE_SIZE,
+        cursor: Optional[str] = None
+    ) -> Page:
+        """Get one page of KB chunks for an agent, oldest first (raises InvalidCursor for a bad cursor)"""
+        after = decode_cursor(cursor)
         try:
-            result = self.client.table("kb_chunks").select("*").eq("agent_id", agent_id).execute()
-            return result.data
+            # One extra row tells whether there is a next page
+            return make_page(await self.storage.list_kb_chunks(agent_id, limit + 1, after), limit)
         except Exception as e:
             logger.error(f"Error getting KB chunks: {e}")
             raise
     
-    async def search_kb_chunks(self, agent_id: str, query: str, limit: int = 5) -> List[Dict[str, Any]]:
-        """Search KB chunks using vector similarity or fallback to text search"""
+    async def search_kb_chunks(
+        self,
+        agent_id: str,
+        query: str,
+        limit: int = 5,
+        query_embedding: Optional[List[float]] = None,
+        embedding_model: Optional[str] = None,
+        kb_version: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Search KB chunks using vector similarity or fallback to text search.
+
+        ``embedding_model`` is the agent's model; the query must be embedded
+        with it to be comparable with the stored vectors. ``kb_version`` is
+        the agent row's; a local index at another version is not used.
+        """
         try:
-            # Generate embedding for query
-            from .embedding_service import EmbeddingService
-            embedding_service = EmbeddingService()
-            query_embedding = await embedding_service.generate_embedding(query)
+            # Generate embedding for query unless the caller already has one
+            if query_embedding is None:
+                from .services import services
+                query_embedding = await services.embedding_service_for(embedding_model).generate_embedding(query)
+            
+            # Serve from the local vector index when this agent is loaded
+            if vector_index.has_agent(agent_id, embedding_model, kb_version):
+                with KB_SEARCH_SECONDS.time(source="local_index"), span("kb.search.local_index"):
+                    return vector_index.search(agent_id, query_embedding, limit, threshold=0.7)
             
             # Try vector similarity search first
             try:
-                result = self.client.rpc(
-                    "match_kb_chunks",
-                    {
-                        "query_embedding": query_embedding,
-                        "agent_id": agent_id,
-                        "match_threshold": 0.7,
-                        "match_count": limit
-                    }
-                ).execute()
+                search_started = time.perf_counter()
+                matches = await self.storage.match_kb_chunks(agent_id, query_embedding, 0.7, limit)
                 
-                if result.data:
-                    return result.data
+                KB_SEARCH_SECONDS.observe(time.perf_counter() - search_started, source="rpc")
+                if matches:
+                    return matches
             except Exception as e:
                 logger.warning(f"Vector search failed, falling back to text search: {e}")
             
             # Fallback to text-based search if vector search fails
-            result = self.client.table("kb_chunks").select("*").eq("agent_id", agent_id).ilike("content", f"%{query}%").limit(limit).execute()
-            return result.data
+            with KB_SEARCH_SECONDS.time(source="text"):
+                return await self.storage.search_kb_chunks_text(agent_id, query, limit)
             
         except Exception as e:
             logger.error(f"Error searching KB chunks: {e}")
             raise
     
+    async def iter_kb_chunk_embeddings(self, page_size: int = 1000, agent_id: Optional[str] = None):
+        """Yield every KB chunk (or one agent's) with its embedding, page by page"""
+        start = 0
+        while True:
+            rows = await self.storage.page_kb_chunk_embeddings(start, page_size, agent_id)
+            for row in rows:
+                yield row
+            if len(rows) < page_size:
+                break
+            start += page_size
+    
+    # Re-embedding (see reindex.py)
+    async def start_agent_reindex(self, agent: Dict[str, Any], embedding_model: str):
+        """Mark an agent as migrating to ``embedding_model``.
+
+        Staged vectors from an interrupted migration to the same model are
+        kept, so the job resumes; ones for another model are dropped.
+        """
+        if agent.get("reindex_model") not in (None, embedding_model):
+            await self.storage.clear_staged_embeddings(agent["id"])
+        await self.storage.update_agent(agent["id"], {"reindex_model": embedding_model})
+    
+    async def switch_agent_embeddings(self, agent_id: str, embedding_model: str) -> int:
+        """Swap an agent's staged vectors in and reload its local index; the chunks switched"""
+        switched = await self.storage.switch_kb_chunk_embeddings(agent_id, embedding_model)
+        # Bumped before reloading, so changes made meanwhile leave the reload out of date
+        version = await self.storage.bump_kb_version(agent_id)
+        if vector_index.has_agent(agent_id):
+            ids, contents, embeddings = [], [], []
+            async for row in self.iter_kb_chunk_embeddings(agent_id=agent_id):
+                if row.get("embedding_model") == embedding_model:
+                    ids.append(row["id"])
+                    contents.append(row["content"])
+                    embeddings.append(parse_embedding(row["embedding"]))
+            if ids:
+                vector_index.set_agent(agent_id, ids, contents, embeddings, model=embedding_model, version=version)
+            else:
+                vector_index.drop_agent(agent_id)
+        return switched
+    
     # Conversation operations
     async def create_conversation(self, agent_id: str) -> Dict[str, Any]:
         """Create a new conversation"""
         try:
-            result = self.client.table("conversations").insert({
-                "agent_id": agent_id
-            }).execute()
-            
-            return result.data[0] if result.data else None
+            return await self.storage.create_conversation(agent_id)
         except Exception as e:
             logger.error(f"Error creating conversation: {e}")
             raise
     
-    async def get_conversations(self, agent_id: str) -> List[Dict[str, Any]]:
-        """Get all conversations for an agent"""
+    async def get_conversations(
+        self,
+        agent_id: str,
+        limit: int = DEFAULT_PAGE_SIZE,
+        cursor: Optional[str] = None
+    ) -> Page:
+        """Get one page of conversations for an agent, newest first"""
+        after = decode_cursor(cursor)
         try:
-            result = self.client.table("conversations").select("*").eq("agent_id", agent_id).order("created_at", desc=True).execute()
-            return result.data
+            return make_page(await self.storage.list_conversations(agent_id, limit + 1, after), limit)
         except Exception as e:
             logger.error(f"Error getting conversations: {e}")
             raise
     
+    async def get_conversation_memory(self, conversation_id: str, max_messages: int) -> Dict[str, Any]:
+        """What a chat prompt needs of the conversation so far: the rolling
+        ``summary`` and the messages it does not cover yet, at most the
+        newest ``max_messages`` of them, oldest first"""
+        if max_messages <= 0:
+            return {"summary": "", "messages": []}
+        conversation, messages = await asyncio.gather(
+            self.storage.get_conversation(conversation_id),
+            self.storage.list_recent_messages(conversation_id, max_messages)
+        )
+        conversation = conversation or {}
+        if conversation.get("summary_until_id"):
+            until = (conversation["summary_until_at"], conversation["summary_until_id"])
+            messages = [m for m in messages if (m["created_at"], m["id"]) > until]
+        return {"summary": conversation.get("summary") or "", "messages": messages}
+    
     # Message operations
     async def create_message(self, conversation_id: str, role: str, content: str) -> Dict[str, Any]:
         """Create a new message"""
         try:
-            result = self.client.table("messages").insert({
+            return await self.storage.create_message({
                 "conversation_id": conversation_id,
                 "role": role,
                 "content": content
-            }).execute()
-            
-            return result.data[0] if result.data else None
+            })
         except Exception as e:
             logger.error(f"Error creating message: {e}")
             raise
     
-    async def get_conversation_messages(self, conversation_id: str, user_id: str) -> List[Dict[str, Any]]:
-        """Get all messages for a conversation (with ownership check)"""
+    async def get_conversation_messages(
+        self,
+        conversation_id: str,
+        user_id: str,
+        limit: int = DEFAULT_PAGE_SIZE,
+        cursor: Optional[str] = None
+    ) -> Page:
+        """Get one page of messages for a conversation, oldest first (with ownership check)"""
+        after = decode_cursor(cursor)
         try:
-            # First verify the conversation belongs to the user
-            conv_result = self.client.table("conversations").select("agent_id").eq("id", conversation_id).execute()
-            if not conv_result.data:
-                return []
-            
-            agent_id = conv_result.data[0]["agent_id"]
-            
-            # Check if user owns the agent
-            agent_result = self.client.table("agents").select("id").eq("id", agent_id).eq("user_id", user_id).execute()
-            if not agent_result.data:
-                return []
-            
-            # Get messages
-            result = self.client.table("messages").select("*").eq("conversation_id", conversation_id).order("created_at").execute()
-            return result.data
+            # Ownership is enforced by the same query that fetches the messages
+            rows = await self.storage.list_conversation_messages(conversation_id, user_id, limit + 1, after)
+            return make_page(rows, limit)
         except Exception as e:
             logger.error(f"Error getting conversation messages: {e}")
-            raise 
\ No newline at end of file
+            raise
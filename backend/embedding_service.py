@@ -1,20 +1,95 @@
-from sentence_transformers import SentenceTransformer
-import numpy as np
+import asyncio
 import logging
-from typing import List
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from .metrics import EMBEDDING_SECONDS
+from .tracing import span
 
 logger = logging.getLogger(__name__)
 
+EMBEDDING_BACKENDS = ("torch", "onnx")
+
+# Rough WordPiece rate for English text, used to bucket texts by length
+# without tokenizing them twice
+CHARS_PER_TOKEN = 4
+
+def plan_batches(lengths: List[int], batch_tokens: int, max_batch_size: int) -> List[List[int]]:
+    """Group text indices into batches of similar length under a token budget.
+
+    Texts are taken longest first, and each batch holds as many as fit in
+    ``batch_tokens`` padded tokens (batch size x its longest text), so short
+    texts run in large batches and long ones in small batches. Activation
+    memory grows with padded tokens, which keeps every batch within the same
+    memory budget.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+    batches = []
+    start = 0
+    while start < len(order):
+        padded_length = max(1, lengths[order[start]])
+        size = max(1, min(max_batch_size, batch_tokens // padded_length))
+        batches.append(order[start:start + size])
+        start += size
+    return batches
+
+# Loaded models shared by every EmbeddingService in the process, keyed by
+# (backend, model name). Loading them in the pre-fork master lets workers
+# share the weights copy-on-write.
+_shared_models: Dict[tuple, Any] = {}
+
+def _load_model(model_name: str, backend: str = "torch", onnx_dir: Optional[str] = None,
+                quantized: bool = True, threads: int = 0):
+    if backend == "onnx":
+        from .onnx_embedding import OnnxEmbeddingModel
+        return OnnxEmbeddingModel(onnx_dir or f"models/{model_name}-onnx", quantized=quantized, threads=threads)
+    if backend != "torch":
+        raise ValueError(f"Unknown embedding backend {backend!r}, expected one of {', '.join(EMBEDDING_BACKENDS)}")
+    # Imported lazily: sentence_transformers pulls in torch, the slowest import by far
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
+
 class EmbeddingService:
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
+    """Sentence embeddings from ``all-MiniLM-L6-v2`` (or another model).
+
+    ``backend="torch"`` runs sentence-transformers on PyTorch; ``"onnx"``
+    runs the model exported by ``run_backend.py --export-onnx`` on ONNX
+    Runtime, int8-quantized unless ``quantized`` is False.
+    """
+
+    def __init__(
+        self,
+        model_name: str = "all-MiniLM-L6-v2",
+        backend: str = "torch",
+        onnx_dir: Optional[str] = None,
+        quantized: bool = True,
+        threads: int = 0,
+        batch_tokens: int = 8192,
+        max_batch_size: int = 256
+    ):
         self.model_name = model_name
-        self.model = None
+        self.backend = backend
+        self.batch_tokens = batch_tokens
+        self.max_batch_size = max_batch_size
+        self._key = (backend, model_name)
+        self._load_args = (model_name, backend, onnx_dir, quantized, threads)
+        self.model = _shared_models.get(self._key)
+    
+    def preload(self):
+        """Load the model synchronously, e.g. before forking workers"""
+        if self._key not in _shared_models:
+            _shared_models[self._key] = _load_model(*self._load_args)
+            logger.info(f"Embedding model {self.model_name} ({self.backend}) preloaded")
+        self.model = _shared_models[self._key]
         
     async def initialize(self):
         """Initialize the embedding model"""
         try:
-            self.model = SentenceTransformer(self.model_name)
-            logger.info(f"Embedding model {self.model_name} loaded")
+            if self._key not in _shared_models:
+                _shared_models[self._key] = await asyncio.to_thread(_load_model, *self._load_args)
+                logger.info(f"Embedding model {self.model_name} ({self.backend}) loaded")
+            self.model = _shared_models[self._key]
         except Exception as e:
             logger.error(f"Error loading embedding model: {e}")
             raise
@@ -25,20 +100,50 @@ class EmbeddingService:
             await self.initialize()
         
         try:
-            embedding = self.model.encode(text, convert_to_tensor=False)
+            # Encoding is CPU bound, keep it off the event loop
+            with EMBEDDING_SECONDS.time(kind="query"), span("embedding.query"):
+                embedding = await asyncio.to_thread(self.model.encode, text, convert_to_tensor=False)
             return embedding.tolist()
         except Exception as e:
             logger.error(f"Error generating embedding: {e}")
             raise
     
-    async def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
-        """Generate embeddings for multiple texts"""
+    def _token_lengths(self, texts: List[str]) -> List[int]:
+        """Estimated tokens per text (with [CLS]/[SEP]), capped at the model's sequence limit"""
+        max_length = getattr(self.model, "max_seq_length", None) or 512
+        return [min(max_length, len(text) // CHARS_PER_TOKEN + 2) for text in texts]
+    
+    async def generate_embeddings(
+        self,
+        texts: List[str],
+        progress: Optional[Callable[[int, int], None]] = None
+    ) -> List[List[float]]:
+        """Generate embeddings for multiple texts, returned in input order.
+
+        Texts are bucketed by length into batches sized for the
+        ``batch_tokens`` budget (see ``plan_batches``), so little compute goes
+        to padding. ``progress(done, total)`` is called after every batch.
+        """
         if not self.model:
             await self.initialize()
         
         try:
-            embeddings = self.model.encode(texts, convert_to_tensor=False)
-            return embeddings.tolist()
+            with EMBEDDING_SECONDS.time(kind="batch"), span("embedding.batch"):
+                embeddings = None
+                done = 0
+                for batch in plan_batches(self._token_lengths(texts), self.batch_tokens, self.max_batch_size):
+                    # One thread hop per batch keeps the event loop responsive on large uploads
+                    vectors = await asyncio.to_thread(
+                        self.model.encode, [texts[i] for i in batch],
+                        batch_size=len(batch), convert_to_tensor=False
+                    )
+                    if embeddings is None:
+                        embeddings = np.empty((len(texts), vectors.shape[1]), dtype=vectors.dtype)
+                    embeddings[batch] = vectors
+                    done += len(batch)
+                    if progress is not None:
+                        progress(done, len(texts))
+            return embeddings.tolist() if embeddings is not None else []
         except Exception as e:
             logger.error(f"Error generating embeddings: {e}")
             raise
@@ -1,19 +1,41 @@
-from fastapi import FastAPI, Depends
+from fastapi import FastAPI, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
+import asyncio
 import logging
+import time
+from datetime import datetime, timezone
+from typing import Set
 
-from .routes import agents, knowledge_base, chat
+from .routes import agents, knowledge_base, chat, admin
 from .auth import get_current_user, User
-from .database import DatabaseManager
-from .embedding_service import EmbeddingService
+from .body_limit import BodySizeLimitMiddleware
+from .compression import CompressionMiddleware
+from .metrics import registry, HTTP_REQUEST_SECONDS
+from .serialization import FastJSONResponse
+from .services import services
+from .tracing import install_log_filter, start_trace
+from .vector_index import vector_index
+from .config import settings
 from dotenv import load_dotenv
 load_dotenv()
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(levelname)s:%(name)s:[%(trace_id)s] %(message)s"
+)
+install_log_filter()
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="AI Chat Platform API", version="1.0.0")
+# orjson-backed JSON responses everywhere (stdlib json if orjson is missing)
+app = FastAPI(title="AI Chat Platform API", version="1.0.0", default_response_class=FastJSONResponse)
+
+if settings.response_compression_min_bytes > 0:
+    app.add_middleware(CompressionMiddleware, minimum_size=settings.response_compression_min_bytes)
+
+# Oversized uploads are refused before (or while) their body is received
+app.add_middleware(BodySizeLimitMiddleware, limits=knowledge_base.UPLOAD_BODY_LIMITS)
 
 # CORS middleware
 app.add_middleware(
@@ -22,41 +44,138 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Let browser clients read pagination cursors and trace ids
+    expose_headers=["X-Next-Cursor", "X-Trace-Id"],
 )
 
-# Initialize services
-from .database import DatabaseManager
-from .embedding_service import EmbeddingService
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        # Clients may pass X-Trace-Id to correlate their logs with ours
+        with start_trace("http " + request.url.path, trace_id=request.headers.get("x-trace-id"),
+                         slow_threshold_ms=settings.trace_slow_threshold_ms) as trace:
+            response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Trace-Id"] = trace.trace_id
+        return response
+    finally:
+        # Label by route template, not the raw path, to keep cardinality low
+        route = request.scope.get("route")
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - start,
+            route=getattr(route, "path", "unmatched"),
+            method=request.method,
+            status=str(status)
+        )
+
+# Startup work running in the background; the event loop only keeps weak
+# references to tasks, so they are held here until they finish
+_background_tasks: Set[asyncio.Task] = set()
+
+def _background_task_done(task: asyncio.Task):
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Background task {task.get_name()} failed: {task.exception()}")
+
+def _start_background(coro, name: str) -> asyncio.Task:
+    task = asyncio.create_task(coro, name=name)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_task_done)
+    return task
+
+async def _warmup_ollama():
+    """Load the chat models so the first chat after startup skips the model load"""
+    client = services.ollama_client
+    models = [settings.ollama_model] + [m for m in settings.ollama_warmup_models if m != settings.ollama_model]
+    for model in models:
+        await client.load_model(model)
+
+async def _warmup_services():
+    """Load the slow services in the background so the first request is fast"""
+    try:
+        await asyncio.to_thread(services.warmup, settings.warmup_services)
+        logger.info("Service warmup finished")
+    except Exception as e:
+        logger.error(f"Service warmup failed, services will load on first use: {e}")
 
 @app.on_event("startup")
 async def startup_event():
     logger.info("Initializing backend services...")
+    started_at = datetime.now(timezone.utc)
     
     # Test database connection
     try:
-        db = DatabaseManager()
+        services.get("db")
         logger.info("Database connection established")
     except Exception as e:
         logger.error(f"Database initialization failed: {e}")
         raise
     
-    # Test embedding service
+    # System prompts still generating in a previous process are not coming
     try:
-        embedding_service = EmbeddingService()
-        logger.info("Embedding service ready")
+        released = await services.db.release_pending_prompts(started_at)
+        if released:
+            logger.warning(f"Kept the fallback system prompt for {len(released)} agents left pending")
     except Exception as e:
-        logger.error(f"Embedding service initialization failed: {e}")
-        # This is not critical, continue
+        logger.error(f"Pending system prompt check failed: {e}")
+    
+    # Services are created lazily; optionally warm the heavy ones up now
+    if settings.warmup_services:
+        _start_background(_warmup_services(), "warmup_services")
+    if settings.ollama_warmup:
+        _start_background(_warmup_ollama(), "warmup_ollama")
+    
+    # Load the local vector index unless the pre-fork master already did
+    vector_index.configure(
+        settings.retrieval_prefilter_dims,
+        settings.retrieval_candidates,
+        settings.retrieval_two_stage_min_chunks
+    )
+    if settings.vector_index_dir and not vector_index.agents:
+        try:
+            vector_index.load(settings.vector_index_dir)
+        except Exception as e:
+            logger.error(f"Vector index load failed, using database search: {e}")
+    
+    # Start WebSocket heartbeats and idle eviction, and keep the chat model
+    # loaded while sockets are open
+    chat.manager.start()
+    chat.model_keepalive.start(services.ollama_client)
     
     logger.info("Backend services initialized")
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    for task in list(_background_tasks):
+        task.cancel()
+    await asyncio.gather(*_background_tasks, return_exceptions=True)
+    await chat.manager.stop()
+    await chat.model_keepalive.stop()
+    await chat.summarizer.stop()
+    # Let queued system prompt generations finish writing back
+    prompt_generator = services.peek("prompt_generator")
+    if prompt_generator is not None:
+        await prompt_generator.wait_idle()
     logger.info("Backend services shutdown")
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "service": "AI Chat Platform API"}
+    return {
+        "status": "healthy",
+        "service": "AI Chat Platform API",
+        "websockets": chat.manager.stats(),
+        # Whether the chat model is loaded; a cold model adds seconds to the next chat
+        "ollama": await services.ollama_client.model_status()
+    }
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus text exposition of the backend metrics"""
+    if not settings.metrics_enabled:
+        return PlainTextResponse("metrics disabled\n", status_code=404)
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/auth/test")
 async def test_auth_get(current_user: User = Depends(get_current_user)):
@@ -80,6 +199,7 @@ async def test_auth_post(current_user: User = Depends(get_current_user)):
 app.include_router(agents.router)
 app.include_router(knowledge_base.router)
 app.include_router(chat.router)
+app.include_router(admin.router)
 
 if __name__ == "__main__":
     import uvicorn
@@ -13,6 +13,9 @@ class AgentResponse(BaseModel):
     user_id: str
     name: str
     system_prompt: str
+    # "pending" while the generated prompt is being produced, then "ready"
+    # or "fallback" if generation failed and the fallback prompt was kept
+    prompt_status: Optional[str] = "ready"
     created_at: datetime
 
 # Knowledge Base models
@@ -20,6 +23,10 @@ class KBFileUpload(BaseModel):
     file_name: str
     file_url: str
 
+class KBChunkDeleteRequest(BaseModel):
+    # Validated here, so a malformed id is a 422 rather than a failed uuid filter
+    chunk_ids: List[UUID] = Field(..., min_length=1, max_length=1000)
+
 class KBChunkResponse(BaseModel):
     id: str
     agent_id: str
@@ -39,6 +46,7 @@ class ConversationResponse(BaseModel):
     agent_id: str
     created_at: datetime
     message_count: Optional[int] = 0
+    last_message_at: Optional[datetime] = None
 
 # WebSocket message models
 class WSMessage(BaseModel):
@@ -1,20 +1,48 @@
 import httpx
 import json
 import logging
-from typing import AsyncGenerator, Dict, Any
+import time
+from typing import AsyncGenerator, Callable, Dict, Any, List, Optional, Union
 import asyncio
 
+from .serialization import loads
+
 logger = logging.getLogger(__name__)
 
+# Loading a large model from disk can take minutes on a cold host
+LOAD_TIMEOUT_S = 300.0
+
+def _keep_alive_value(keep_alive: str) -> Union[int, str]:
+    """Ollama takes durations as strings ("30m") but bare numbers as seconds"""
+    return int(keep_alive) if keep_alive.lstrip("-").isdigit() else keep_alive
+
+def _model_key(name: str) -> str:
+    """Model names without a tag refer to their ":latest" tag"""
+    return name if ":" in name else f"{name}:latest"
+
 class OllamaClient:
-    def __init__(self, base_url: str = "http://localhost:11434"):
+    def __init__(self, base_url: str = "http://localhost:11434", model: str = "llama2", keep_alive: str = ""):
         self.base_url = base_url
-        self.model = "llama2"  # Default model, can be configured
+        self.model = model
+        # Sent with every request; empty leaves Ollama's default (5 minutes)
+        self.keep_alive = keep_alive
+    
+    def _with_keep_alive(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        if self.keep_alive:
+            payload["keep_alive"] = _keep_alive_value(self.keep_alive)
+        return payload
         
     async def generate_system_prompt(self, agent_name: str, description: str) -> str:
         """Generate a system prompt for an agent using Ollama"""
         try:
-            prompt = f"""
+            return await self.request_system_prompt(agent_name, description)
+        except Exception as e:
+            logger.error(f"Error generating system prompt: {e}")
+            return self.get_fallback_system_prompt(agent_name, description)
+    
+    async def request_system_prompt(self, agent_name: str, description: str) -> str:
+        """Generate a system prompt, raising instead of falling back on errors"""
+        prompt = f"""
             Create a system prompt for an AI agent with the following details:
             - Name: {agent_name}
             - Description: {description}
@@ -27,35 +55,31 @@ class OllamaClient:
             
             Generate a clear, professional system prompt:
             """
-            
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.base_url}/api/generate",
-                    json={
-                        "model": self.model,
-                        "prompt": prompt,
-                        "stream": False,
-                        "options": {
-                            "temperature": 0.7,
-                            "top_p": 0.9
-                        }
-                    },
-                    timeout=30.0
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    return result.get("response", "").strip()
-                else:
-                    logger.error(f"Ollama API error: {response.status_code}")
-                    # Fallback system prompt
-                    return self._get_fallback_system_prompt(agent_name, description)
-                    
-        except Exception as e:
-            logger.error(f"Error generating system prompt: {e}")
-            return self._get_fallback_system_prompt(agent_name, description)
+        
+        async with httpx.AsyncClient() as client:
+            response = await client.post(
+                f"{self.base_url}/api/generate",
+                json=self._with_keep_alive({
+                    "model": self.model,
+                    "prompt": prompt,
+                    "stream": False,
+                    "options": {
+                        "temperature": 0.7,
+                        "top_p": 0.9
+                    }
+                }),
+                timeout=30.0
+            )
+        
+        if response.status_code != 200:
+            raise RuntimeError(f"Ollama API error: {response.status_code}")
+        
+        system_prompt = response.json().get("response", "").strip()
+        if not system_prompt:
+            raise RuntimeError("Ollama returned an empty system prompt")
+        return system_prompt
     
-    def _get_fallback_system_prompt(self, agent_name: str, description: str) -> str:
+    def get_fallback_system_prompt(self, agent_name: str, description: str) -> str:
         """Fallback system prompt if Ollama is unavailable"""
         return f"""You are {agent_name}, an AI assistant designed to help users with their queries.
 
@@ -70,36 +94,50 @@ Guidelines:
 
 When knowledge base context is provided, use it to enhance your responses while staying true to your core purpose."""
     
+    @staticmethod
+    def build_prompt(
+        message: str,
+        system_prompt: str,
+        context: str = "",
+        summary: str = "",
+        history: Optional[List[Dict[str, Any]]] = None
+    ) -> str:
+        """The chat prompt: KB context, system prompt, the conversation summary,
+        recent messages (``role``/``content`` rows) and the new message"""
+        parts = []
+        if context:
+            parts.append(f"Context information:\n{context}")
+        parts.append(f"System: {system_prompt}")
+        if summary:
+            parts.append(f"Summary of the earlier conversation:\n{summary}")
+        for turn in history or []:
+            speaker = "User" if turn["role"] == "user" else "Assistant"
+            parts.append(f"{speaker}: {turn['content']}")
+        parts.append(f"User: {message}")
+        parts.append("Assistant:")
+        return "\n\n".join(parts)
+    
     async def stream_chat(
         self, 
         message: str, 
         system_prompt: str, 
-        context: str = ""
+        context: str = "",
+        summary: str = "",
+        history: Optional[List[Dict[str, Any]]] = None
     ) -> AsyncGenerator[str, None]:
-        """Stream chat response from Ollama"""
-        try:
-            # Prepare the full prompt with context
-            if context:
-                full_prompt = f"""Context information:
-{context}
-
-System: {system_prompt}
-
-User: {message}
+        """Stream chat response from Ollama.
 
-Assistant:"""
-            else:
-                full_prompt = f"""System: {system_prompt}
-
-User: {message}
-
-Assistant:"""
+        ``summary`` and ``history`` carry the conversation so far: a rolling
+        summary of older messages and the most recent ones verbatim.
+        """
+        try:
+            full_prompt = self.build_prompt(message, system_prompt, context, summary, history)
             
             async with httpx.AsyncClient() as client:
                 async with client.stream(
                     "POST",
                     f"{self.base_url}/api/generate",
-                    json={
+                    json=self._with_keep_alive({
                         "model": self.model,
                         "prompt": full_prompt,
                         "stream": True,
@@ -108,14 +146,16 @@ Assistant:"""
                             "top_p": 0.9,
                             "max_tokens": 1000
                         }
-                    },
+                    }),
                     timeout=60.0
                 ) as response:
                     if response.status_code == 200:
+                        # Leaving this block (including on cancellation) closes
+                        # the HTTP stream, which makes Ollama stop generating
                         async for line in response.aiter_lines():
                             if line.strip():
                                 try:
-                                    data = json.loads(line)
+                                    data = loads(line)
                                     if "response" in data:
                                         yield data["response"]
                                     if data.get("done", False):
@@ -126,6 +166,9 @@ Assistant:"""
                         logger.error(f"Ollama streaming error: {response.status_code}")
                         yield "I apologize, but I'm having trouble generating a response right now."
                         
+        except asyncio.CancelledError:
+            logger.info("stream_chat cancelled, Ollama stream closed")
+            raise
         except Exception as e:
             logger.error(f"Error in stream_chat: {e}")
             yield "I apologize, but I encountered an error while processing your request."
@@ -140,6 +183,88 @@ Assistant:"""
             logger.error(f"Ollama health check failed: {e}")
             return False
     
+    async def summarize_conversation(self, summary: str, messages: List[Dict[str, Any]], max_tokens: int = 256) -> str:
+        """Fold ``messages`` into the rolling ``summary``, raising on errors"""
+        transcript = "\n".join(
+            f"{'User' if m['role'] == 'user' else 'Assistant'}: {m['content']}" for m in messages
+        )
+        prompt = f"""Update the summary of a conversation between a user and an assistant.
+Keep names, facts, decisions, open questions and anything the user asked to remember.
+Write at most one short paragraph, in the third person, without preamble.
+
+Current summary:
+{summary or "(none yet)"}
+
+New messages:
+{transcript}
+
+Updated summary:"""
+        async with httpx.AsyncClient() as client:
+            response = await client.post(
+                f"{self.base_url}/api/generate",
+                json=self._with_keep_alive({
+                    "model": self.model,
+                    "prompt": prompt,
+                    "stream": False,
+                    "options": {
+                        "temperature": 0.2,
+                        "num_predict": max_tokens
+                    }
+                }),
+                timeout=120.0
+            )
+        if response.status_code != 200:
+            raise RuntimeError(f"Ollama API error: {response.status_code}")
+        updated = response.json().get("response", "").strip()
+        if not updated:
+            raise RuntimeError("Ollama returned an empty summary")
+        return updated
+    
+    async def load_model(self, model: Optional[str] = None) -> bool:
+        """Load a model into memory (or refresh its keep-alive) without generating.
+
+        Ollama answers a generate request without a prompt by loading the
+        model and returning right away, so this is cheap once it is resident.
+        """
+        model = model or self.model
+        started = time.perf_counter()
+        try:
+            async with httpx.AsyncClient() as client:
+                response = await client.post(
+                    f"{self.base_url}/api/generate",
+                    json=self._with_keep_alive({"model": model, "stream": False}),
+                    timeout=LOAD_TIMEOUT_S
+                )
+            if response.status_code != 200:
+                logger.error(f"Ollama failed to load {model}: {response.status_code}")
+                return False
+            logger.info(f"Ollama model {model} loaded in {(time.perf_counter() - started) * 1000:.0f}ms")
+            return True
+        except Exception as e:
+            logger.error(f"Error loading Ollama model {model}: {e}")
+            return False
+    
+    async def running_models(self) -> List[Dict[str, Any]]:
+        """Models currently loaded in Ollama (``/api/ps``)"""
+        async with httpx.AsyncClient() as client:
+            response = await client.get(f"{self.base_url}/api/ps", timeout=2.0)
+            response.raise_for_status()
+            return response.json().get("models", [])
+    
+    async def model_status(self) -> Dict[str, Any]:
+        """Whether the chat model is loaded, for the health endpoint"""
+        try:
+            running = await self.running_models()
+        except Exception as e:
+            logger.warning(f"Ollama /api/ps failed: {e}")
+            return {"model": self.model, "reachable": False, "resident": False}
+        key = _model_key(self.model)
+        loaded = next((m for m in running if _model_key(m.get("name", "")) == key), None)
+        status = {"model": self.model, "reachable": True, "resident": loaded is not None}
+        if loaded and loaded.get("expires_at"):
+            status["expires_at"] = loaded["expires_at"]
+        return status
+    
     async def list_models(self) -> list:
         """List available Ollama models"""
         try:
@@ -151,4 +276,37 @@ Assistant:"""
                 return []
         except Exception as e:
             logger.error(f"Error listing models: {e}")
-            return [] 
\ No newline at end of file
+            return []
+
+
+class ModelKeepAlive:
+    """Keeps the chat model loaded while anyone is chatting.
+
+    Every ``interval_s`` seconds, when ``active()`` is true, it sends an
+    empty generate, which restarts the model's keep-alive timer in Ollama
+    (and reloads the model if it was evicted anyway). With nobody
+    connected it does nothing, so the model unloads after the keep-alive.
+    """
+
+    def __init__(self, interval_s: float, active: Callable[[], bool]):
+        self.interval_s = interval_s
+        self.active = active
+        self.pings = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, client: OllamaClient):
+        if self._task is None and self.interval_s > 0:
+            self._task = asyncio.create_task(self._loop(client))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self, client: OllamaClient):
+        while True:
+            await asyncio.sleep(self.interval_s)
+            if self.active():
+                await client.load_model()
+                self.pings += 1
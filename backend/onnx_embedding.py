@@ -0,0 +1,169 @@
+import json
+import logging
+import os
+import threading
+from typing import List, Optional, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CONFIG_FILE = "embedding_config.json"
+MODEL_FILE = "model.onnx"
+QUANTIZED_MODEL_FILE = "model_int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+
+# Intra-op threads for sessions created without an explicit count; the
+# pre-fork server sets this to its per-worker share of the cores
+default_threads: Optional[int] = None
+
+
+class OnnxEmbeddingModel:
+    """A sentence-transformers model exported to ONNX, run with ONNX Runtime.
+
+    Mirrors ``SentenceTransformer.encode`` for the mean-pooling models we use
+    (tokenize, run the transformer, mean-pool over the attention mask, then
+    L2-normalize when the original pipeline did), so ``EmbeddingService``
+    can switch backends without other changes. The int8 model comes from
+    dynamic quantization in ``export_onnx``.
+
+    The model file is read once; the inference session is created lazily
+    in each process, because ONNX Runtime's thread pools do not survive
+    ``fork()``. Pre-fork workers therefore share the model bytes but get
+    their own session and threads.
+    """
+
+    def __init__(self, directory: str, quantized: bool = True, threads: int = 0):
+        with open(os.path.join(directory, CONFIG_FILE), "r", encoding="utf-8") as f:
+            self.config = json.load(f)
+        model_file = QUANTIZED_MODEL_FILE if quantized else MODEL_FILE
+        with open(os.path.join(directory, model_file), "rb") as f:
+            self.model_bytes = f.read()
+        self.model_path = os.path.join(directory, model_file)
+        self.tokenizer_path = os.path.join(directory, TOKENIZER_FILE)
+        self.max_seq_length = self.config["max_seq_length"]
+        self.normalize = self.config.get("normalize", True)
+        self.threads = threads
+        self._session = None
+        self._tokenizer = None
+        self._input_names: List[str] = []
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_session(self):
+        if self._session is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._session is not None and self._pid == os.getpid():
+                return
+            import onnxruntime as ort
+            from tokenizers import Tokenizer
+
+            options = ort.SessionOptions()
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            options.intra_op_num_threads = self.threads or default_threads or 0  # 0: ORT picks
+            options.inter_op_num_threads = 1
+            options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+            session = ort.InferenceSession(self.model_bytes, options, providers=["CPUExecutionProvider"])
+
+            tokenizer = Tokenizer.from_file(self.tokenizer_path)
+            tokenizer.enable_truncation(max_length=self.max_seq_length)
+            tokenizer.enable_padding(pad_id=self.config.get("pad_id", 0), pad_token=self.config.get("pad_token", "[PAD]"))
+
+            self._input_names = [model_input.name for model_input in session.get_inputs()]
+            self._tokenizer = tokenizer
+            self._session = session
+            self._pid = os.getpid()
+            logger.info(
+                f"ONNX embedding session ready ({os.path.basename(self.model_path)}, "
+                f"{options.intra_op_num_threads or 'default'} threads)"
+            )
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self._tokenizer.encode_batch(texts)
+        input_ids = np.array([encoding.ids for encoding in encodings], dtype=np.int64)
+        attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+        feed = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            feed["token_type_ids"] = np.zeros_like(input_ids)
+
+        token_embeddings = self._session.run(None, feed)[0]
+        mask = attention_mask[:, :, None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.normalize:
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.astype(np.float32)
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32, convert_to_tensor: bool = False, **kwargs) -> np.ndarray:
+        """Embed one sentence (1-D result) or a list of them (2-D), like SentenceTransformer.encode"""
+        self._ensure_session()
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, self.config["dimensions"]), dtype=np.float32)
+
+        # Batch similar lengths together so little of each batch is padding
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        embeddings = np.empty((len(texts), self.config["dimensions"]), dtype=np.float32)
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            embeddings[batch] = self._encode_batch([texts[i] for i in batch])
+        return embeddings[0] if single else embeddings
+
+
+def export_onnx(model_name: str, directory: str, quantize: bool = True, opset: int = 14) -> str:
+    """Export a sentence-transformers model to ONNX (and int8) in ``directory``.
+
+    Needs torch, sentence-transformers and onnxruntime; only the export does,
+    serving with the ONNX backend needs onnxruntime and tokenizers only.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer = model[0].auto_model.eval()
+    tokenizer = model.tokenizer
+    pooling = [module for module in model if type(module).__name__ == "Pooling"]
+    if pooling and not pooling[0].pooling_mode_mean_tokens:
+        raise ValueError(f"{model_name} does not use mean pooling, which the ONNX backend implements")
+
+    class LastHiddenState(torch.nn.Module):
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.inner(
+                input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids
+            )[0]
+
+    os.makedirs(directory, exist_ok=True)
+    sample = tokenizer(["an example sentence to trace the graph"], return_tensors="pt")
+    input_names = ["input_ids", "attention_mask", "token_type_ids"]
+    model_path = os.path.join(directory, MODEL_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            LastHiddenState(transformer),
+            tuple(sample[name] for name in input_names),
+            model_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes={name: {0: "batch", 1: "sequence"} for name in input_names + ["last_hidden_state"]},
+            opset_version=opset,
+        )
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(model_path, os.path.join(directory, QUANTIZED_MODEL_FILE), weight_type=QuantType.QInt8)
+
+    tokenizer.save_pretrained(directory)  # writes tokenizer.json for fast tokenizers
+    with open(os.path.join(directory, CONFIG_FILE), "w", encoding="utf-8") as f:
+        json.dump({
+            "model_name": model_name,
+            "max_seq_length": model.max_seq_length,
+            "dimensions": model.get_sentence_embedding_dimension(),
+            "normalize": any(type(module).__name__ == "Normalize" for module in model),
+            "pad_id": tokenizer.pad_token_id,
+            "pad_token": tokenizer.pad_token,
+        }, f, indent=2)
+    logger.info(f"Exported {model_name} to {directory}{' with an int8 copy' if quantize else ''}")
+    return directory
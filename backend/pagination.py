@@ -0,0 +1,68 @@
+import base64
+import json
+import re
+import uuid
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+# Keyset position: (created_at, id) of the last row on the previous page
+Cursor = Tuple[str, str]
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+# Response header carrying the cursor of the next page; absent on the last page
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# ISO-8601 timestamps as SQLite and PostgREST return them
+TIMESTAMP = re.compile(r"\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(\.\d{1,9})?(Z|[+-]\d{2}(:?\d{2})?)?")
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class Page(NamedTuple):
+    items: List[Dict[str, Any]]
+    next_cursor: Optional[str]
+
+
+def encode_cursor(row: Dict[str, Any]) -> str:
+    """Opaque, URL-safe cursor pointing just after ``row``"""
+    raw = json.dumps([str(row["created_at"]), str(row["id"])], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Cursor]:
+    """Parse a cursor from ``encode_cursor``; raises InvalidCursor if it is malformed.
+
+    Backends put the values into queries (PostgREST filter expressions
+    among them), so anything but a timestamp and a UUID is rejected.
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception as e:
+        raise InvalidCursor("Invalid cursor") from e
+    if not isinstance(created_at, str) or not isinstance(row_id, str) or not TIMESTAMP.fullmatch(created_at):
+        raise InvalidCursor("Invalid cursor")
+    try:
+        row_id = str(uuid.UUID(row_id))
+    except ValueError as e:
+        raise InvalidCursor("Invalid cursor") from e
+    return created_at, row_id
+
+
+def set_next_cursor(response, page: Page):
+    """Expose the next page's cursor on a response; list bodies stay plain arrays"""
+    if page.next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = page.next_cursor
+
+
+def make_page(rows: List[Dict[str, Any]], limit: int) -> Page:
+    """Build a page from up to ``limit + 1`` rows; the extra row only signals more"""
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return Page(rows, encode_cursor(rows[-1]))
+    return Page(rows, None)
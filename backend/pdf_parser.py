@@ -1,11 +1,44 @@
-import pypdf
+import asyncio
 import logging
-from typing import List
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator, List, Union
 import io
+import mmap
 import re
+import time
+
+from .metrics import PDF_PAGE_PARSE_SECONDS
 
 logger = logging.getLogger(__name__)
 
+@contextmanager
+def _open_pdf(pdf: Union[bytes, BinaryIO]) -> Iterator[BinaryIO]:
+    """A seekable stream over a PDF given as bytes or as a file.
+
+    Files backed by a real file descriptor (uploads spooled to disk) are
+    memory-mapped read-only, so the PDF is paged in from the page cache
+    instead of being copied into the process; other files are read in
+    place.
+    """
+    if isinstance(pdf, (bytes, bytearray, memoryview)):
+        yield io.BytesIO(pdf)
+        return
+    pdf.seek(0)
+    # fileno() would roll a spooled file still held in memory over to disk
+    if not getattr(pdf, "_rolled", True):
+        yield pdf
+        return
+    try:
+        pdf.flush()  # the mapping only sees what reached the file
+        fileno = pdf.fileno()
+        mapped = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+        # No descriptor (BytesIO) or an empty file, which cannot be mapped
+        yield pdf
+        return
+    with mapped:
+        yield mapped
+
 class PDFParser:
     def __init__(self):
         pass
@@ -32,43 +65,57 @@ class PDFParser:
         
         return text
     
-    async def parse_pdf(self, pdf_content: bytes) -> List[str]:
-        """Parse PDF content and extract text chunks"""
+    async def parse_pdf(self, pdf_content: Union[bytes, BinaryIO]) -> List[str]:
+        """Parse PDF content (bytes or a binary file) and extract text chunks.
+
+        Parsing runs in a worker thread, so several uploads parse side by side
+        without blocking the event loop.
+        """
+        return await asyncio.to_thread(self._parse_pdf_sync, pdf_content)
+    
+    def _parse_pdf_sync(self, pdf_content: Union[bytes, BinaryIO]) -> List[str]:
         try:
-            # Create a file-like object from bytes
-            pdf_file = io.BytesIO(pdf_content)
-            
-            # Parse PDF
-            pdf_reader = pypdf.PdfReader(pdf_file)
-            
-            text_chunks = []
-            
-            for page_num, page in enumerate(pdf_reader.pages):
-                try:
-                    # Extract text from page
-                    page_text = page.extract_text()
-                    
-                    if page_text and page_text.strip():
-                        # Sanitize the extracted text
-                        clean_text = self._sanitize_text(page_text)
-                        
-                        if clean_text:  # Only process if there's clean text
-                            # Split page text into chunks
-                            chunks = await self._split_text_into_chunks(clean_text)
-                            text_chunks.extend(chunks)
-                        
-                except Exception as e:
-                    logger.warning(f"Error extracting text from page {page_num}: {e}")
-                    continue
-            
-            return text_chunks
-            
+            with _open_pdf(pdf_content) as pdf_file:
+                return self._extract_chunks(pdf_file)
         except Exception as e:
             logger.error(f"Error parsing PDF: {e}")
             raise
     
+    def _extract_chunks(self, pdf_file: BinaryIO) -> List[str]:
+        # Parse PDF
+        import pypdf
+        pdf_reader = pypdf.PdfReader(pdf_file)
+        
+        text_chunks = []
+        
+        for page_num, page in enumerate(pdf_reader.pages):
+            page_started = time.perf_counter()
+            try:
+                # Extract text from page
+                page_text = page.extract_text()
+                
+                if page_text and page_text.strip():
+                    # Sanitize the extracted text
+                    clean_text = self._sanitize_text(page_text)
+                    
+                    if clean_text:  # Only process if there's clean text
+                        # Split page text into chunks
+                        chunks = self._split_text(clean_text)
+                        text_chunks.extend(chunks)
+                    
+            except Exception as e:
+                logger.warning(f"Error extracting text from page {page_num}: {e}")
+                continue
+            finally:
+                PDF_PAGE_PARSE_SECONDS.observe(time.perf_counter() - page_started)
+        
+        return text_chunks
+    
     async def _split_text_into_chunks(self, text: str, chunk_size: int = 500) -> List[str]:
         """Split text into chunks of approximately chunk_size characters"""
+        return self._split_text(text, chunk_size)
+    
+    def _split_text(self, text: str, chunk_size: int = 500) -> List[str]:
         # Ensure text is sanitized
         text = self._sanitize_text(text)
         
@@ -112,6 +159,7 @@ class PDFParser:
     async def get_pdf_info(self, pdf_content: bytes) -> dict:
         """Get basic information about the PDF"""
         try:
+            import pypdf
             pdf_file = io.BytesIO(pdf_content)
             pdf_reader = pypdf.PdfReader(pdf_file)
             
@@ -0,0 +1,173 @@
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+import uvicorn
+
+logger = logging.getLogger(__name__)
+
+# Longest wait before a crashed worker's slot is refilled
+MAX_RESTART_BACKOFF_S = 30.0
+
+def preload_shared_state():
+    """Load everything workers should share before forking.
+
+    The embedding model weights and the memory-mapped vector index are loaded
+    once here; after ``fork()`` the workers see the same physical pages until
+    one of them writes to a page (copy-on-write).
+    """
+    from .config import settings
+    from .services import services
+    from .vector_index import vector_index
+
+    services.embedding_service.preload()
+    vector_index.configure(
+        settings.retrieval_prefilter_dims,
+        settings.retrieval_candidates,
+        settings.retrieval_two_stage_min_chunks
+    )
+    if settings.vector_index_dir:
+        vector_index.load(settings.vector_index_dir, mmap=True)
+
+
+def _bind_socket(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _limit_worker_threads(workers: int):
+    """Split the CPU cores between workers so torch/ONNX Runtime do not oversubscribe"""
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        torch.set_num_threads(threads)
+    onnx_embedding = sys.modules.get("backend.onnx_embedding")
+    if onnx_embedding is not None:
+        # Sessions are created per worker on first use and pick this up
+        onnx_embedding.default_threads = threads
+
+
+def _run_worker(config: uvicorn.Config, sock: socket.socket, workers: int):
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    _limit_worker_threads(workers)
+    server = uvicorn.Server(config)
+    server.run(sockets=[sock])
+
+
+def serve_prefork(
+    app: str,
+    host: str = "0.0.0.0",
+    port: int = 8000,
+    workers: int = 2,
+    log_level: str = "info",
+    preload: Optional[Callable[[], None]] = preload_shared_state,
+    restart_backoff_s: float = 0.5,
+    max_crashes: int = 5,
+    crash_window_s: float = 60.0,
+):
+    """Serve an ASGI app from ``workers`` processes forked after preloading.
+
+    The master imports the app, runs ``preload``, freezes the GC so collections
+    in the workers do not touch the shared objects, then forks. Workers that
+    exit unexpectedly are replaced after a backoff that doubles with each
+    recent exit of the same slot, starting at ``restart_backoff_s``. Once a
+    slot has exited ``max_crashes`` times within ``crash_window_s`` (a worker
+    that cannot start, say), all workers are stopped and the master exits
+    with status 1. SIGINT/SIGTERM stop all of them.
+    """
+    if not hasattr(os, "fork"):
+        raise RuntimeError("Pre-fork mode requires a platform with os.fork()")
+
+    config = uvicorn.Config(app, host=host, port=port, log_level=log_level)
+    config.load()
+
+    started = time.perf_counter()
+    if preload is not None:
+        preload()
+    logger.info(f"Pre-fork master loaded shared state in {time.perf_counter() - started:.2f}s")
+
+    gc.collect()
+    gc.freeze()
+
+    sock = _bind_socket(host, port)
+    children: Dict[int, int] = {}
+    crashes: Dict[int, List[float]] = {}
+    shutting_down = False
+    exit_code = 0
+
+    def spawn(slot: int):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _run_worker(config, sock, workers)
+            except BaseException:
+                logger.exception(f"Worker {slot} failed")
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = slot
+        logger.info(f"Started worker {slot} (pid {pid})")
+
+    def stop(signum, frame):
+        nonlocal shutting_down
+        shutting_down = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    previous_handlers = signal.signal(signal.SIGTERM, stop), signal.signal(signal.SIGINT, stop)
+
+    for slot in range(workers):
+        spawn(slot)
+
+    try:
+        while children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            slot = children.pop(pid, None)
+            if slot is None or shutting_down:
+                continue
+
+            code = os.waitstatus_to_exitcode(status)
+            now = time.monotonic()
+            recent = [t for t in crashes.get(slot, []) if now - t < crash_window_s] + [now]
+            crashes[slot] = recent
+            if len(recent) >= max_crashes:
+                logger.error(
+                    f"Worker {slot} exited {len(recent)} times within {crash_window_s:.0f}s "
+                    f"(last status {code}); stopping"
+                )
+                exit_code = 1
+                stop(None, None)
+                continue
+
+            delay = min(MAX_RESTART_BACKOFF_S, restart_backoff_s * 2 ** (len(recent) - 1))
+            logger.warning(f"Worker {slot} (pid {pid}) exited with status {code}, restarting in {delay:.2f}s")
+            time.sleep(delay)
+            if not shutting_down:
+                spawn(slot)
+    finally:
+        signal.signal(signal.SIGTERM, previous_handlers[0])
+        signal.signal(signal.SIGINT, previous_handlers[1])
+        sock.close()
+
+    logger.info("Pre-fork master stopped")
+    if exit_code:
+        raise SystemExit(exit_code)
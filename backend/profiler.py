@@ -0,0 +1,62 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+class SamplingProfiler:
+    """Statistical profiler that samples every thread's Python stack.
+
+    Output is in the collapsed-stack format (``frame;frame;frame count`` per
+    line) read by flamegraph.pl, speedscope and inferno. Sampling runs in its
+    own thread, so the event loop keeps serving while a profile is taken.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self.sample_count = 0
+
+    @staticmethod
+    def _frame_label(frame) -> str:
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+    def _sample(self, own_thread: int, thread_names: Dict[int, str]):
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_thread:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_label(frame))
+                frame = frame.f_back
+            stack.append(thread_names.get(thread_id, f"thread-{thread_id}"))
+            self.samples[";".join(reversed(stack))] += 1
+        self.sample_count += 1
+
+    def run(self, seconds: float):
+        """Sample for ``seconds``; blocks the calling thread"""
+        own_thread = threading.get_ident()
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            thread_names = {t.ident: t.name for t in threading.enumerate()}
+            self._sample(own_thread, thread_names)
+            time.sleep(self.interval)
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+_profile_lock = threading.Lock()
+
+def profile(seconds: float, interval: float = 0.005) -> Optional[str]:
+    """Profile the process for ``seconds``; returns None if a profile is already running"""
+    if not _profile_lock.acquire(blocking=False):
+        return None
+    try:
+        profiler = SamplingProfiler(interval)
+        profiler.run(seconds)
+        return profiler.collapsed()
+    finally:
+        _profile_lock.release()
@@ -0,0 +1,84 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Set, Tuple
+
+from .metrics import CACHE_REQUESTS, ERRORS
+
+logger = logging.getLogger(__name__)
+
+# Values of agents.prompt_status
+PROMPT_STATUS_PENDING = "pending"    # fallback prompt stored, generation running
+PROMPT_STATUS_READY = "ready"        # generated prompt stored
+PROMPT_STATUS_FALLBACK = "fallback"  # generation failed, fallback prompt kept
+
+class SystemPromptGenerator:
+    """Generate agent system prompts in the background and write them back.
+
+    Requests for the same (name, description) pair share a single Ollama
+    call while it is in flight, and recent results are kept in a small LRU
+    so bulk provisioning of identical agents only generates once.
+    """
+
+    def __init__(self, db, ollama_client, cache_size: int = 256):
+        self.db = db
+        self.ollama_client = ollama_client
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self._in_flight: Dict[Tuple[str, str], asyncio.Task] = {}
+        self._waiting_agents: Dict[Tuple[str, str], List[str]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def schedule(self, agent_id: str, name: str, description: str):
+        """Queue prompt generation for a freshly inserted agent"""
+        key = (name.strip(), description.strip())
+        self._waiting_agents.setdefault(key, []).append(agent_id)
+        
+        if key in self._in_flight:
+            CACHE_REQUESTS.inc(cache="system_prompt", result="in_flight")
+            logger.info(f"Reusing in-flight system prompt generation for agent {agent_id}")
+            return
+        
+        task = asyncio.create_task(self._run(key))
+        self._in_flight[key] = task
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, key: Tuple[str, str]):
+        name, description = key
+        status = PROMPT_STATUS_READY
+        try:
+            system_prompt = self._cache.get(key)
+            if system_prompt is not None:
+                CACHE_REQUESTS.inc(cache="system_prompt", result="hit")
+                self._cache.move_to_end(key)
+            else:
+                CACHE_REQUESTS.inc(cache="system_prompt", result="miss")
+                system_prompt = await self.ollama_client.request_system_prompt(name, description)
+                self._remember(key, system_prompt)
+        except Exception as e:
+            ERRORS.inc(stage="system_prompt")
+            logger.error(f"Background system prompt generation failed: {e}")
+            system_prompt = None
+            status = PROMPT_STATUS_FALLBACK
+        finally:
+            # Agents that joined while the call was running are picked up here
+            del self._in_flight[key]
+            agent_ids = self._waiting_agents.pop(key, [])
+        
+        for agent_id in agent_ids:
+            try:
+                await self.db.update_agent_system_prompt(agent_id, system_prompt, status)
+            except Exception as e:
+                logger.error(f"Failed to store system prompt for agent {agent_id}: {e}")
+
+    def _remember(self, key: Tuple[str, str], system_prompt: str):
+        self._cache[key] = system_prompt
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def wait_idle(self):
+        """Wait for all queued generations, used on shutdown"""
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from .metrics import REINDEXED_CHUNKS, registry
+
+logger = logging.getLogger(__name__)
+
+
+class ReindexJob:
+    """Background re-embedding of KB chunks after the embedding model changes.
+
+    Agents are migrated one at a time. Chunks embedded with another model
+    are re-embedded in batches and staged next to their current vectors,
+    while searches keep using the old vectors (and the old model for the
+    query). When none are left, ``switch_agent_embeddings`` swaps the new
+    vectors in and points the agent at the new model in one transaction.
+    Chunks uploaded during the migration are embedded with the agent's old
+    model and picked up by the next batch.
+
+    ``max_chunks_per_second`` throttles the job so it leaves CPU for live
+    traffic; 0 runs it flat out. Staged vectors survive restarts, so an
+    interrupted job resumes where it stopped.
+    """
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.status: Dict[str, Any] = {"state": "idle"}
+        self._active_seconds = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    def start(self, db, embedding_service, batch_size: int = 256, max_chunks_per_second: float = 0.0) -> bool:
+        """Run the job in the background; False if it is already running"""
+        if self.running:
+            return False
+        self.status = {"state": "running", "model": embedding_service.model_name}
+        self.task = asyncio.create_task(self.run(db, embedding_service, batch_size, max_chunks_per_second))
+        return True
+
+    def progress(self) -> Dict[str, Any]:
+        status = dict(self.status)
+        done = status.get("chunks_done", 0)
+        if self._active_seconds > 0:
+            status["chunks_per_second"] = round(done / self._active_seconds, 1)
+            remaining = max(0, status.get("chunks_total", 0) - done)
+            if status["state"] == "running" and done:
+                status["eta_seconds"] = round(remaining / (done / self._active_seconds), 1)
+        return status
+
+    async def run(self, db, embedding_service, batch_size: int = 256, max_chunks_per_second: float = 0.0):
+        """Migrate every agent to ``embedding_service``'s model, then return"""
+        model = embedding_service.model_name
+        self._active_seconds = 0.0
+        self.status = {
+            "state": "running",
+            "model": model,
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "agents_total": 0,
+            "agents_done": 0,
+            "current_agent": None,
+            "chunks_total": 0,
+            "chunks_done": 0,
+        }
+        try:
+            agents = await db.storage.list_agents_to_reindex(model)
+            pending = {agent["id"]: await db.storage.count_kb_chunks_to_reindex(agent["id"], model) for agent in agents}
+            self.status.update(agents_total=len(agents), chunks_total=sum(pending.values()))
+            logger.info(f"Re-embedding {self.status['chunks_total']} chunks of {len(agents)} agents with {model}")
+
+            for agent in agents:
+                self.status["current_agent"] = agent["id"]
+                await db.start_agent_reindex(agent, model)
+                await self._migrate_agent(db, embedding_service, agent["id"], batch_size, max_chunks_per_second)
+                self.status["agents_done"] += 1
+
+            self.status.update(state="done", current_agent=None)
+            logger.info(f"Re-embedding with {model} finished: {self.status['chunks_done']} chunks")
+        except asyncio.CancelledError:
+            self.status["state"] = "cancelled"
+            raise
+        except Exception as e:
+            self.status.update(state="failed", error=str(e))
+            logger.error(f"Re-embedding with {model} failed: {e}")
+        finally:
+            self.status["finished_at"] = datetime.now(timezone.utc).isoformat()
+
+    async def _migrate_agent(self, db, embedding_service, agent_id: str, batch_size: int, max_chunks_per_second: float):
+        model = embedding_service.model_name
+        dimensions = db.storage.embedding_dimensions
+        while True:
+            rows = await db.storage.list_kb_chunks_to_reindex(agent_id, model, batch_size)
+            if not rows:
+                # Nothing left unstaged: switch, then check for chunks
+                # uploaded with the old model while switching
+                switched = await db.switch_agent_embeddings(agent_id, model)
+                logger.info(f"Agent {agent_id} now searches {switched} chunks embedded with {model}")
+                if not await db.storage.count_kb_chunks_to_reindex(agent_id, model):
+                    return
+                continue
+
+            started = time.perf_counter()
+            embeddings = await embedding_service.generate_embeddings([row["content"] for row in rows])
+            if dimensions and len(embeddings[0]) != dimensions:
+                raise ValueError(
+                    f"{model} produces {len(embeddings[0])}-dimensional embeddings, "
+                    f"the {db.storage.name} embedding column holds {dimensions}"
+                )
+            staged = await db.storage.stage_kb_chunk_embeddings(
+                agent_id, {row["id"]: embedding for row, embedding in zip(rows, embeddings)}
+            )
+            if not staged:
+                # The same rows would come back forever
+                raise RuntimeError(f"No embeddings could be staged for agent {agent_id}")
+            self.status["chunks_done"] += len(rows)
+            REINDEXED_CHUNKS.inc(len(rows))
+
+            elapsed = time.perf_counter() - started
+            if max_chunks_per_second > 0:
+                pause = len(rows) / max_chunks_per_second - elapsed
+                if pause > 0:
+                    await asyncio.sleep(pause)
+            self._active_seconds += time.perf_counter() - started
+
+
+# One job per process; started from the admin API or run_backend.py --reindex
+reindex_job = ReindexJob()
+registry.gauge(
+    "kb_reindex_remaining_chunks", "Chunks the running re-embedding job has left",
+    lambda: max(0, reindex_job.status.get("chunks_total", 0) - reindex_job.status.get("chunks_done", 0))
+    if reindex_job.running else 0
+)
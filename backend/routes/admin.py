@@ -0,0 +1,72 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import PlainTextResponse
+import asyncio
+import logging
+
+from ..auth import get_current_user, User
+from ..config import settings
+from ..profiler import profile
+from ..reindex import reindex_job
+from ..services import services
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+def require_admin(current_user: User = Depends(get_current_user)) -> User:
+    """Only users whose profile role is "admin" may use these endpoints"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return current_user
+
+@router.get("/profile", response_class=PlainTextResponse)
+async def profile_worker(
+    seconds: float = 10.0,
+    interval_ms: float = 5.0,
+    current_user: User = Depends(require_admin)
+):
+    """Sample this worker's stacks for a while and return collapsed stacks.
+
+    Feed the result to flamegraph.pl, speedscope or inferno. Only the worker
+    that serves the request is profiled.
+    """
+    if not 0 < seconds <= settings.profiler_max_seconds:
+        raise HTTPException(
+            status_code=400,
+            detail=f"seconds must be between 0 and {settings.profiler_max_seconds}"
+        )
+    if not 1 <= interval_ms <= 1000:
+        raise HTTPException(status_code=400, detail="interval_ms must be between 1 and 1000")
+    
+    logger.info(f"Admin {current_user.id} started a {seconds}s profile")
+    collapsed = await asyncio.to_thread(profile, seconds, interval_ms / 1000)
+    if collapsed is None:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    
+    return PlainTextResponse(
+        collapsed,
+        headers={"Content-Disposition": "attachment; filename=profile.collapsed"}
+    )
+
+@router.post("/reindex", status_code=202)
+async def start_reindex(current_user: User = Depends(require_admin)):
+    """Start re-embedding KB chunks with the configured embedding model.
+
+    Runs in this worker's background. Each agent keeps searching its old
+    vectors until its migration completes, then switches over atomically.
+    """
+    started = reindex_job.start(
+        services.db,
+        services.embedding_service,
+        batch_size=settings.reindex_batch_size,
+        max_chunks_per_second=settings.reindex_max_chunks_per_second
+    )
+    if not started:
+        raise HTTPException(status_code=409, detail="A re-embedding job is already running")
+    logger.info(f"Admin {current_user.id} started re-embedding with {settings.embedding_model}")
+    return reindex_job.progress()
+
+@router.get("/reindex")
+async def reindex_progress(current_user: User = Depends(require_admin)):
+    """Progress and throughput of this worker's re-embedding job"""
+    return reindex_job.progress()
@@ -4,45 +4,46 @@ import logging
 
 from ..auth import get_current_user, User
 from ..models import AgentCreate, AgentResponse
-from ..database import DatabaseManager
-from ..ollama_client import OllamaClient
+from ..prompt_generation import PROMPT_STATUS_PENDING
+from ..serialization import trusted_response
+from ..services import services
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/agents", tags=["agents"])
 
-# Initialize services
-db = DatabaseManager()
-ollama_client = OllamaClient()
-
 @router.post("/", response_model=AgentResponse)
 async def create_agent(
     agent_data: AgentCreate,
     current_user: User = Depends(get_current_user)
 ):
-    """Create a new AI agent"""
+    """Create a new AI agent.
+
+    The agent is stored right away with the fallback system prompt and
+    ``prompt_status="pending"``; the generated prompt is written back in the
+    background and the status flips to "ready" (or "fallback" on failure).
+    """
     try:
         print(f"[AGENTIC DEBUG] Creating agent for user: {current_user.id}")
         print(f"[AGENTIC DEBUG] Agent data: {agent_data}")
         
-        # Generate system prompt using Ollama
-        system_prompt = await ollama_client.generate_system_prompt(
-            agent_data.name, 
-            agent_data.description
-        )
-        
-        print(f"[AGENTIC DEBUG] Generated system prompt: {system_prompt[:100]}...")
-        
-        # Create agent in database
-        agent = await db.create_agent(
+        # Create agent in database with the fallback prompt
+        agent = await services.db.create_agent(
             user_id=current_user.id,
             name=agent_data.name,
-            system_prompt=system_prompt
+            system_prompt=services.ollama_client.get_fallback_system_prompt(
+                agent_data.name,
+                agent_data.description
+            ),
+            prompt_status=PROMPT_STATUS_PENDING
         )
         
         print(f"[AGENTIC DEBUG] Created agent: {agent}")
         
-        return AgentResponse(**agent)
+        # Generate the real system prompt using Ollama in the background
+        services.prompt_generator.schedule(agent["id"], agent_data.name, agent_data.description)
+        
+        return trusted_response(AgentResponse, agent)
     except Exception as e:
         logger.error(f"Error creating agent: {e}")
         raise HTTPException(status_code=500, detail="Failed to create agent")
@@ -51,8 +52,8 @@ async def create_agent(
 async def list_agents(current_user: User = Depends(get_current_user)):
     """List all agents for the current user"""
     try:
-        agents = await db.get_user_agents(current_user.id)
-        return [AgentResponse(**agent) for agent in agents]
+        agents = await services.db.get_user_agents(current_user.id)
+        return trusted_response(AgentResponse, agents)
     except Exception as e:
         logger.error(f"Error listing agents: {e}")
         raise HTTPException(status_code=500, detail="Failed to list agents")
@@ -64,10 +65,10 @@ async def get_agent(
 ):
     """Get a specific agent"""
     try:
-        agent = await db.get_agent(agent_id, current_user.id)
+        agent = await services.db.get_agent(agent_id, current_user.id)
         if not agent:
             raise HTTPException(status_code=404, detail="Agent not found")
-        return AgentResponse(**agent)
+        return trusted_response(AgentResponse, agent)
     except HTTPException:
         raise
     except Exception as e:
@@ -79,16 +80,12 @@ async def delete_agent(
     agent_id: str,
     current_user: User = Depends(get_current_user)
 ):
-    """Delete an agent"""
+    """Delete an agent with its knowledge base and conversations"""
     try:
-        # Verify agent ownership
-        agent = await db.get_agent(agent_id, current_user.id)
-        if not agent:
+        # Ownership is part of the delete itself
+        if not await services.db.delete_agent(agent_id, current_user.id):
             raise HTTPException(status_code=404, detail="Agent not found")
         
-        # Delete agent (this would need to be implemented in DatabaseManager)
-        # await db.delete_agent(agent_id)
-        
         return {"message": "Agent deleted successfully"}
     except HTTPException:
         raise
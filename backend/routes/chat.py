@@ -1,166 +1,450 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, HTTPException
-from typing import List
-import json
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, HTTPException, Query
+from typing import List, Optional, Tuple
+import asyncio
 import logging
-from supabase import create_client
 
+from ..admission import ConcurrencyLimit, RateLimit, RateLimited
 from ..auth import get_current_user, User
 from ..models import ChatMessage, ConversationResponse
-from ..database import DatabaseManager
-from ..ollama_client import OllamaClient
+from ..ollama_client import ModelKeepAlive
+from ..connections import ConnectionRegistry, ConnectionLimitExceeded
+from ..streaming import FrameSender, TokenCoalescer, negotiate_framing
+from ..pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, InvalidCursor, set_next_cursor
+from ..metrics import (
+    registry,
+    AUTH_VERIFY_SECONDS,
+    CHAT_TOKENS_PER_SECOND,
+    CHAT_TTFT_SECONDS,
+    ERRORS,
+)
+from ..serialization import loads, trusted_response
+from ..services import services
+from ..speculation import DraftRetriever
+from ..summarizer import ConversationSummarizer
+from ..timing import StageTimer
+from ..tracing import current_trace_id, span, start_trace
 from ..config import settings
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
-# Initialize services
-db = DatabaseManager()
-ollama_client = OllamaClient()
+# WebSocket connection registry (several sessions per user, heartbeats, idle eviction)
+manager = ConnectionRegistry(
+    max_connections_per_user=settings.ws_max_connections_per_user,
+    heartbeat_interval=settings.ws_heartbeat_interval_s,
+    idle_timeout=settings.ws_idle_timeout_s
+)
+registry.gauge("websocket_active_connections", "Open chat WebSocket sessions",
+               lambda: len(manager.connections))
+registry.gauge("websocket_connected_users", "Users with at least one open chat WebSocket",
+               lambda: len(manager.by_user))
 
-# Initialize Supabase client
-supabase = create_client(settings.supabase_url, settings.supabase_anon_key)
+# Admission control shared by every socket in this worker
+message_rate = RateLimit(
+    "chat_messages",
+    settings.chat_messages_per_minute_per_user,
+    settings.chat_messages_per_minute_per_agent
+)
+generations = ConcurrencyLimit(
+    "chat_generations",
+    settings.chat_concurrent_generations_per_user,
+    settings.chat_concurrent_generations_per_agent
+)
+registry.gauge("chat_generations_in_flight", "Chat turns currently generating",
+               lambda: generations.in_flight)
 
-# WebSocket connection manager
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: dict = {}
+# Folds older messages into each conversation's rolling summary, yielding to
+# chat generations
+summarizer = ConversationSummarizer(
+    keep_messages=settings.chat_history_messages,
+    batch_messages=settings.chat_summary_batch_messages,
+    max_wait_s=settings.chat_summary_max_wait_s,
+    busy=lambda: generations.in_flight > 0
+)
+registry.gauge("conversation_summaries_queued", "Conversations waiting for their rolling summary",
+               lambda: summarizer.queue.qsize())
 
-    async def connect(self, websocket: WebSocket, user_id: str):
-        # Don't accept here - should be done before calling this method
-        self.active_connections[user_id] = websocket
+# Keeps the chat model loaded in Ollama while any socket is open
+model_keepalive = ModelKeepAlive(settings.ollama_keepalive_interval_s, lambda: bool(manager.connections))
 
-    def disconnect(self, user_id: str):
-        if user_id in self.active_connections:
-            del self.active_connections[user_id]
+async def _persist_message(timer: StageTimer, conversation_id: str, role: str, content: str):
+    """Store a chat message, logging failures instead of interrupting the turn"""
+    try:
+        with timer.stage(f"persist_{role}"):
+            return await services.db.create_message(
+                conversation_id=conversation_id,
+                role=role,
+                content=content
+            )
+    except Exception as e:
+        ERRORS.inc(stage="persist_message")
+        logger.error(f"Failed to persist {role} message: {e}")
+        return None
+
+async def _search_context(timer: StageTimer, agent: dict, message: str) -> str:
+    """Embed the query with the agent's model and fetch matching KB chunks, returning the LLM context"""
+    embedding_model = agent.get("embedding_model")
+    with timer.stage("embed"):
+        query_embedding = await services.embedding_service_for(embedding_model).generate_embedding(message)
+    with timer.stage("search"):
+        kb_chunks = await services.db.search_kb_chunks(
+            agent["id"],
+            message,
+            limit=5,
+            query_embedding=query_embedding,
+            embedding_model=embedding_model,
+            kb_version=agent.get("kb_version")
+        )
+    return "\n".join([chunk["content"] for chunk in kb_chunks])
+
+async def _send_error(sender: FrameSender, content: str):
+    """Tell the client part of a turn failed; the socket may already be gone"""
+    try:
+        await sender.send({"type": "error", "content": content})
+    except Exception:
+        pass
+
+async def _retrieve_context(timer: StageTimer, sender: FrameSender, agent: dict, message: str) -> str:
+    """Like ``_search_context``, but an error frame and an empty context instead of an error"""
+    try:
+        return await _search_context(timer, agent, message)
+    except Exception as e:
+        # Answer without KB context rather than failing the whole turn
+        ERRORS.inc(stage="retrieval")
+        logger.error(f"Context retrieval failed: {e}")
+        await _send_error(sender, "Knowledge base search failed; answering without it")
+        return ""
+
+async def _load_memory(timer: StageTimer, conversation_id: str) -> dict:
+    """The conversation summary and recent messages for the prompt; empty on errors"""
+    max_messages = settings.chat_history_messages
+    if settings.chat_summary_enabled and max_messages > 0:
+        max_messages += settings.chat_summary_batch_messages
+    try:
+        with timer.stage("history"):
+            memory = await services.db.get_conversation_memory(conversation_id, max_messages)
+    except Exception as e:
+        ERRORS.inc(stage="history")
+        logger.error(f"Loading conversation history failed: {e}")
+        return {"summary": "", "messages": []}
+    limit = settings.chat_history_message_chars
+    memory["messages"] = [
+        {"role": m["role"], "content": m["content"][:limit] if limit else m["content"]}
+        for m in memory["messages"]
+    ]
+    return memory
+
+async def handle_chat_turn(
+    sender: FrameSender,
+    conversation_id: str,
+    agent: dict,
+    message: str,
+    drafts: Optional[DraftRetriever] = None
+):
+    """Run one chat turn as a concurrent pipeline.
 
-    async def send_message(self, user_id: str, message: str):
-        if user_id in self.active_connections:
-            await self.active_connections[user_id].send_text(message)
+    The conversation history is loaded and the user message persisted in
+    the background while the query is embedded and searched; generation
+    starts as soon as the context is ready. Context retrieved speculatively
+    from the user's draft is reused when it matches the message. Cancelling
+    the task, before or during generation, still stores the user message and
+    the partial reply and ends with a ``stopped`` end frame. A failed
+    retrieval, generation or save sends an error frame, and the turn still
+    ends with an end frame. Afterwards the conversation is queued for its
+    rolling summary.
+    """
+    timer = StageTimer()
+    memory_task = asyncio.create_task(_load_memory(timer, conversation_id))
+    
+    async def persist_user_message():
+        # Stored once the history has been read, so it is not part of it
+        await asyncio.wait([memory_task])
+        return await _persist_message(timer, conversation_id, "user", message)
+    
+    persist_task = asyncio.create_task(persist_user_message())
+    
+    # Stream response from Ollama, coalescing tokens into fewer frames
+    coalescer = TokenCoalescer(
+        sender.send,
+        flush_interval_ms=settings.ws_flush_interval_ms,
+        flush_max_bytes=settings.ws_flush_max_bytes
+    )
+    response_tokens = []
+    stopped = False
+    try:
+        # A stop can arrive before generation starts, so the lookups are
+        # covered by the same cancellation handling
+        context = await drafts.take(message) if drafts else None
+        if context is None:
+            context = await _retrieve_context(timer, sender, agent, message)
+        memory = await memory_task
+        timer.mark("context_ready")
+        
+        with timer.stage("generate"):
+            stream = services.ollama_client.stream_chat(
+                message=message,
+                system_prompt=agent["system_prompt"],
+                context=context,
+                summary=memory["summary"],
+                history=memory["messages"]
+            )
+            try:
+                async for token in stream:
+                    if not response_tokens:
+                        timer.mark("first_token")
+                        CHAT_TTFT_SECONDS.observe(timer.marks["first_token"])
+                    response_tokens.append(token)
+                    await coalescer.add(token)
+                timer.mark("last_token")
+            finally:
+                # Closing the generator closes the httpx stream, which tells
+                # Ollama to stop generating
+                await stream.aclose()
+            await coalescer.flush()
+    except asyncio.CancelledError:
+        # Client sent "stop" or disconnected; keep what was generated so far
+        stopped = True
+        logger.info(f"Generation cancelled after {len(response_tokens)} tokens")
+    except Exception as e:
+        # Keep what was generated so far and still end the turn
+        ERRORS.inc(stage="generate")
+        logger.error(f"Generation failed after {len(response_tokens)} tokens: {e}")
+        await _send_error(sender, "Failed to generate a response")
+    full_response = "".join(response_tokens)
+    generate_seconds = timer.durations.get("generate", 0)
+    if not stopped and generate_seconds > 0 and response_tokens:
+        CHAT_TOKENS_PER_SECOND.observe(len(response_tokens) / generate_seconds)
+    
+    # Keep message order: the user message must land before the agent reply.
+    # Shielded so a second cancellation cannot drop the partial response.
+    user_message = await asyncio.shield(persist_task)
+    agent_response = await asyncio.shield(
+        _persist_message(timer, conversation_id, "agent", full_response)
+    )
+    if user_message is None or agent_response is None:
+        await _send_error(sender, "Failed to save this conversation turn")
+    
+    # Send end of response marker
+    end_frame = {
+        "type": "end",
+        "message_id": agent_response["id"] if agent_response else None,
+        "trace_id": current_trace_id()
+    }
+    if stopped:
+        end_frame["stopped"] = True
+        try:
+            await coalescer.close()
+            await sender.send(end_frame)
+        except Exception:
+            # The socket is already gone when the client disconnected
+            pass
+    else:
+        await coalescer.close()
+        await sender.send(end_frame)
+    if settings.chat_summary_enabled and settings.chat_history_messages > 0:
+        summarizer.schedule(services.db, services.ollama_client, conversation_id)
+    logger.debug(f"Chat turn timings: {timer.summary()} total={timer.elapsed() * 1000:.1f}ms")
 
-manager = ConnectionManager()
+async def traced_chat_turn(
+    sender: FrameSender,
+    conversation_id: str,
+    agent: dict,
+    message: str,
+    drafts: Optional[DraftRetriever] = None
+):
+    """Run a chat turn inside its own trace so its spans and logs share a trace id"""
+    with start_trace("chat_turn", slow_threshold_ms=settings.trace_slow_threshold_ms):
+        await handle_chat_turn(sender, conversation_id, agent, message, drafts)
+
+def _log_turn_error(task: asyncio.Task):
+    if not task.cancelled() and task.exception():
+        ERRORS.inc(stage="chat_turn")
+        logger.error(f"Chat turn failed: {task.exception()}")
+
+async def _authenticate_websocket(websocket: WebSocket, agent_id: str) -> Optional[Tuple[str, dict]]:
+    """Verify the token and agent access, closing the socket on failure.
+
+    Returns (user_id, agent) when the connection may be accepted.
+    """
+    # Get auth token from query params (WebSocket doesn't support Authorization header properly)
+    token = websocket.query_params.get("token")
+    logger.info(f"Token received: {'Yes' if token else 'No'}")
+    
+    if not token:
+        logger.error("Missing authentication token")
+        await websocket.close(code=4001, reason="Missing authentication token")
+        return None
+    
+    # Remove Bearer prefix if present
+    if token.startswith("Bearer "):
+        token = token[7:]
+    
+    # Verify token and get user before accepting connection
+    try:
+        logger.info("Validating token with Supabase...")
+        with AUTH_VERIFY_SECONDS.time(transport="websocket"), span("auth"):
+            user_response = await asyncio.to_thread(services.auth_client.auth.get_user, token)
+        if not user_response.user:
+            logger.error("Invalid token - no user returned")
+            await websocket.close(code=4001, reason="Invalid token")
+            return None
+        user_id = user_response.user.id
+        logger.info(f"Token validated for user: {user_id}")
+    except Exception as e:
+        logger.error(f"Token validation error: {e}")
+        await websocket.close(code=4001, reason="Authentication failed")
+        return None
+    
+    # Verify agent exists and user has access before accepting connection
+    logger.info(f"Checking agent access for user {user_id} and agent {agent_id}")
+    agent = await services.db.get_agent(agent_id, user_id)
+    if not agent:
+        logger.error(f"Agent not found or access denied for agent {agent_id}")
+        await websocket.close(code=4002, reason="Agent not found or access denied")
+        return None
+    
+    return user_id, agent
 
 @router.websocket("/{agent_id}")
 async def websocket_chat(websocket: WebSocket, agent_id: str):
     """WebSocket endpoint for real-time chat with an agent"""
     logger.info(f"WebSocket connection attempt for agent: {agent_id}")
     
+    connection = None
     try:
-        # Get auth token from query params (WebSocket doesn't support Authorization header properly)
-        token = websocket.query_params.get("token")
-        logger.info(f"Token received: {'Yes' if token else 'No'}")
-        
-        if not token:
-            logger.error("Missing authentication token")
-            await websocket.close(code=4001, reason="Missing authentication token")
+        with start_trace("websocket_connect", slow_threshold_ms=settings.trace_slow_threshold_ms):
+            authenticated = await _authenticate_websocket(websocket, agent_id)
+        if authenticated is None:
             return
+        user_id, agent = authenticated
         
-        # Remove Bearer prefix if present
-        if token.startswith("Bearer "):
-            token = token[7:]
-        
-        # Verify token and get user before accepting connection
+        # Enforce the per-user connection cap before accepting
         try:
-            logger.info("Validating token with Supabase...")
-            user_response = supabase.auth.get_user(token)
-            if not user_response.user:
-                logger.error("Invalid token - no user returned")
-                await websocket.close(code=4001, reason="Invalid token")
-                return
-            user_id = user_response.user.id
-            logger.info(f"Token validated for user: {user_id}")
-        except Exception as e:
-            logger.error(f"Token validation error: {e}")
-            await websocket.close(code=4001, reason="Authentication failed")
-            return
-        
-        # Verify agent exists and user has access before accepting connection
-        logger.info(f"Checking agent access for user {user_id} and agent {agent_id}")
-        agent = await db.get_agent(agent_id, user_id)
-        if not agent:
-            logger.error(f"Agent not found or access denied for agent {agent_id}")
-            await websocket.close(code=4002, reason="Agent not found or access denied")
+            connection = manager.register(websocket, user_id, agent_id)
+        except ConnectionLimitExceeded as e:
+            logger.warning(f"Rejecting WebSocket for user {user_id}: {e}")
+            await websocket.close(code=4003, reason="Too many open connections")
             return
         
         # Accept WebSocket connection only after authentication
         logger.info("Accepting WebSocket connection...")
         await websocket.accept()
-        await manager.connect(websocket, user_id)
-        logger.info("WebSocket connection established successfully")
+        logger.info(f"WebSocket connection {connection.id} established successfully")
+        
+        # Negotiate the outgoing frame format (json, msgpack or binary)
+        sender = FrameSender(
+            websocket,
+            negotiate_framing(websocket.query_params.get("framing"), settings.ws_default_framing)
+        )
+        connection.sender = sender
+        await sender.send({"type": "ready", "framing": sender.encoder.name})
         
         # Create new conversation
-        conversation = await db.create_conversation(agent_id)
+        conversation = await services.db.create_conversation(agent_id)
         
-        while True:
-            # Receive message from client
-            data = await websocket.receive_text()
-            message_data = json.loads(data)
-            
-            # Store user message
-            user_message = await db.create_message(
-                conversation_id=conversation["id"],
-                role="user",
-                content=message_data["message"]
-            )
-            
-            # Retrieve relevant KB chunks
-            kb_chunks = await db.search_kb_chunks(
-                agent_id, 
-                message_data["message"], 
-                limit=5
-            )
-            
-            # Prepare context for LLM
-            context = "\n".join([chunk["content"] for chunk in kb_chunks])
-            
-            # Stream response from Ollama
-            full_response = ""
-            async for token in ollama_client.stream_chat(
-                message=message_data["message"],
-                system_prompt=agent["system_prompt"],
-                context=context
-            ):
-                full_response += token
-                await websocket.send_text(json.dumps({
-                    "type": "token",
-                    "content": token
-                }))
-            
-            # Store agent response
-            agent_response = await db.create_message(
-                conversation_id=conversation["id"],
-                role="agent",
-                content=full_response
-            )
-            
-            # Send end of response marker
-            await websocket.send_text(json.dumps({
-                "type": "end",
-                "message_id": agent_response["id"]
-            }))
+        # Turns run as tasks so the socket keeps being read while generating,
+        # which is how "stop" messages and disconnects reach the generation
+        turn_task = None
+        drafts = DraftRetriever(
+            lambda draft: _search_context(StageTimer(), agent, draft),
+            debounce_ms=settings.chat_draft_debounce_ms,
+            min_chars=settings.chat_draft_min_chars,
+            min_coverage=settings.chat_draft_min_coverage
+        ) if settings.chat_drafts_enabled else None
+        try:
+            while True:
+                # Receive message from client
+                data = await websocket.receive_text()
+                manager.touch(connection.id)
+                message_data = loads(data)
+                message_type = message_data.get("type", "message")
+                
+                if message_type == "pong":
+                    continue
+                
+                if message_type == "stop":
+                    if turn_task and not turn_task.done():
+                        turn_task.cancel()
+                    continue
+                
+                if message_type == "draft":
+                    # What the user is typing; retrieve ahead of the message
+                    if drafts is not None:
+                        drafts.update(message_data.get("message", ""))
+                    continue
+                
+                if turn_task and not turn_task.done():
+                    await sender.send({
+                        "type": "error",
+                        "content": "A response is already being generated"
+                    })
+                    continue
+                
+                message = message_data["message"]
+                # Reject over-limit messages before any embedding or generation work
+                try:
+                    generations.acquire(user_id, agent_id)
+                except RateLimited as e:
+                    await sender.send(e.frame())
+                    continue
+                try:
+                    message_rate.take(user_id, agent_id)
+                except RateLimited as e:
+                    generations.release(user_id, agent_id)
+                    await sender.send(e.frame())
+                    continue
+                
+                turn_task = asyncio.create_task(traced_chat_turn(
+                    sender,
+                    conversation_id=conversation["id"],
+                    agent=agent,
+                    message=message,
+                    drafts=drafts
+                ))
+                turn_task.add_done_callback(_log_turn_error)
+                turn_task.add_done_callback(lambda _: generations.release(user_id, agent_id))
+        finally:
+            if drafts is not None:
+                drafts.cancel()
+            if turn_task and not turn_task.done():
+                turn_task.cancel()
+                # Wait for the partial response to be persisted
+                await asyncio.gather(turn_task, return_exceptions=True)
             
     except WebSocketDisconnect:
-        manager.disconnect(user_id)
+        pass
     except Exception as e:
+        ERRORS.inc(stage="websocket")
         logger.error(f"WebSocket error: {e}")
         await websocket.close(code=4000, reason="Internal error")
+    finally:
+        # Always drop the registry entry, even if the handler failed
+        if connection is not None:
+            manager.unregister(connection.id)
 
 @router.get("/logs/{agent_id}", response_model=List[ConversationResponse])
 async def get_chat_logs(
     agent_id: str,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_user)
 ):
-    """Get chat conversation history for an agent"""
+    """Get a page of chat conversations for an agent, newest first"""
     try:
         # Verify agent ownership
-        agent = await db.get_agent(agent_id, current_user.id)
+        agent = await services.db.get_agent(agent_id, current_user.id)
         if not agent:
             raise HTTPException(status_code=404, detail="Agent not found")
         
-        conversations = await db.get_conversations(agent_id)
-        return [ConversationResponse(**conv) for conv in conversations]
+        page = await services.db.get_conversations(agent_id, limit, cursor)
+        result = trusted_response(ConversationResponse, page.items)
+        set_next_cursor(result, page)
+        return result
     except HTTPException:
         raise
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error getting chat logs: {e}")
         raise HTTPException(status_code=500, detail="Failed to get chat logs")
@@ -168,12 +452,18 @@ async def get_chat_logs(
 @router.get("/conversations/{conversation_id}/messages", response_model=List[ChatMessage])
 async def get_conversation_messages(
     conversation_id: str,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_user)
 ):
-    """Get messages for a specific conversation"""
+    """Get a page of messages for a specific conversation, oldest first"""
     try:
-        messages = await db.get_conversation_messages(conversation_id, current_user.id)
-        return [ChatMessage(**msg) for msg in messages]
+        page = await services.db.get_conversation_messages(conversation_id, current_user.id, limit, cursor)
+        result = trusted_response(ChatMessage, page.items)
+        set_next_cursor(result, page)
+        return result
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error getting conversation messages: {e}")
         raise HTTPException(status_code=500, detail="Failed to get messages") 
\ No newline at end of file
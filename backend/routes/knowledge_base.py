@@ -1,13 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Request, UploadFile, File, Query
+from collections import Counter
+from contextlib import contextmanager
+from typing import List, Optional
+import asyncio
 import logging
 import re
 
+from ..admission import ConcurrencyLimit, RateLimit, RateLimited
 from ..auth import get_current_user, User
-from ..models import KBChunkResponse
-from ..database import DatabaseManager
-from ..embedding_service import EmbeddingService
-from ..pdf_parser import PDFParser
+from ..config import settings
+from ..models import KBChunkDeleteRequest, KBChunkResponse
+from ..metrics import ERRORS, registry
+from ..pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, InvalidCursor, set_next_cursor
+from ..serialization import trusted_response
+from ..services import services
 
 logger = logging.getLogger(__name__)
 
@@ -32,97 +38,242 @@ def _sanitize_text_content(text: str) -> str:
     
     return text
 
-router = APIRouter(prefix="/agents/{agent_id}/kb", tags=["knowledge-base"])
+MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+MAX_BULK_FILES = 20
+# Multipart boundaries and part headers on top of each file's bytes
+MULTIPART_OVERHEAD = 64 * 1024
+
+# Request body caps for BodySizeLimitMiddleware, enforced before and while
+# the body is received
+UPLOAD_BODY_LIMITS = [
+    (r"^/agents/[^/]+/kb/upload$", MAX_FILE_SIZE + MULTIPART_OVERHEAD),
+    (r"^/agents/[^/]+/kb/upload/bulk$", MAX_BULK_FILES * (MAX_FILE_SIZE + MULTIPART_OVERHEAD)),
+]
+
+# Admission control for uploads, shared by every request in this worker
+upload_rate = RateLimit(
+    "upload_mb",
+    settings.upload_mb_per_minute_per_user,
+    settings.upload_mb_per_minute_per_agent
+)
+ingestions = ConcurrencyLimit(
+    "ingestions",
+    settings.ingestion_concurrent_per_user,
+    settings.ingestion_concurrent_per_agent
+)
+registry.gauge("kb_ingestions_in_flight", "KB uploads currently being parsed, embedded or stored",
+               lambda: ingestions.in_flight)
+
+@contextmanager
+def _upload_admission(request: Request, user_id: str, agent_id: str):
+    """Hold an ingestion slot and charge the upload to the MB/min buckets; 429 when over a limit.
+
+    The size comes from Content-Length; without one the request is charged
+    as one maximum-size file.
+    """
+    try:
+        ingestions.acquire(user_id, agent_id)
+    except RateLimited as e:
+        raise HTTPException(status_code=429, detail=str(e), headers=e.retry_after_header())
+    try:
+        size = int(request.headers.get("content-length") or MAX_FILE_SIZE)
+        try:
+            upload_rate.take(user_id, agent_id, size / (1024 * 1024))
+        except RateLimited as e:
+            raise HTTPException(status_code=429, detail=str(e), headers=e.retry_after_header())
+        yield
+    finally:
+        ingestions.release(user_id, agent_id)
+
+def _check_upload(file: UploadFile):
+    """Check an upload's name and size without reading it"""
+    if not file.filename:
+        raise HTTPException(status_code=400, detail="No filename provided")
+    
+    # Starlette counts the bytes as it spools each file
+    if file.size is not None and file.size > MAX_FILE_SIZE:
+        raise HTTPException(status_code=400, detail="File too large (max 10MB)")
 
-# Initialize services
-db = DatabaseManager()
-embedding_service = EmbeddingService()
-pdf_parser = PDFParser()
+async def _parse_upload(file: UploadFile) -> List[str]:
+    """Extract text chunks from a PDF or text upload.
+
+    Uploads arrive spooled (in memory up to 1MB, on disk beyond), and PDFs
+    are parsed straight from the spooled file instead of a copy in memory.
+    """
+    _check_upload(file)
+    file_name = file.filename
+    if file_name.lower().endswith('.pdf'):
+        logger.debug(f"Processing PDF file: {file_name}")
+        text_chunks = await services.pdf_parser.parse_pdf(file.file)
+    elif file_name.lower().endswith(('.txt', '.md')):
+        logger.debug(f"Processing text file: {file_name}")
+        # Sanitize text content
+        try:
+            await file.seek(0)
+            raw_text = (await file.read()).decode('utf-8')
+            clean_text = _sanitize_text_content(raw_text)
+            text_chunks = [clean_text] if clean_text else []
+        except UnicodeDecodeError:
+            raise HTTPException(status_code=400, detail="File encoding not supported")
+    else:
+        raise HTTPException(status_code=400, detail="Unsupported file type. Only PDF and text files are supported.")
+    
+    if not text_chunks:
+        raise HTTPException(status_code=400, detail="No text content could be extracted from the file")
+    return text_chunks
+
+router = APIRouter(prefix="/agents/{agent_id}/kb", tags=["knowledge-base"])
 
 @router.post("/upload")
 async def upload_kb_file(
     agent_id: str,
+    request: Request,
     file: UploadFile = File(...),
     current_user: User = Depends(get_current_user)
 ):
     """Upload and process a knowledge base file"""
     try:
         # Verify agent ownership
-        agent = await db.get_agent(agent_id, current_user.id)
+        agent = await services.db.get_agent(agent_id, current_user.id)
         if not agent:
             raise HTTPException(status_code=404, detail="Agent not found")
         
-        # Validate file
-        if not file.filename:
-            raise HTTPException(status_code=400, detail="No filename provided")
-        
-        # Check file size (limit to 10MB)
-        MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
-        content = await file.read()
-        if len(content) > MAX_FILE_SIZE:
-            raise HTTPException(status_code=400, detail="File too large (max 10MB)")
-        
-        # Parse content based on file type
-        if file.filename.lower().endswith('.pdf'):
-            print(f"[AGENTIC DEBUG] Processing PDF file: {file.filename}")
-            text_chunks = await pdf_parser.parse_pdf(content)
-        elif file.filename.lower().endswith(('.txt', '.md')):
-            print(f"[AGENTIC DEBUG] Processing text file: {file.filename}")
-            # Sanitize text content
-            try:
-                raw_text = content.decode('utf-8')
-                clean_text = _sanitize_text_content(raw_text)
-                text_chunks = [clean_text] if clean_text else []
-            except UnicodeDecodeError:
-                raise HTTPException(status_code=400, detail="File encoding not supported")
-        else:
-            raise HTTPException(status_code=400, detail="Unsupported file type. Only PDF and text files are supported.")
-        
-        if not text_chunks:
-            raise HTTPException(status_code=400, detail="No text content could be extracted from the file")
-        
-        print(f"[AGENTIC DEBUG] Extracted {len(text_chunks)} text chunks")
-        
-        # Generate embeddings for chunks
-        embeddings = await embedding_service.generate_embeddings(text_chunks)
-        print(f"[AGENTIC DEBUG] Generated embeddings for {len(embeddings)} chunks")
-        
-        # Store in database
-        kb_file = await db.create_kb_file(agent_id, file.filename, "")
-        chunks = await db.create_kb_chunks(agent_id, text_chunks, embeddings)
+        with _upload_admission(request, current_user.id, agent_id):
+            # Validate and parse the file
+            text_chunks = await _parse_upload(file)
         
-        return {
-            "message": "File uploaded and processed successfully",
-            "file_id": kb_file["id"],
-            "chunks_created": len(chunks)
-        }
+            logger.debug(f"Extracted {len(text_chunks)} text chunks from {file.filename}")
+        
+            # Generate embeddings for chunks with the model the agent searches with
+            embedding_service = services.embedding_service_for(agent.get("embedding_model"))
+            embeddings = await embedding_service.generate_embeddings(text_chunks)
+            logger.info(f"Generated embeddings for {len(embeddings)} chunks from 1 file")
+        
+            # Store in database
+            kb_file = await services.db.create_kb_file(agent_id, file.filename, "")
+            chunks = await services.db.create_kb_chunks(
+                agent_id, text_chunks, embeddings, [kb_file["id"]] * len(text_chunks),
+                embedding_model=embedding_service.model_name
+            )
+        
+            return {
+                "message": "File uploaded and processed successfully",
+                "file_id": kb_file["id"],
+                "chunks_created": len(chunks)
+            }
     except HTTPException:
         raise
     except ValueError as ve:
         logger.error(f"Validation error uploading KB file: {ve}")
         raise HTTPException(status_code=400, detail=str(ve))
     except Exception as e:
+        ERRORS.inc(stage="kb_upload")
         logger.error(f"Error uploading KB file: {e}")
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Failed to upload file: {str(e)}")
 
+@router.post("/upload/bulk")
+async def upload_kb_files(
+    agent_id: str,
+    request: Request,
+    files: List[UploadFile] = File(...),
+    current_user: User = Depends(get_current_user)
+):
+    """Upload and process several knowledge base files in one request.
+
+    Files are parsed in parallel, their chunks are embedded together in
+    shared batches, and all file records and chunks are stored with one
+    insert each. Files that cannot be parsed are listed under ``failed``
+    and do not stop the others.
+    """
+    try:
+        # Verify agent ownership
+        agent = await services.db.get_agent(agent_id, current_user.id)
+        if not agent:
+            raise HTTPException(status_code=404, detail="Agent not found")
+        
+        if len(files) > MAX_BULK_FILES:
+            raise HTTPException(status_code=400, detail=f"Too many files (max {MAX_BULK_FILES})")
+        
+        with _upload_admission(request, current_user.id, agent_id):
+            results = await asyncio.gather(*(_parse_upload(file) for file in files), return_exceptions=True)
+        
+            parsed = []
+            failed = []
+            for file, result in zip(files, results):
+                if isinstance(result, HTTPException):
+                    failed.append({"file_name": file.filename, "error": result.detail})
+                elif isinstance(result, Exception):
+                    logger.warning(f"Error parsing KB file {file.filename}: {result}")
+                    failed.append({"file_name": file.filename, "error": "Failed to parse file"})
+                else:
+                    parsed.append((file.filename, result))
+        
+            if not parsed:
+                raise HTTPException(status_code=400, detail="No text content could be extracted from any file")
+        
+            # One embedding pass over every file's chunks
+            contents = [chunk for _, text_chunks in parsed for chunk in text_chunks]
+            embedding_service = services.embedding_service_for(agent.get("embedding_model"))
+            embeddings = await embedding_service.generate_embeddings(contents)
+            logger.info(f"Generated embeddings for {len(embeddings)} chunks from {len(parsed)} files")
+        
+            kb_files = await services.db.create_kb_files(agent_id, [file_name for file_name, _ in parsed])
+            file_ids = [
+                kb_file["id"]
+                for kb_file, (_, text_chunks) in zip(kb_files, parsed)
+                for _ in text_chunks
+            ]
+            chunks = await services.db.create_kb_chunks(
+                agent_id, contents, embeddings, file_ids, embedding_model=embedding_service.model_name
+            )
+            chunk_counts = Counter(chunk.get("file_id") for chunk in chunks)
+        
+            return {
+                "message": f"Processed {len(parsed)} of {len(files)} files",
+                "files": [
+                    {"file_name": kb_file["file_name"], "file_id": kb_file["id"], "chunks_created": chunk_counts[kb_file["id"]]}
+                    for kb_file in kb_files
+                ],
+                "failed": failed,
+                "chunks_created": len(chunks)
+            }
+    except HTTPException:
+        raise
+    except ValueError as ve:
+        logger.error(f"Validation error uploading KB files: {ve}")
+        raise HTTPException(status_code=400, detail=str(ve))
+    except Exception as e:
+        ERRORS.inc(stage="kb_upload")
+        logger.error(f"Error uploading KB files: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to upload files: {str(e)}")
+
 @router.get("/", response_model=List[KBChunkResponse])
 async def get_kb_chunks(
     agent_id: str,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_user)
 ):
-    """Get knowledge base chunks for an agent"""
+    """Get a page of knowledge base chunks for an agent.
+
+    Pass the X-Next-Cursor response header back as ``cursor`` for the next page.
+    """
     try:
         # Verify agent ownership
-        agent = await db.get_agent(agent_id, current_user.id)
+        agent = await services.db.get_agent(agent_id, current_user.id)
         if not agent:
             raise HTTPException(status_code=404, detail="Agent not found")
         
-        chunks = await db.get_kb_chunks(agent_id)
-        return [KBChunkResponse(**chunk) for chunk in chunks]
+        page = await services.db.get_kb_chunks(agent_id, limit, cursor)
+        result = trusted_response(KBChunkResponse, page.items)
+        set_next_cursor(result, page)
+        return result
     except HTTPException:
         raise
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error getting KB chunks: {e}")
         raise HTTPException(status_code=500, detail="Failed to get KB chunks")
@@ -137,12 +288,14 @@ async def search_kb(
     """Search knowledge base using vector similarity"""
     try:
         # Verify agent ownership
-        agent = await db.get_agent(agent_id, current_user.id)
+        agent = await services.db.get_agent(agent_id, current_user.id)
         if not agent:
             raise HTTPException(status_code=404, detail="Agent not found")
         
         # Search KB chunks
-        chunks = await db.search_kb_chunks(agent_id, query, limit)
+        chunks = await services.db.search_kb_chunks(
+            agent_id, query, limit, embedding_model=agent.get("embedding_model"), kb_version=agent.get("kb_version")
+        )
         
         return {
             "query": query,
@@ -164,16 +317,62 @@ async def delete_kb_chunk(
     """Delete a specific KB chunk"""
     try:
         # Verify agent ownership
-        agent = await db.get_agent(agent_id, current_user.id)
+        agent = await services.db.get_agent(agent_id, current_user.id)
         if not agent:
             raise HTTPException(status_code=404, detail="Agent not found")
         
-        # Delete chunk (this would need to be implemented in DatabaseManager)
-        # await db.delete_kb_chunk(chunk_id, agent_id)
+        if not await services.db.delete_kb_chunks(agent_id, [chunk_id]):
+            raise HTTPException(status_code=404, detail="KB chunk not found")
         
         return {"message": "KB chunk deleted successfully"}
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error deleting KB chunk: {e}")
-        raise HTTPException(status_code=500, detail="Failed to delete KB chunk") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Failed to delete KB chunk")
+
+@router.post("/chunks/delete")
+async def delete_kb_chunks(
+    agent_id: str,
+    request: KBChunkDeleteRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """Delete several KB chunks by id; ids that do not exist are ignored"""
+    try:
+        # Verify agent ownership
+        agent = await services.db.get_agent(agent_id, current_user.id)
+        if not agent:
+            raise HTTPException(status_code=404, detail="Agent not found")
+        
+        deleted = await services.db.delete_kb_chunks(agent_id, [str(chunk_id) for chunk_id in request.chunk_ids])
+        
+        return {"message": "KB chunks deleted successfully", "chunks_deleted": deleted}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error deleting KB chunks: {e}")
+        raise HTTPException(status_code=500, detail="Failed to delete KB chunks")
+
+@router.delete("/files/{file_id}")
+async def delete_kb_file(
+    agent_id: str,
+    file_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Delete an uploaded file and every chunk extracted from it"""
+    try:
+        # Verify agent ownership
+        agent = await services.db.get_agent(agent_id, current_user.id)
+        if not agent:
+            raise HTTPException(status_code=404, detail="Agent not found")
+        
+        deleted = await services.db.delete_kb_file(agent_id, file_id)
+        if deleted is None:
+            raise HTTPException(status_code=404, detail="KB file not found")
+        
+        return {"message": "KB file deleted successfully", "chunks_deleted": deleted}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error deleting KB file: {e}")
+        raise HTTPException(status_code=500, detail="Failed to delete KB file") 
\ No newline at end of file
@@ -0,0 +1,63 @@
+import json
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Tuple, Type, Union
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # falls back to the stdlib encoder
+    orjson = None
+
+if orjson is not None:
+    from fastapi.responses import ORJSONResponse as FastJSONResponse
+
+    def dumps(obj: Any) -> str:
+        return orjson.dumps(obj).decode("utf-8")
+
+    def dumps_bytes(obj: Any) -> bytes:
+        return orjson.dumps(obj)
+
+    loads = orjson.loads
+else:
+    FastJSONResponse = JSONResponse
+
+    def dumps(obj: Any) -> str:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+    def dumps_bytes(obj: Any) -> bytes:
+        return dumps(obj).encode("utf-8")
+
+    loads = json.loads
+
+
+@lru_cache(maxsize=None)
+def _field_defaults(model: Type[BaseModel]) -> Tuple[Tuple[str, Any], ...]:
+    return tuple(
+        (name, None if field.is_required() else field.get_default(call_default_factory=True))
+        for name, field in model.model_fields.items()
+    )
+
+
+def trusted_rows(model: Type[BaseModel], rows: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Shape rows from our own storage like ``model`` without validating them.
+
+    Storage rows already carry JSON-ready values, so building the model and
+    having FastAPI validate and dump it again is pure overhead on list
+    endpoints. Columns outside the model are dropped and missing optional
+    fields get their defaults, which gives the same keys the model would.
+    """
+    defaults = _field_defaults(model)
+    return [{name: row.get(name, default) for name, default in defaults} for row in rows]
+
+
+def trusted_response(model: Type[BaseModel], content: Union[Dict[str, Any], Iterable[Dict[str, Any]]]) -> FastJSONResponse:
+    """A ready-to-send response for one trusted row or a list of them (see ``trusted_rows``).
+
+    Returning a Response skips FastAPI's ``response_model`` pass; keep the
+    ``response_model`` on the route for the OpenAPI schema.
+    """
+    if isinstance(content, dict):
+        return FastJSONResponse(trusted_rows(model, [content])[0])
+    return FastJSONResponse(trusted_rows(model, content))
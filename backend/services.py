@@ -0,0 +1,143 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+class ServiceContainer:
+    """Lazily created, process-wide service singletons.
+
+    Nothing is constructed at import time: each service is built on first
+    access (or in ``warmup``) and shared by every router afterwards. Init
+    times are recorded for the startup profile.
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._instances: Dict[str, Any] = {}
+        self._lock = threading.RLock()
+        self.init_times: Dict[str, float] = {}
+
+    def register(self, name: str, factory: Callable[[], Any]):
+        self._factories[name] = factory
+
+    def get(self, name: str) -> Any:
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        with self._lock:
+            if name not in self._instances:
+                start = time.perf_counter()
+                self._instances[name] = self._factories[name]()
+                self.init_times[name] = time.perf_counter() - start
+                logger.info(f"Service {name} initialized in {self.init_times[name] * 1000:.1f}ms")
+            return self._instances[name]
+
+    def peek(self, name: str) -> Optional[Any]:
+        """Return a service only if it has already been created"""
+        return self._instances.get(name)
+
+    def warmup(self, names: Iterable[str]):
+        """Create the given services now and load the embedding model weights"""
+        for name in names:
+            self.get(name)
+            if name == "embedding_service":
+                start = time.perf_counter()
+                self.embedding_service.preload()
+                self.init_times["embedding_model"] = time.perf_counter() - start
+
+    def reset(self):
+        with self._lock:
+            self._instances.clear()
+            self.init_times.clear()
+
+    @property
+    def db(self):
+        return self.get("db")
+
+    @property
+    def auth_client(self):
+        return self.get("auth_client")
+
+    @property
+    def embedding_service(self):
+        return self.get("embedding_service")
+
+    def embedding_service_for(self, model_name: Optional[str]):
+        """The embedding service for an agent's model.
+
+        Agents that still search vectors from an earlier model (until their
+        re-embedding finishes) get a service for that model, created on
+        first use and running on torch.
+        """
+        if not model_name or model_name == settings.embedding_model:
+            return self.embedding_service
+        name = f"embedding_service:{model_name}"
+        with self._lock:
+            if name not in self._factories:
+                self.register(name, lambda: _create_embedding_service(model_name))
+        return self.get(name)
+
+    @property
+    def ollama_client(self):
+        return self.get("ollama_client")
+
+    @property
+    def pdf_parser(self):
+        return self.get("pdf_parser")
+
+    @property
+    def prompt_generator(self):
+        return self.get("prompt_generator")
+
+
+def _create_db():
+    from .database import DatabaseManager
+    return DatabaseManager(embedding_model=settings.embedding_model)
+
+def _create_auth_client():
+    # Anon key client used to verify user JWTs
+    from supabase import create_client
+    return create_client(settings.supabase_url, settings.supabase_anon_key)
+
+def _create_embedding_service(model_name: Optional[str] = None):
+    from .embedding_service import EmbeddingService
+    if model_name is not None:
+        return EmbeddingService(
+            model_name,
+            batch_tokens=settings.embedding_batch_tokens,
+            max_batch_size=settings.embedding_max_batch_size
+        )
+    return EmbeddingService(
+        settings.embedding_model,
+        backend=settings.embedding_backend,
+        onnx_dir=settings.embedding_onnx_dir,
+        quantized=settings.embedding_onnx_quantized,
+        threads=settings.embedding_threads,
+        batch_tokens=settings.embedding_batch_tokens,
+        max_batch_size=settings.embedding_max_batch_size
+    )
+
+def _create_ollama_client():
+    from .ollama_client import OllamaClient
+    return OllamaClient(settings.ollama_base_url, settings.ollama_model, settings.ollama_keep_alive)
+
+def _create_pdf_parser():
+    from .pdf_parser import PDFParser
+    return PDFParser()
+
+def _create_prompt_generator():
+    from .prompt_generation import SystemPromptGenerator
+    return SystemPromptGenerator(services.db, services.ollama_client)
+
+
+services = ServiceContainer()
+services.register("db", _create_db)
+services.register("auth_client", _create_auth_client)
+services.register("embedding_service", _create_embedding_service)
+services.register("ollama_client", _create_ollama_client)
+services.register("pdf_parser", _create_pdf_parser)
+services.register("prompt_generator", _create_prompt_generator)
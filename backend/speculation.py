@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Optional
+
+from .metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+# Speculative results older than this are not reused
+MAX_AGE_S = 60.0
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.split())
+
+
+class DraftRetriever:
+    """Speculative KB retrieval on what the user is still typing, per connection.
+
+    Each ``draft`` frame replaces the previous speculation. Retrieval starts
+    once a draft has been left alone for ``debounce_ms``, and its result is
+    kept until the next message. ``take`` hands it to the turn when the
+    message equals the draft or extends it by little enough that the draft
+    still covers ``min_coverage`` of it (whitespace is ignored), which takes
+    embedding and search off the time to first token. Anything else is
+    cancelled and the turn retrieves as usual.
+    """
+
+    def __init__(
+        self,
+        retrieve: Callable[[str], Awaitable[str]],
+        debounce_ms: int = 300,
+        min_chars: int = 8,
+        min_coverage: float = 0.8,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.retrieve = retrieve
+        self.debounce_s = debounce_ms / 1000
+        self.min_chars = min_chars
+        self.min_coverage = min_coverage
+        self.clock = clock
+        self.draft: Optional[str] = None
+        self.task: Optional[asyncio.Task] = None
+        # Set when the debounce is over and retrieval has started
+        self.started_at: Optional[float] = None
+
+    def update(self, draft: str):
+        """Speculate on a new draft, dropping the previous speculation"""
+        draft = _normalize(draft)
+        if len(draft) < self.min_chars or draft == self.draft:
+            return
+        self.cancel()
+        self.draft = draft
+        self.task = asyncio.create_task(self._speculate(draft))
+
+    async def _speculate(self, draft: str) -> Optional[str]:
+        await asyncio.sleep(self.debounce_s)
+        self.started_at = self.clock()
+        try:
+            return await self.retrieve(draft)
+        except Exception as e:
+            logger.warning(f"Speculative retrieval failed: {e}")
+            return None
+
+    def cancel(self):
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+        self.task = self.draft = self.started_at = None
+
+    def _covers(self, draft: str, message: str) -> bool:
+        return message.startswith(draft) and len(draft) >= self.min_coverage * len(message)
+
+    async def take(self, message: str) -> Optional[str]:
+        """The speculative context for ``message``, or None to retrieve normally"""
+        task, draft, started_at = self.task, self.draft, self.started_at
+        self.task = self.draft = self.started_at = None
+        if task is None:
+            return None
+
+        if not self._covers(draft, _normalize(message)):
+            result = "miss"
+        elif started_at is None:
+            # Still debouncing; retrieving now is faster than waiting
+            result = "pending"
+        elif self.clock() - started_at > MAX_AGE_S:
+            result = "stale"
+        else:
+            # Already running or done; either way it is ahead of a fresh retrieval
+            context = await task
+            CACHE_REQUESTS.inc(cache="draft_retrieval", result="hit" if context is not None else "error")
+            return context
+
+        task.cancel()
+        CACHE_REQUESTS.inc(cache="draft_retrieval", result=result)
+        return None
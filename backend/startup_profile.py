@@ -0,0 +1,78 @@
+import re
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+def profile_imports(module: str = "backend.main") -> List[Tuple[str, int, int]]:
+    """Import a module in a fresh interpreter with -X importtime.
+
+    Returns (module, self_us, cumulative_us) for every imported module.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    timings = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            timings.append((match.group(4), int(match.group(1)), int(match.group(2))))
+    return timings
+
+def profile_services(names: List[str]) -> Dict[str, float]:
+    """Import the app in this process and time each service's initialization"""
+    start = time.perf_counter()
+    import backend.main  # noqa: F401
+    from backend.services import services
+    app_import = time.perf_counter() - start
+
+    for name in names:
+        try:
+            services.warmup([name])
+        except Exception as e:
+            print(f"  {name} failed to initialize: {e}")
+    return {"import backend.main": app_import, **services.init_times}
+
+def print_report(
+    module: str = "backend.main",
+    services_to_init: Optional[List[str]] = None,
+    top: int = 25,
+    budget_ms: Optional[float] = None
+) -> bool:
+    """Print the slowest imports and per-service init times.
+
+    Returns False when the import of ``module`` exceeds ``budget_ms``.
+    """
+    timings = profile_imports(module)
+    total_us = max((cumulative for name, _, cumulative in timings if name == module), default=0)
+    within_budget = budget_ms is None or total_us / 1000 <= budget_ms
+
+    print(f"Import of {module}: {total_us / 1000:.1f}ms total")
+    if budget_ms is not None:
+        print(f"Import budget {budget_ms:.0f}ms: {'OK' if within_budget else 'EXCEEDED'}")
+    print(f"\nTop {top} modules by self time:")
+    print(f"{'self ms':>10}{'cumulative ms':>15}  module")
+    for name, self_us, cumulative_us in sorted(timings, key=lambda t: t[1], reverse=True)[:top]:
+        print(f"{self_us / 1000:>10.1f}{cumulative_us / 1000:>15.1f}  {name}")
+
+    print(f"\nTop-level packages by cumulative time:")
+    packages: Dict[str, int] = {}
+    for name, _, cumulative_us in timings:
+        root = name.split(".")[0]
+        if "." not in name:
+            packages[root] = max(packages.get(root, 0), cumulative_us)
+    for name, cumulative_us in sorted(packages.items(), key=lambda t: t[1], reverse=True)[:top]:
+        print(f"{cumulative_us / 1000:>10.1f}ms  {name}")
+
+    names = services_to_init or ["db", "auth_client", "ollama_client", "pdf_parser", "embedding_service"]
+    print(f"\nService initialization:")
+    for name, seconds in profile_services(names).items():
+        print(f"{seconds * 1000:>10.1f}ms  {name}")
+    return within_budget
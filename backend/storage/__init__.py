@@ -0,0 +1,21 @@
+from typing import Optional
+
+from .base import LEGACY_EMBEDDING_MODEL, Row, StorageBackend
+
+STORAGE_BACKENDS = ("supabase", "sqlite")
+
+def create_storage(backend: Optional[str] = None) -> StorageBackend:
+    """Build the storage backend named in settings (``STORAGE_BACKEND``)"""
+    from ..config import settings
+
+    backend = (backend or settings.storage_backend).lower()
+    # Imported lazily so each deployment only loads its own client library
+    if backend == "supabase":
+        from .supabase_backend import SupabaseStorage
+        return SupabaseStorage()
+    if backend == "sqlite":
+        from .sqlite_backend import SQLiteStorage
+        return SQLiteStorage(settings.sqlite_path)
+    raise ValueError(f"Unknown storage backend {backend!r}, expected one of {', '.join(STORAGE_BACKENDS)}")
+
+__all__ = ["LEGACY_EMBEDDING_MODEL", "Row", "StorageBackend", "STORAGE_BACKENDS", "create_storage"]
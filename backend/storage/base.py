@@ -0,0 +1,200 @@
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+
+from ..pagination import Cursor
+
+Row = Dict[str, Any]
+
+# Model that produced embeddings stored before chunks were tagged with one
+LEGACY_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+class StorageBackend(ABC):
+    """Persistence for agents, KB files and chunks, conversations and messages.
+
+    Rows are plain dicts shaped like the tables in supabase/schema.sql.
+    List methods take a ``limit`` and an ``after`` keyset cursor, a
+    (created_at, id) pair, and return rows strictly after it in list order.
+    Backends only store and fetch; sanitization, the local vector index and
+    the search fallbacks stay in ``DatabaseManager``.
+
+    Every chunk is tagged with the ``embedding_model`` that produced its
+    ``embedding``, and every agent with the model its searches use. When
+    the model changes, new vectors are staged next to the old ones
+    (``embedding_next``) and swapped in per agent by
+    ``switch_kb_chunk_embeddings``.
+
+    Agents also carry a ``kb_version`` that every change to their chunks
+    increments, so processes holding a local vector index can tell when
+    another process has changed the knowledge base under them.
+    """
+
+    name = ""
+    # Fixed width of the embedding column, or None when any width fits
+    embedding_dimensions: Optional[int] = None
+
+    async def initialize(self):
+        pass
+
+    async def close(self):
+        pass
+
+    # Agents
+    @abstractmethod
+    async def create_agent(self, agent: Row) -> Optional[Row]: ...
+
+    @abstractmethod
+    async def update_agent(self, agent_id: str, values: Row) -> Optional[Row]: ...
+
+    @abstractmethod
+    async def delete_agent(self, agent_id: str, user_id: str) -> bool:
+        """Delete the user's agent; its files, chunks, conversations and messages cascade"""
+
+    @abstractmethod
+    async def list_agents(self, user_id: str) -> List[Row]: ...
+
+    @abstractmethod
+    async def update_pending_prompts(self, prompt_status: str, created_before: str) -> List[str]:
+        """Set ``prompt_status`` on agents created before the timestamp whose prompt is still pending; their ids"""
+
+    @abstractmethod
+    async def get_agent(self, agent_id: str, user_id: str) -> Optional[Row]:
+        """The agent if it exists and belongs to the user"""
+
+    # Knowledge base
+    @abstractmethod
+    async def create_kb_file(self, kb_file: Row) -> Optional[Row]: ...
+
+    @abstractmethod
+    async def create_kb_files(self, kb_files: List[Row]) -> List[Row]:
+        """Insert file records in one batch, in order"""
+
+    @abstractmethod
+    async def delete_kb_file(self, agent_id: str, file_id: str) -> Optional[List[str]]:
+        """Delete a file and its chunks; the deleted chunk ids, or None if there was no such file"""
+
+    @abstractmethod
+    async def create_kb_chunks(self, chunks: List[Row]) -> List[Row]:
+        """Insert chunks (agent_id, content, embedding, optional file_id) in one batch"""
+
+    @abstractmethod
+    async def delete_kb_chunks(self, agent_id: str, chunk_ids: List[str]) -> List[str]:
+        """Delete the agent's chunks among ``chunk_ids``; the ids actually deleted"""
+
+    @abstractmethod
+    async def bump_kb_version(self, agent_id: str) -> Optional[int]:
+        """Increment the agent's ``kb_version`` after its chunks changed; the new value"""
+
+    @abstractmethod
+    async def list_kb_versions(self) -> Dict[str, int]:
+        """Every agent's ``kb_version``, by agent id"""
+
+    @abstractmethod
+    async def list_kb_chunks(
+        self,
+        agent_id: str,
+        limit: Optional[int] = None,
+        after: Optional[Cursor] = None
+    ) -> List[Row]:
+        """id, agent_id, content and created_at (no embeddings), ordered by (created_at, id)"""
+
+    @abstractmethod
+    async def match_kb_chunks(
+        self,
+        agent_id: str,
+        query_embedding: List[float],
+        threshold: float,
+        limit: int
+    ) -> List[Row]:
+        """Chunks by cosine similarity: id, agent_id, content, similarity"""
+
+    @abstractmethod
+    async def search_kb_chunks_text(self, agent_id: str, query: str, limit: int) -> List[Row]:
+        """Case-insensitive substring match on chunk content"""
+
+    @abstractmethod
+    async def page_kb_chunk_embeddings(self, offset: int, limit: int, agent_id: Optional[str] = None) -> List[Row]:
+        """One page of all chunks (or one agent's) with embeddings and embedding_model, ordered by id"""
+
+    # Re-embedding
+    @abstractmethod
+    async def list_agents_to_reindex(self, embedding_model: str) -> List[Row]:
+        """id, embedding_model and reindex_model of agents whose searches use another model"""
+
+    @abstractmethod
+    async def count_kb_chunks_to_reindex(self, agent_id: str, embedding_model: str) -> int:
+        """Chunks embedded with another model that have no staged embedding yet"""
+
+    @abstractmethod
+    async def list_kb_chunks_to_reindex(self, agent_id: str, embedding_model: str, limit: int) -> List[Row]:
+        """id and content of the first ``limit`` such chunks, ordered by id"""
+
+    @abstractmethod
+    async def stage_kb_chunk_embeddings(self, agent_id: str, embeddings: Dict[str, List[float]]) -> int:
+        """Store new embeddings by chunk id in ``embedding_next``; the number of chunks updated"""
+
+    @abstractmethod
+    async def clear_staged_embeddings(self, agent_id: str) -> None:
+        """Drop the agent's staged embeddings, e.g. from a migration to another model"""
+
+    @abstractmethod
+    async def switch_kb_chunk_embeddings(self, agent_id: str, embedding_model: str) -> int:
+        """Atomically move staged embeddings into place and point the agent at ``embedding_model``.
+
+        Chunks, agent and the cleared ``reindex_model`` change in one
+        transaction, so searches see either the old vectors or the new ones.
+        Returns the number of chunks switched.
+        """
+
+    # Conversations and messages
+    @abstractmethod
+    async def create_conversation(self, agent_id: str) -> Optional[Row]: ...
+
+    @abstractmethod
+    async def get_conversation(self, conversation_id: str) -> Optional[Row]:
+        """The conversation with its rolling ``summary`` and the (created_at, id)
+        of the last message folded into it (``summary_until_at``/``summary_until_id``,
+        None before the first summary)"""
+
+    @abstractmethod
+    async def update_conversation_summary(self, conversation_id: str, summary: str, until: Cursor) -> None:
+        """Store a new rolling summary covering the messages up to ``until``"""
+
+    @abstractmethod
+    async def list_conversations(
+        self,
+        agent_id: str,
+        limit: Optional[int] = None,
+        after: Optional[Cursor] = None
+    ) -> List[Row]:
+        """Newest first by (created_at, id); ``after`` continues with older ones.
+
+        Rows include ``message_count`` and ``last_message_at`` (None without
+        messages), computed in the same query.
+        """
+
+    @abstractmethod
+    async def create_message(self, message: Row) -> Optional[Row]: ...
+
+    @abstractmethod
+    async def list_messages(
+        self,
+        conversation_id: str,
+        limit: Optional[int] = None,
+        after: Optional[Cursor] = None
+    ) -> List[Row]:
+        """Oldest first by (created_at, id)"""
+
+    @abstractmethod
+    async def list_recent_messages(self, conversation_id: str, limit: int) -> List[Row]:
+        """The newest ``limit`` messages, oldest first"""
+
+    @abstractmethod
+    async def list_conversation_messages(
+        self,
+        conversation_id: str,
+        user_id: str,
+        limit: Optional[int] = None,
+        after: Optional[Cursor] = None
+    ) -> List[Row]:
+        """Like ``list_messages``, but empty unless the user owns the conversation's
+        agent; the ownership check is part of the same query"""
@@ -0,0 +1,547 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from ..metrics import DB_QUERY_SECONDS
+from ..pagination import Cursor
+from ..tracing import span
+from ..vector_index import VectorIndex
+from .base import LEGACY_EMBEDDING_MODEL, Row, StorageBackend
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS agents (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    system_prompt TEXT NOT NULL,
+    prompt_status TEXT NOT NULL DEFAULT 'ready' CHECK (prompt_status IN ('pending', 'ready', 'fallback')),
+    created_at TEXT NOT NULL,
+    embedding_model TEXT NOT NULL DEFAULT '{LEGACY_EMBEDDING_MODEL}',
+    reindex_model TEXT,
+    kb_version INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS kb_files (
+    id TEXT PRIMARY KEY,
+    agent_id TEXT NOT NULL REFERENCES agents(id) ON DELETE CASCADE,
+    file_name TEXT NOT NULL,
+    file_url TEXT,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS kb_chunks (
+    id TEXT PRIMARY KEY,
+    agent_id TEXT NOT NULL REFERENCES agents(id) ON DELETE CASCADE,
+    content TEXT NOT NULL,
+    embedding BLOB,
+    created_at TEXT NOT NULL,
+    file_id TEXT REFERENCES kb_files(id) ON DELETE CASCADE,
+    embedding_model TEXT NOT NULL DEFAULT '{LEGACY_EMBEDDING_MODEL}',
+    embedding_next BLOB
+);
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    agent_id TEXT NOT NULL REFERENCES agents(id) ON DELETE CASCADE,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id TEXT PRIMARY KEY,
+    conversation_id TEXT NOT NULL REFERENCES conversations(id) ON DELETE CASCADE,
+    role TEXT CHECK (role IN ('user', 'agent')),
+    content TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_agents_user_id ON agents(user_id);
+CREATE INDEX IF NOT EXISTS idx_kb_chunks_agent_created ON kb_chunks(agent_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_conversations_agent_created ON conversations(agent_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_messages_conversation_created ON messages(conversation_id, created_at, id);
+"""
+
+# Columns added after the first release, applied to existing databases
+MIGRATIONS = [
+    ("kb_chunks", "file_id", "TEXT REFERENCES kb_files(id) ON DELETE CASCADE"),
+    ("agents", "embedding_model", f"TEXT NOT NULL DEFAULT '{LEGACY_EMBEDDING_MODEL}'"),
+    ("agents", "reindex_model", "TEXT"),
+    ("kb_chunks", "embedding_model", f"TEXT NOT NULL DEFAULT '{LEGACY_EMBEDDING_MODEL}'"),
+    ("kb_chunks", "embedding_next", "BLOB"),
+    ("conversations", "summary", "TEXT"),
+    ("conversations", "summary_until_at", "TEXT"),
+    ("conversations", "summary_until_id", "TEXT"),
+    ("agents", "kb_version", "INTEGER NOT NULL DEFAULT 0"),
+]
+INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_kb_chunks_file_id ON kb_chunks(file_id);
+CREATE INDEX IF NOT EXISTS idx_kb_chunks_agent_model ON kb_chunks(agent_id, embedding_model);
+"""
+
+AGENT_COLUMNS = "id, user_id, name, system_prompt, prompt_status, created_at, embedding_model, reindex_model, kb_version"
+CHUNK_COLUMNS = "id, agent_id, content, created_at"
+
+
+def _keyset(
+    sql: str,
+    params: list,
+    limit: Optional[int],
+    after: Optional[Cursor],
+    descending: bool = False,
+    table: str = ""
+):
+    """Append the cursor condition, (created_at, id) ordering and limit to a query.
+
+    ``table`` qualifies the columns when the query joins other tables.
+    """
+    prefix = f"{table}." if table else ""
+    if after is not None:
+        sql += f" AND ({prefix}created_at, {prefix}id) {'<' if descending else '>'} (?, ?)"
+        params = params + list(after)
+    direction = "DESC" if descending else "ASC"
+    sql += f" ORDER BY {prefix}created_at {direction}, {prefix}id {direction}"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params = params + [limit]
+    return sql, params
+
+
+def _now() -> str:
+    # Fixed width so timestamps sort correctly as text
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f+00:00")
+
+
+def _new_id() -> str:
+    return str(uuid.uuid4())
+
+
+def encode_embedding(embedding) -> Optional[bytes]:
+    """Store embeddings as raw float32 bytes (1.5 KB for 384 dims)"""
+    if embedding is None:
+        return None
+    return np.asarray(embedding, dtype=np.float32).tobytes()
+
+
+def decode_embedding(blob: Optional[bytes]) -> Optional[List[float]]:
+    if blob is None:
+        return None
+    return np.frombuffer(blob, dtype=np.float32).tolist()
+
+
+class SQLiteStorage(StorageBackend):
+    """Embedded SQLite database for single-box deployments and benchmarks.
+
+    The database runs in WAL mode so readers never wait for the writer.
+    Each worker thread gets its own connection, and sqlite3 keeps a cache
+    of prepared statements per connection, so the constant SQL below is
+    parsed once per thread. Chunks are inserted with ``executemany`` and
+    embeddings are stored as float32 BLOBs.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str = "data/app.db"):
+        self.path = path
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        # An in-memory database only exists on one connection, so share it
+        self._shared = path == ":memory:"
+        self._shared_lock = threading.Lock()
+
+        if not self._shared:
+            directory = os.path.dirname(os.path.abspath(path))
+            os.makedirs(directory, exist_ok=True)
+        self._migrate(self._connection())
+        logger.info(f"SQLite storage ready at {path}")
+
+    @staticmethod
+    def _migrate(connection: sqlite3.Connection):
+        connection.executescript(SCHEMA)
+        for table, column, definition in MIGRATIONS:
+            columns = {row["name"] for row in connection.execute(f"PRAGMA table_info({table})")}
+            if column not in columns:
+                connection.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        connection.executescript(INDEXES)
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, check_same_thread=False, cached_statements=256)
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA foreign_keys=ON")
+        connection.execute("PRAGMA busy_timeout=5000")
+        with self._connections_lock:
+            self._connections.append(connection)
+        return connection
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._shared:
+            if not self._connections:
+                self._connect()
+            return self._connections[0]
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = self._connect()
+        return connection
+
+    def _call(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        connection = self._connection()
+        if self._shared:
+            with self._shared_lock:
+                with connection:
+                    return fn(connection)
+        with connection:
+            return fn(connection)
+
+    async def _run(self, table: str, operation: str, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        """Run ``fn`` in a transaction on a worker thread; disk I/O stays off the event loop"""
+        with DB_QUERY_SECONDS.time(table=table, operation=operation), span(f"db.{table}.{operation}"):
+            return await asyncio.to_thread(self._call, fn)
+
+    async def close(self):
+        with self._connections_lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+    @staticmethod
+    def _rows(cursor: sqlite3.Cursor) -> List[Row]:
+        return [dict(row) for row in cursor.fetchall()]
+
+    @staticmethod
+    def _row(cursor: sqlite3.Cursor) -> Optional[Row]:
+        row = cursor.fetchone()
+        return dict(row) if row else None
+
+    # Agents
+    async def create_agent(self, agent: Row) -> Optional[Row]:
+        row = {
+            "id": _new_id(),
+            "prompt_status": "ready",
+            "created_at": _now(),
+            "embedding_model": LEGACY_EMBEDDING_MODEL,
+            "reindex_model": None,
+            "kb_version": 0,
+            **agent
+        }
+
+        def insert(db):
+            db.execute(
+                "INSERT INTO agents (id, user_id, name, system_prompt, prompt_status, created_at, embedding_model) "
+                "VALUES (:id, :user_id, :name, :system_prompt, :prompt_status, :created_at, :embedding_model)",
+                row
+            )
+            return row
+
+        return await self._run("agents", "insert", insert)
+
+    async def update_agent(self, agent_id: str, values: Row) -> Optional[Row]:
+        allowed = {"name", "system_prompt", "prompt_status", "reindex_model"}
+        columns = [column for column in values if column in allowed]
+        if not columns:
+            return None
+        assignments = ", ".join(f"{column} = :{column}" for column in columns)
+
+        def update(db):
+            db.execute(f"UPDATE agents SET {assignments} WHERE id = :agent_id", {**values, "agent_id": agent_id})
+            return self._row(db.execute(f"SELECT {AGENT_COLUMNS} FROM agents WHERE id = ?", (agent_id,)))
+
+        return await self._run("agents", "update", update)
+
+    async def update_pending_prompts(self, prompt_status: str, created_before: str) -> List[str]:
+        return await self._run("agents", "update", lambda db: [row[0] for row in db.execute(
+            "UPDATE agents SET prompt_status = ? WHERE prompt_status = 'pending' AND created_at < ? RETURNING id",
+            (prompt_status, created_before)
+        ).fetchall()])
+
+    async def delete_agent(self, agent_id: str, user_id: str) -> bool:
+        return await self._run("agents", "delete", lambda db: bool(db.execute(
+            "DELETE FROM agents WHERE id = ? AND user_id = ? RETURNING id", (agent_id, user_id)
+        ).fetchall()))
+
+    async def list_agents(self, user_id: str) -> List[Row]:
+        return await self._run("agents", "select", lambda db: self._rows(db.execute(
+            f"SELECT {AGENT_COLUMNS} FROM agents WHERE user_id = ? ORDER BY created_at", (user_id,)
+        )))
+
+    async def get_agent(self, agent_id: str, user_id: str) -> Optional[Row]:
+        return await self._run("agents", "select", lambda db: self._row(db.execute(
+            f"SELECT {AGENT_COLUMNS} FROM agents WHERE id = ? AND user_id = ?", (agent_id, user_id)
+        )))
+
+    # Knowledge base
+    async def create_kb_file(self, kb_file: Row) -> Optional[Row]:
+        row = {"id": _new_id(), "file_url": None, "created_at": _now(), **kb_file}
+
+        def insert(db):
+            db.execute(
+                "INSERT INTO kb_files (id, agent_id, file_name, file_url, created_at) "
+                "VALUES (:id, :agent_id, :file_name, :file_url, :created_at)",
+                row
+            )
+            return row
+
+        return await self._run("kb_files", "insert", insert)
+
+    async def create_kb_files(self, kb_files: List[Row]) -> List[Row]:
+        created_at = _now()
+        rows = [{"id": _new_id(), "file_url": None, "created_at": created_at, **kb_file} for kb_file in kb_files]
+
+        def insert(db):
+            db.executemany(
+                "INSERT INTO kb_files (id, agent_id, file_name, file_url, created_at) "
+                "VALUES (:id, :agent_id, :file_name, :file_url, :created_at)",
+                rows
+            )
+            return rows
+
+        return await self._run("kb_files", "insert", insert)
+
+    async def delete_kb_file(self, agent_id: str, file_id: str) -> Optional[List[str]]:
+        def delete(db):
+            chunk_ids = [row["id"] for row in db.execute(
+                "DELETE FROM kb_chunks WHERE agent_id = ? AND file_id = ? RETURNING id", (agent_id, file_id)
+            ).fetchall()]
+            if not db.execute(
+                "DELETE FROM kb_files WHERE id = ? AND agent_id = ? RETURNING id", (file_id, agent_id)
+            ).fetchall():
+                return None
+            return chunk_ids
+
+        return await self._run("kb_files", "delete", delete)
+
+    async def create_kb_chunks(self, chunks: List[Row]) -> List[Row]:
+        created_at = _now()
+        rows = [
+            {
+                "id": _new_id(),
+                "agent_id": chunk["agent_id"],
+                "file_id": chunk.get("file_id"),
+                "content": chunk["content"],
+                "created_at": created_at
+            }
+            for chunk in chunks
+        ]
+        params = [
+            (
+                row["id"], row["agent_id"], row["file_id"], row["content"], encode_embedding(chunk.get("embedding")),
+                chunk.get("embedding_model", LEGACY_EMBEDDING_MODEL), created_at
+            )
+            for row, chunk in zip(rows, chunks)
+        ]
+
+        def insert(db):
+            db.executemany(
+                "INSERT INTO kb_chunks (id, agent_id, file_id, content, embedding, embedding_model, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                params
+            )
+            return rows
+
+        return await self._run("kb_chunks", "insert", insert)
+
+    async def delete_kb_chunks(self, agent_id: str, chunk_ids: List[str]) -> List[str]:
+        # The ids travel as one JSON array parameter, so any number fits in one statement
+        return await self._run("kb_chunks", "delete", lambda db: [row["id"] for row in db.execute(
+            "DELETE FROM kb_chunks WHERE agent_id = ? AND id IN (SELECT value FROM json_each(?)) RETURNING id",
+            (agent_id, json.dumps(list(chunk_ids)))
+        ).fetchall()])
+
+    async def bump_kb_version(self, agent_id: str) -> Optional[int]:
+        def bump(db):
+            row = db.execute(
+                "UPDATE agents SET kb_version = kb_version + 1 WHERE id = ? RETURNING kb_version", (agent_id,)
+            ).fetchone()
+            return row[0] if row else None
+
+        return await self._run("agents", "update", bump)
+
+    async def list_kb_versions(self) -> Dict[str, int]:
+        return await self._run("agents", "select", lambda db: {
+            row["id"]: row["kb_version"] for row in db.execute("SELECT id, kb_version FROM agents")
+        })
+
+    async def list_kb_chunks(self, agent_id: str, limit: Optional[int] = None, after: Optional[Cursor] = None) -> List[Row]:
+        sql, params = _keyset(f"SELECT {CHUNK_COLUMNS} FROM kb_chunks WHERE agent_id = ?", [agent_id], limit, after)
+        return await self._run("kb_chunks", "select", lambda db: self._rows(db.execute(sql, params)))
+
+    async def match_kb_chunks(self, agent_id: str, query_embedding: List[float], threshold: float, limit: int) -> List[Row]:
+        def match(db):
+            # Chunks of another width (left over from a model change) cannot be compared
+            rows = db.execute(
+                "SELECT id, content, embedding FROM kb_chunks WHERE agent_id = ? AND length(embedding) = ?",
+                (agent_id, 4 * len(query_embedding))
+            ).fetchall()
+            if not rows:
+                return []
+            # One contiguous buffer, then a single matrix-vector product
+            matrix = np.frombuffer(b"".join(row["embedding"] for row in rows), dtype=np.float32)
+            index = VectorIndex()
+            index.set_agent(
+                agent_id,
+                [row["id"] for row in rows],
+                [row["content"] for row in rows],
+                matrix.reshape(len(rows), -1)
+            )
+            return index.search(agent_id, query_embedding, limit, threshold=threshold)
+
+        return await self._run("kb_chunks", "match", match)
+
+    async def search_kb_chunks_text(self, agent_id: str, query: str, limit: int) -> List[Row]:
+        pattern = "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        return await self._run("kb_chunks", "select", lambda db: self._rows(db.execute(
+            f"SELECT {CHUNK_COLUMNS} FROM kb_chunks WHERE agent_id = ? AND content LIKE ? ESCAPE '\\' LIMIT ?",
+            (agent_id, pattern, limit)
+        )))
+
+    async def page_kb_chunk_embeddings(self, offset: int, limit: int, agent_id: Optional[str] = None) -> List[Row]:
+        where, params = ("WHERE agent_id = ?", [agent_id]) if agent_id is not None else ("", [])
+
+        def page(db):
+            rows = self._rows(db.execute(
+                f"SELECT {CHUNK_COLUMNS}, embedding, embedding_model FROM kb_chunks {where} ORDER BY id LIMIT ? OFFSET ?",
+                params + [limit, offset]
+            ))
+            for row in rows:
+                row["embedding"] = decode_embedding(row["embedding"])
+            return rows
+
+        return await self._run("kb_chunks", "select", page)
+
+    # Re-embedding
+    async def list_agents_to_reindex(self, embedding_model: str) -> List[Row]:
+        return await self._run("agents", "select", lambda db: self._rows(db.execute(
+            "SELECT id, embedding_model, reindex_model FROM agents WHERE embedding_model != ? ORDER BY id",
+            (embedding_model,)
+        )))
+
+    async def count_kb_chunks_to_reindex(self, agent_id: str, embedding_model: str) -> int:
+        return await self._run("kb_chunks", "count", lambda db: db.execute(
+            "SELECT COUNT(*) FROM kb_chunks WHERE agent_id = ? AND embedding_model != ? AND embedding_next IS NULL",
+            (agent_id, embedding_model)
+        ).fetchone()[0])
+
+    async def list_kb_chunks_to_reindex(self, agent_id: str, embedding_model: str, limit: int) -> List[Row]:
+        return await self._run("kb_chunks", "select", lambda db: self._rows(db.execute(
+            "SELECT id, content FROM kb_chunks "
+            "WHERE agent_id = ? AND embedding_model != ? AND embedding_next IS NULL ORDER BY id LIMIT ?",
+            (agent_id, embedding_model, limit)
+        )))
+
+    async def stage_kb_chunk_embeddings(self, agent_id: str, embeddings: Dict[str, List[float]]) -> int:
+        params = [(encode_embedding(embedding), chunk_id, agent_id) for chunk_id, embedding in embeddings.items()]
+
+        def stage(db):
+            return db.executemany(
+                "UPDATE kb_chunks SET embedding_next = ? WHERE id = ? AND agent_id = ?", params
+            ).rowcount
+
+        return await self._run("kb_chunks", "stage", stage)
+
+    async def clear_staged_embeddings(self, agent_id: str) -> None:
+        await self._run("kb_chunks", "update", lambda db: db.execute(
+            "UPDATE kb_chunks SET embedding_next = NULL WHERE agent_id = ? AND embedding_next IS NOT NULL",
+            (agent_id,)
+        ))
+
+    async def switch_kb_chunk_embeddings(self, agent_id: str, embedding_model: str) -> int:
+        def switch(db):
+            # Both statements run in the transaction opened by _call
+            switched = db.execute(
+                "UPDATE kb_chunks SET embedding = embedding_next, embedding_next = NULL, embedding_model = ? "
+                "WHERE agent_id = ? AND embedding_next IS NOT NULL",
+                (embedding_model, agent_id)
+            ).rowcount
+            db.execute(
+                "UPDATE agents SET embedding_model = ?, reindex_model = NULL WHERE id = ?",
+                (embedding_model, agent_id)
+            )
+            return switched
+
+        return await self._run("kb_chunks", "switch", switch)
+
+    # Conversations and messages
+    async def create_conversation(self, agent_id: str) -> Optional[Row]:
+        row = {"id": _new_id(), "agent_id": agent_id, "created_at": _now()}
+
+        def insert(db):
+            db.execute("INSERT INTO conversations (id, agent_id, created_at) VALUES (:id, :agent_id, :created_at)", row)
+            return row
+
+        return await self._run("conversations", "insert", insert)
+
+    async def get_conversation(self, conversation_id: str) -> Optional[Row]:
+        return await self._run("conversations", "select", lambda db: self._row(db.execute(
+            "SELECT id, agent_id, created_at, summary, summary_until_at, summary_until_id "
+            "FROM conversations WHERE id = ?", (conversation_id,)
+        )))
+
+    async def update_conversation_summary(self, conversation_id: str, summary: str, until: Cursor) -> None:
+        await self._run("conversations", "update", lambda db: db.execute(
+            "UPDATE conversations SET summary = ?, summary_until_at = ?, summary_until_id = ? WHERE id = ?",
+            (summary, until[0], until[1], conversation_id)
+        ))
+
+    async def list_conversations(self, agent_id: str, limit: Optional[int] = None, after: Optional[Cursor] = None) -> List[Row]:
+        page_sql, params = _keyset(
+            "SELECT id, agent_id, created_at FROM conversations WHERE agent_id = ?", [agent_id], limit, after,
+            descending=True
+        )
+        # Aggregate only the conversations on this page
+        sql = (
+            "SELECT c.id, c.agent_id, c.created_at, COUNT(m.id) AS message_count, "
+            "MAX(m.created_at) AS last_message_at "
+            f"FROM ({page_sql}) c LEFT JOIN messages m ON m.conversation_id = c.id "
+            "GROUP BY c.id ORDER BY c.created_at DESC, c.id DESC"
+        )
+        return await self._run("conversations", "select", lambda db: self._rows(db.execute(sql, params)))
+
+    async def create_message(self, message: Row) -> Optional[Row]:
+        row = {"id": _new_id(), "created_at": _now(), **message}
+
+        def insert(db):
+            db.execute(
+                "INSERT INTO messages (id, conversation_id, role, content, created_at) "
+                "VALUES (:id, :conversation_id, :role, :content, :created_at)",
+                row
+            )
+            return row
+
+        return await self._run("messages", "insert", insert)
+
+    async def list_messages(self, conversation_id: str, limit: Optional[int] = None, after: Optional[Cursor] = None) -> List[Row]:
+        sql, params = _keyset(
+            "SELECT id, conversation_id, role, content, created_at FROM messages WHERE conversation_id = ?",
+            [conversation_id], limit, after
+        )
+        return await self._run("messages", "select", lambda db: self._rows(db.execute(sql, params)))
+
+    async def list_recent_messages(self, conversation_id: str, limit: int) -> List[Row]:
+        sql, params = _keyset(
+            "SELECT id, conversation_id, role, content, created_at FROM messages WHERE conversation_id = ?",
+            [conversation_id], limit, None, descending=True
+        )
+        rows = await self._run("messages", "select", lambda db: self._rows(db.execute(sql, params)))
+        return rows[::-1]
+
+    async def list_conversation_messages(
+        self,
+        conversation_id: str,
+        user_id: str,
+        limit: Optional[int] = None,
+        after: Optional[Cursor] = None
+    ) -> List[Row]:
+        sql, params = _keyset(
+            "SELECT m.id, m.conversation_id, m.role, m.content, m.created_at FROM messages m "
+            "JOIN conversations c ON c.id = m.conversation_id "
+            "JOIN agents a ON a.id = c.agent_id "
+            "WHERE m.conversation_id = ? AND a.user_id = ?",
+            [conversation_id, user_id], limit, after, table="m"
+        )
+        return await self._run("messages", "select", lambda db: self._rows(db.execute(sql, params)))
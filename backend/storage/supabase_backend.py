@@ -0,0 +1,372 @@
+import asyncio
+import logging
+import os
+from typing import Dict, List, Optional
+
+from ..metrics import DB_QUERY_SECONDS
+from ..pagination import Cursor
+from ..tracing import span
+from .base import Row, StorageBackend
+
+logger = logging.getLogger(__name__)
+
+# Only the columns the list responses need; embeddings are never listed
+KB_CHUNK_COLUMNS = "id, agent_id, content, created_at"
+CONVERSATION_COLUMNS = "id, agent_id, created_at, summary, summary_until_at, summary_until_id"
+MESSAGE_COLUMNS = "id, conversation_id, role, content, created_at"
+# Inner-joined through the conversation to the owning agent, so rows only
+# come back for the agent's owner
+OWNED_MESSAGE_COLUMNS = MESSAGE_COLUMNS + ", conversations!inner(agents!inner(user_id))"
+
+# Ids per DELETE ... IN (...) request; keeps the query string well under URL limits
+DELETE_BATCH_SIZE = 200
+
+def _returning_ids(query):
+    """Have PostgREST return only the ids of the affected rows, not whole rows with embeddings"""
+    query.params = query.params.add("select", "id")
+    return query
+
+def _keyset(query, limit: Optional[int], after: Optional[Cursor], descending: bool = False):
+    """Order by (created_at, id), continue after a cursor and apply the limit"""
+    if after is not None:
+        created_at, row_id = after
+        op = "lt" if descending else "gt"
+        # Row-value comparison spelled out for PostgREST; values are quoted
+        # because timestamps contain reserved characters, and decode_cursor
+        # has checked they are a timestamp and a UUID
+        query = query.or_(
+            f'created_at.{op}."{created_at}",and(created_at.eq."{created_at}",id.{op}."{row_id}")'
+        )
+    query = query.order("created_at", desc=descending).order("id", desc=descending)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+class SupabaseStorage(StorageBackend):
+    """Tables in Supabase, reached through PostgREST"""
+
+    name = "supabase"
+    embedding_dimensions = 384  # kb_chunks.embedding is vector(384)
+
+    def __init__(self, url: Optional[str] = None, key: Optional[str] = None):
+        self.supabase_url = url or os.getenv("SUPABASE_URL")
+        self.supabase_key = key or os.getenv("SUPABASE_SERVICE_ROLE_KEY")  # Use service role for backend
+
+        if not self.supabase_url or not self.supabase_key:
+            raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set")
+
+        from supabase import create_client
+        self.client = create_client(self.supabase_url, self.supabase_key)
+
+    async def _execute(self, query, table: str, operation: str):
+        """Run a blocking Supabase query in a worker thread so the event loop stays free"""
+        with DB_QUERY_SECONDS.time(table=table, operation=operation), span(f"db.{table}.{operation}"):
+            return await asyncio.to_thread(query.execute)
+
+    @staticmethod
+    def _first(result) -> Optional[Row]:
+        return result.data[0] if result.data else None
+
+    async def create_agent(self, agent: Row) -> Optional[Row]:
+        result = await self._execute(self.client.table("agents").insert(agent), "agents", "insert")
+        return self._first(result)
+
+    async def update_agent(self, agent_id: str, values: Row) -> Optional[Row]:
+        result = await self._execute(
+            self.client.table("agents").update(values).eq("id", agent_id),
+            "agents",
+            "update"
+        )
+        return self._first(result)
+
+    async def update_pending_prompts(self, prompt_status: str, created_before: str) -> List[str]:
+        result = await self._execute(
+            _returning_ids(
+                self.client.table("agents")
+                .update({"prompt_status": prompt_status})
+                .eq("prompt_status", "pending")
+                .lt("created_at", created_before)
+            ),
+            "agents",
+            "update"
+        )
+        return [row["id"] for row in result.data]
+
+    async def delete_agent(self, agent_id: str, user_id: str) -> bool:
+        result = await self._execute(
+            _returning_ids(self.client.table("agents").delete().eq("id", agent_id).eq("user_id", user_id)),
+            "agents",
+            "delete"
+        )
+        return bool(result.data)
+
+    async def list_agents(self, user_id: str) -> List[Row]:
+        result = await self._execute(self.client.table("agents").select("*").eq("user_id", user_id), "agents", "select")
+        return result.data
+
+    async def get_agent(self, agent_id: str, user_id: str) -> Optional[Row]:
+        result = await self._execute(
+            self.client.table("agents").select("*").eq("id", agent_id).eq("user_id", user_id),
+            "agents",
+            "select"
+        )
+        return self._first(result)
+
+    async def create_kb_file(self, kb_file: Row) -> Optional[Row]:
+        result = await self._execute(self.client.table("kb_files").insert(kb_file), "kb_files", "insert")
+        return self._first(result)
+
+    async def create_kb_files(self, kb_files: List[Row]) -> List[Row]:
+        result = await self._execute(self.client.table("kb_files").insert(kb_files), "kb_files", "insert")
+        return result.data
+
+    async def delete_kb_file(self, agent_id: str, file_id: str) -> Optional[List[str]]:
+        # Chunks first, so their ids are known; the file row would cascade them away
+        chunks = await self._execute(
+            _returning_ids(self.client.table("kb_chunks").delete().eq("agent_id", agent_id).eq("file_id", file_id)),
+            "kb_chunks",
+            "delete"
+        )
+        kb_file = await self._execute(
+            _returning_ids(self.client.table("kb_files").delete().eq("id", file_id).eq("agent_id", agent_id)),
+            "kb_files",
+            "delete"
+        )
+        if not kb_file.data:
+            return None
+        return [row["id"] for row in chunks.data]
+
+    async def create_kb_chunks(self, chunks: List[Row]) -> List[Row]:
+        result = await self._execute(self.client.table("kb_chunks").insert(chunks), "kb_chunks", "insert")
+        return result.data
+
+    async def delete_kb_chunks(self, agent_id: str, chunk_ids: List[str]) -> List[str]:
+        deleted = []
+        for start in range(0, len(chunk_ids), DELETE_BATCH_SIZE):
+            result = await self._execute(
+                _returning_ids(
+                    self.client.table("kb_chunks")
+                    .delete()
+                    .eq("agent_id", agent_id)
+                    .in_("id", chunk_ids[start:start + DELETE_BATCH_SIZE])
+                ),
+                "kb_chunks",
+                "delete"
+            )
+            deleted.extend(row["id"] for row in result.data)
+        return deleted
+
+    async def bump_kb_version(self, agent_id: str) -> Optional[int]:
+        # An RPC, so the increment is atomic across processes
+        result = await self._execute(
+            self.client.rpc("bump_kb_version", {"p_agent_id": agent_id}),
+            "bump_kb_version",
+            "rpc"
+        )
+        return result.data
+
+    async def list_kb_versions(self) -> Dict[str, int]:
+        result = await self._execute(self.client.table("agents").select("id, kb_version"), "agents", "select")
+        return {row["id"]: row["kb_version"] for row in result.data}
+
+    async def list_kb_chunks(self, agent_id: str, limit: Optional[int] = None, after: Optional[Cursor] = None) -> List[Row]:
+        result = await self._execute(
+            _keyset(self.client.table("kb_chunks").select(KB_CHUNK_COLUMNS).eq("agent_id", agent_id), limit, after),
+            "kb_chunks",
+            "select"
+        )
+        return result.data
+
+    async def match_kb_chunks(self, agent_id: str, query_embedding: List[float], threshold: float, limit: int) -> List[Row]:
+        result = await self._execute(
+            self.client.rpc(
+                "match_kb_chunks",
+                {
+                    "query_embedding": query_embedding,
+                    "agent_id": agent_id,
+                    "match_threshold": threshold,
+                    "match_count": limit
+                }
+            ),
+            "match_kb_chunks",
+            "rpc"
+        )
+        return result.data
+
+    async def search_kb_chunks_text(self, agent_id: str, query: str, limit: int) -> List[Row]:
+        result = await self._execute(
+            self.client.table("kb_chunks").select(KB_CHUNK_COLUMNS).eq("agent_id", agent_id).ilike("content", f"%{query}%").limit(limit),
+            "kb_chunks",
+            "select"
+        )
+        return result.data
+
+    async def page_kb_chunk_embeddings(self, offset: int, limit: int, agent_id: Optional[str] = None) -> List[Row]:
+        query = self.client.table("kb_chunks").select(KB_CHUNK_COLUMNS + ", embedding, embedding_model")
+        if agent_id is not None:
+            query = query.eq("agent_id", agent_id)
+        result = await self._execute(query.order("id").range(offset, offset + limit - 1), "kb_chunks", "select")
+        return result.data
+
+    # Re-embedding
+    async def list_agents_to_reindex(self, embedding_model: str) -> List[Row]:
+        result = await self._execute(
+            self.client.table("agents")
+            .select("id, embedding_model, reindex_model")
+            .neq("embedding_model", embedding_model)
+            .order("id"),
+            "agents",
+            "select"
+        )
+        return result.data
+
+    def _chunks_to_reindex(self, columns: str, agent_id: str, embedding_model: str, **select_options):
+        return (
+            self.client.table("kb_chunks")
+            .select(columns, **select_options)
+            .eq("agent_id", agent_id)
+            .neq("embedding_model", embedding_model)
+            .is_("embedding_next", "null")
+        )
+
+    async def count_kb_chunks_to_reindex(self, agent_id: str, embedding_model: str) -> int:
+        result = await self._execute(
+            self._chunks_to_reindex("id", agent_id, embedding_model, count="exact").limit(1),
+            "kb_chunks",
+            "count"
+        )
+        return result.count or 0
+
+    async def list_kb_chunks_to_reindex(self, agent_id: str, embedding_model: str, limit: int) -> List[Row]:
+        result = await self._execute(
+            self._chunks_to_reindex("id, content", agent_id, embedding_model).order("id").limit(limit),
+            "kb_chunks",
+            "select"
+        )
+        return result.data
+
+    async def stage_kb_chunk_embeddings(self, agent_id: str, embeddings: Dict[str, List[float]]) -> int:
+        # One RPC per batch; PostgREST cannot update rows with different values otherwise
+        result = await self._execute(
+            self.client.rpc(
+                "stage_kb_chunk_embeddings",
+                {
+                    "p_agent_id": agent_id,
+                    "p_rows": [{"id": chunk_id, "embedding": embedding} for chunk_id, embedding in embeddings.items()]
+                }
+            ),
+            "stage_kb_chunk_embeddings",
+            "rpc"
+        )
+        return result.data or 0
+
+    async def clear_staged_embeddings(self, agent_id: str) -> None:
+        await self._execute(
+            _returning_ids(
+                self.client.table("kb_chunks")
+                .update({"embedding_next": None})
+                .eq("agent_id", agent_id)
+                .not_.is_("embedding_next", "null")
+            ),
+            "kb_chunks",
+            "update"
+        )
+
+    async def switch_kb_chunk_embeddings(self, agent_id: str, embedding_model: str) -> int:
+        # The function body runs in one transaction
+        result = await self._execute(
+            self.client.rpc("switch_kb_chunk_embeddings", {"p_agent_id": agent_id, "p_model": embedding_model}),
+            "switch_kb_chunk_embeddings",
+            "rpc"
+        )
+        return result.data or 0
+
+    async def create_conversation(self, agent_id: str) -> Optional[Row]:
+        result = await self._execute(
+            self.client.table("conversations").insert({"agent_id": agent_id}),
+            "conversations",
+            "insert"
+        )
+        return self._first(result)
+
+    async def get_conversation(self, conversation_id: str) -> Optional[Row]:
+        result = await self._execute(
+            self.client.table("conversations").select(CONVERSATION_COLUMNS).eq("id", conversation_id),
+            "conversations",
+            "select"
+        )
+        return self._first(result)
+
+    async def update_conversation_summary(self, conversation_id: str, summary: str, until: Cursor) -> None:
+        await self._execute(
+            self.client.table("conversations")
+            .update({"summary": summary, "summary_until_at": until[0], "summary_until_id": until[1]})
+            .eq("id", conversation_id),
+            "conversations",
+            "update"
+        )
+
+    async def list_conversations(self, agent_id: str, limit: Optional[int] = None, after: Optional[Cursor] = None) -> List[Row]:
+        params = {"p_agent_id": agent_id}
+        if limit is not None:
+            params["p_limit"] = limit
+        if after is not None:
+            params["p_after_created_at"], params["p_after_id"] = after
+        result = await self._execute(
+            self.client.rpc("list_conversations_with_stats", params),
+            "list_conversations_with_stats",
+            "rpc"
+        )
+        return result.data
+
+    async def create_message(self, message: Row) -> Optional[Row]:
+        result = await self._execute(self.client.table("messages").insert(message), "messages", "insert")
+        return self._first(result)
+
+    async def list_messages(self, conversation_id: str, limit: Optional[int] = None, after: Optional[Cursor] = None) -> List[Row]:
+        result = await self._execute(
+            _keyset(
+                self.client.table("messages").select(MESSAGE_COLUMNS).eq("conversation_id", conversation_id),
+                limit,
+                after
+            ),
+            "messages",
+            "select"
+        )
+        return result.data
+
+    async def list_recent_messages(self, conversation_id: str, limit: int) -> List[Row]:
+        result = await self._execute(
+            _keyset(
+                self.client.table("messages").select(MESSAGE_COLUMNS).eq("conversation_id", conversation_id),
+                limit,
+                None,
+                descending=True
+            ),
+            "messages",
+            "select"
+        )
+        return result.data[::-1]
+
+    async def list_conversation_messages(
+        self,
+        conversation_id: str,
+        user_id: str,
+        limit: Optional[int] = None,
+        after: Optional[Cursor] = None
+    ) -> List[Row]:
+        result = await self._execute(
+            _keyset(
+                self.client.table("messages")
+                .select(OWNED_MESSAGE_COLUMNS)
+                .eq("conversation_id", conversation_id)
+                .eq("conversations.agents.user_id", user_id),
+                limit,
+                after
+            ),
+            "messages",
+            "select"
+        )
+        for row in result.data:
+            row.pop("conversations", None)
+        return result.data
@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import struct
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from .serialization import dumps, dumps_bytes
+
+logger = logging.getLogger(__name__)
+
+try:
+    import msgpack
+except ImportError:  # msgpack framing is optional
+    msgpack = None
+
+# Frame type codes used by the length-prefixed binary framing
+BINARY_FRAME_TYPES = {
+    "token": 0x01,
+    "end": 0x02,
+    "error": 0x03,
+    "ping": 0x04,
+}
+BINARY_HEADER = struct.Struct("!BI")  # 1 byte type, 4 byte payload length
+
+
+class FrameEncoder:
+    """Encode outgoing WebSocket frames in the negotiated wire format"""
+
+    name = "json"
+    binary = False
+
+    def encode(self, frame: Dict[str, Any]):
+        return dumps(frame)
+
+
+class MsgpackFrameEncoder(FrameEncoder):
+    name = "msgpack"
+    binary = True
+
+    def encode(self, frame: Dict[str, Any]):
+        return msgpack.packb(frame, use_bin_type=True)
+
+
+class BinaryFrameEncoder(FrameEncoder):
+    """Length-prefixed frames: header (type, length) followed by the payload.
+
+    Token frames carry the raw UTF-8 text as payload, every other frame type
+    carries its JSON encoding so clients can still read the extra fields.
+    """
+
+    name = "binary"
+    binary = True
+
+    def encode(self, frame: Dict[str, Any]):
+        frame_type = frame.get("type")
+        if frame_type == "token":
+            payload = frame["content"].encode("utf-8")
+        else:
+            payload = dumps_bytes(frame)
+        code = BINARY_FRAME_TYPES.get(frame_type, 0x00)
+        return BINARY_HEADER.pack(code, len(payload)) + payload
+
+
+def negotiate_framing(requested: Optional[str], default: str = "json") -> FrameEncoder:
+    """Pick the frame encoder for a connection, falling back to JSON"""
+    name = (requested or default).lower()
+    if name == "msgpack":
+        if msgpack is None:
+            logger.warning("msgpack framing requested but msgpack is not installed, using json")
+            return FrameEncoder()
+        return MsgpackFrameEncoder()
+    if name == "binary":
+        return BinaryFrameEncoder()
+    return FrameEncoder()
+
+
+class FrameSender:
+    """Send encoded frames over a WebSocket using text or binary messages"""
+
+    def __init__(self, websocket, encoder: FrameEncoder):
+        self.websocket = websocket
+        self.encoder = encoder
+        self.frames_sent = 0
+
+    async def send(self, frame: Dict[str, Any]):
+        data = self.encoder.encode(frame)
+        if self.encoder.binary:
+            await self.websocket.send_bytes(data)
+        else:
+            await self.websocket.send_text(data)
+        self.frames_sent += 1
+
+
+class TokenCoalescer:
+    """Buffer streamed tokens and send them as one frame per interval or size.
+
+    A flush happens when the buffered text reaches ``flush_max_bytes`` or when
+    ``flush_interval_ms`` has passed since the first buffered token. Setting
+    both to 0 sends one frame per token. Call ``close`` before sending the
+    end frame, so a timed flush cannot land after it.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[Dict[str, Any]], Awaitable[None]],
+        flush_interval_ms: int = 25,
+        flush_max_bytes: int = 512,
+    ):
+        self._send = send
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.flush_max_bytes = flush_max_bytes
+        self._buffer: List[str] = []
+        self._buffered_bytes = 0
+        self._first_token_at: Optional[float] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # Held here because the event loop only keeps weak references to tasks
+        self._flush_task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self.tokens_buffered = 0
+
+    async def add(self, token: str):
+        if not token:
+            return
+        self._buffer.append(token)
+        self._buffered_bytes += len(token.encode("utf-8"))
+        self.tokens_buffered += 1
+
+        if self._first_token_at is None:
+            self._first_token_at = time.monotonic()
+            if self.flush_interval > 0:
+                # Make sure a slow token stream still gets flushed on time
+                loop = asyncio.get_running_loop()
+                self._timer = loop.call_later(self.flush_interval, self._on_timer)
+
+        if (
+            self._buffered_bytes >= self.flush_max_bytes
+            or time.monotonic() - self._first_token_at >= self.flush_interval
+        ):
+            await self.flush()
+
+    def _on_timer(self):
+        self._timer = None
+        if self._buffer and self._flush_task is None:
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_from_timer())
+
+    async def _flush_from_timer(self):
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.warning(f"Timed token flush failed: {e}")
+        finally:
+            self._flush_task = None
+
+    async def close(self):
+        """Send what is still buffered once any timed flush has finished"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._flush_task is not None:
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        await self.flush()
+
+    async def flush(self):
+        async with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._buffer:
+                return
+            content = "".join(self._buffer)
+            self._buffer = []
+            self._buffered_bytes = 0
+            self._first_token_at = None
+            await self._send({"type": "token", "content": content})
@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import time
+from typing import Callable, Optional, Set
+
+from .metrics import ERRORS, SUMMARIZED_MESSAGES
+
+logger = logging.getLogger(__name__)
+
+# How often a queued summary checks whether chat generations have finished
+IDLE_POLL_S = 0.5
+
+
+class ConversationSummarizer:
+    """Rolling conversation summaries, maintained in the background.
+
+    After each turn the conversation is queued. The worker folds the
+    messages not yet summarized, except the newest ``keep_messages``, into
+    the stored summary once at least ``batch_messages`` of them are due.
+    Prompts then carry the summary plus fewer than ``keep_messages +
+    batch_messages`` recent messages, however long the conversation gets.
+
+    The work is low priority: one summary runs at a time, and before
+    calling the model the worker waits (up to ``max_wait_s``) until
+    ``busy()`` reports no chat generation in flight.
+    """
+
+    def __init__(
+        self,
+        keep_messages: int = 6,
+        batch_messages: int = 4,
+        max_messages: int = 40,
+        max_wait_s: float = 30.0,
+        busy: Callable[[], bool] = lambda: False
+    ):
+        self.keep_messages = keep_messages
+        self.batch_messages = max(1, batch_messages)
+        self.max_messages = max_messages
+        self.max_wait_s = max_wait_s
+        self.busy = busy
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.pending: Set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def schedule(self, db, ollama_client, conversation_id: str):
+        """Queue a conversation for summarizing; already queued ones are not queued twice"""
+        if conversation_id in self.pending:
+            return
+        self.pending.add(conversation_id)
+        self.queue.put_nowait((db, ollama_client, conversation_id))
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._worker())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _wait_until_idle(self):
+        deadline = time.monotonic() + self.max_wait_s
+        while self.busy() and time.monotonic() < deadline:
+            await asyncio.sleep(IDLE_POLL_S)
+
+    async def _worker(self):
+        while True:
+            db, ollama_client, conversation_id = await self.queue.get()
+            await self._wait_until_idle()
+            # Turns that end while this summary runs queue the next pass
+            self.pending.discard(conversation_id)
+            try:
+                await self.summarize(db, ollama_client, conversation_id)
+            except Exception as e:
+                ERRORS.inc(stage="summary")
+                logger.error(f"Summarizing conversation {conversation_id} failed: {e}")
+
+    async def summarize(self, db, ollama_client, conversation_id: str) -> int:
+        """Fold the messages that are due into the summary; returns how many were folded"""
+        conversation = await db.storage.get_conversation(conversation_id)
+        if not conversation:
+            return 0
+        until = None
+        if conversation.get("summary_until_id"):
+            until = (conversation["summary_until_at"], conversation["summary_until_id"])
+
+        rows = await db.storage.list_messages(conversation_id, self.keep_messages + self.max_messages, until)
+        due = rows[:max(0, len(rows) - self.keep_messages)]
+        if len(due) < self.batch_messages:
+            return 0
+
+        started = time.perf_counter()
+        summary = await ollama_client.summarize_conversation(conversation.get("summary") or "", due)
+        last = due[-1]
+        await db.storage.update_conversation_summary(conversation_id, summary, (last["created_at"], last["id"]))
+        SUMMARIZED_MESSAGES.inc(len(due))
+        logger.info(
+            f"Folded {len(due)} messages into the summary of conversation {conversation_id} "
+            f"in {(time.perf_counter() - started) * 1000:.0f}ms"
+        )
+        return len(due)
+
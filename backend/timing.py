@@ -0,0 +1,41 @@
+import time
+import logging
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from .tracing import event, span
+
+logger = logging.getLogger(__name__)
+
+class StageTimer:
+    """Record wall-clock durations for the named stages of a request or turn"""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.durations: Dict[str, float] = {}
+        self.marks: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            with span(name):
+                yield
+        finally:
+            self.durations[name] = time.perf_counter() - start
+
+    def record(self, name: str, seconds: float):
+        self.durations[name] = seconds
+
+    def mark(self, name: str):
+        """Record the time elapsed since the timer started, e.g. time to first token"""
+        self.marks[name] = time.perf_counter() - self.started_at
+        event(name)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    def summary(self) -> str:
+        parts = [f"{name}={seconds * 1000:.1f}ms" for name, seconds in self.durations.items()]
+        parts += [f"{name}@{seconds * 1000:.1f}ms" for name, seconds in self.marks.items()]
+        return " ".join(parts)
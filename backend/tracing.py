@@ -0,0 +1,89 @@
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class Trace:
+    """Spans recorded for one HTTP request or one chat turn"""
+
+    def __init__(self, name: str, trace_id: Optional[str] = None):
+        self.name = name
+        self.trace_id = trace_id or uuid.uuid4().hex[:16]
+        self.started_at = time.perf_counter()
+        # (name, offset from trace start, duration); events have no duration
+        self.spans: List[Tuple[str, float, Optional[float]]] = []
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    def summary(self) -> str:
+        parts = []
+        for name, offset, duration in self.spans:
+            if duration is None:
+                parts.append(f"{name}@{offset * 1000:.1f}ms")
+            else:
+                parts.append(f"{name}={duration * 1000:.1f}ms")
+        return " ".join(parts)
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+
+def current_trace_id() -> Optional[str]:
+    trace = _current_trace.get()
+    return trace.trace_id if trace else None
+
+@contextmanager
+def start_trace(name: str, trace_id: Optional[str] = None, slow_threshold_ms: float = 0):
+    """Make a new trace current for the enclosed code and log it on exit.
+
+    Tasks created inside inherit the trace through contextvars. Traces slower
+    than ``slow_threshold_ms`` are logged at INFO, the rest at DEBUG.
+    """
+    trace = Trace(name, trace_id)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        total_ms = trace.elapsed() * 1000
+        level = logging.INFO if total_ms >= slow_threshold_ms else logging.DEBUG
+        if logger.isEnabledFor(level):
+            logger.log(level, f"trace {trace.name} {trace.summary()} total={total_ms:.1f}ms",
+                       extra={"trace_id": trace.trace_id})
+
+@contextmanager
+def span(name: str):
+    """Time the enclosed block as a span of the current trace (no-op without one)"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        trace.spans.append((name, start - trace.started_at, end - start))
+
+def event(name: str):
+    """Record a point in time, e.g. the first or last generated token"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.spans.append((name, trace.elapsed(), None))
+
+
+class TraceIdFilter(logging.Filter):
+    """Add ``trace_id`` to every log record so log formats can include it"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "trace_id"):
+            record.trace_id = current_trace_id() or "-"
+        return True
+
+def install_log_filter():
+    for handler in logging.getLogger().handlers:
+        handler.addFilter(TraceIdFilter())
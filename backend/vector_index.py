@@ -0,0 +1,393 @@
+import json
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Snapshot file suffixes for the prefilter stored alongside <agent_id>.npy
+PCA_SUFFIX = ".pca.npz"
+REDUCED_SUFFIX = ".reduced.npy"
+
+class Prefilter:
+    """PCA projection of one agent's embeddings for the first search stage.
+
+    ``reduced`` holds every chunk projected onto the top principal components
+    of that agent's embeddings. Dot products in that space rank chunks
+    almost like full cosine similarity, at a fraction of the cost. The query
+    is projected without centering: the mean only adds the same constant to
+    every score.
+    """
+
+    __slots__ = ("components", "offset", "reduced")
+
+    def __init__(self, components: np.ndarray, offset: np.ndarray, reduced: np.ndarray):
+        self.components = components  # (dims, full dims)
+        self.offset = offset  # mean projected onto the components
+        self.reduced = reduced  # (chunks, dims)
+
+    @classmethod
+    def fit(cls, embeddings: np.ndarray, dims: int, sample_size: int = 20000) -> "Prefilter":
+        rows = len(embeddings)
+        if rows > sample_size:
+            # Sorted so a memory-mapped matrix is read front to back
+            sample = np.sort(np.random.default_rng(0).choice(rows, sample_size, replace=False))
+            matrix = np.asarray(embeddings[sample])
+        else:
+            matrix = np.asarray(embeddings)
+        mean = matrix.mean(axis=0)
+        _, _, vt = np.linalg.svd(matrix - mean, full_matrices=False)
+        components = np.ascontiguousarray(vt[:dims], dtype=np.float32)
+        prefilter = cls(components, (mean @ components.T).astype(np.float32), np.zeros((0, dims), dtype=np.float32))
+        prefilter.reduced = prefilter.project(embeddings)
+        return prefilter
+
+    def project(self, embeddings: np.ndarray) -> np.ndarray:
+        # X @ C.T - mean @ C.T, without materializing a centered copy of X
+        return (np.asarray(embeddings) @ self.components.T - self.offset).astype(np.float32)
+
+    def select(self, rows: List[int]) -> "Prefilter":
+        return Prefilter(self.components, self.offset, self.reduced[rows])
+
+    def extend(self, embeddings: np.ndarray) -> "Prefilter":
+        return Prefilter(self.components, self.offset, np.concatenate([self.reduced, self.project(embeddings)]))
+
+
+class AgentIndex:
+    """Normalized embeddings and chunk metadata for one agent.
+
+    ``model`` is the embedding model the vectors came from (None if unknown)
+    and ``version`` the agent's ``kb_version`` they reflect (None if not
+    tracked).
+    """
+
+    __slots__ = ("ids", "contents", "embeddings", "prefilter", "model", "version")
+
+    def __init__(
+        self,
+        ids: List[str],
+        contents: List[str],
+        embeddings: np.ndarray,
+        prefilter: Optional[Prefilter] = None,
+        model: Optional[str] = None,
+        version: Optional[int] = None
+    ):
+        self.ids = ids
+        self.contents = contents
+        self.embeddings = embeddings
+        self.prefilter = prefilter
+        self.model = model
+        self.version = version
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def _normalize(embeddings) -> np.ndarray:
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class VectorIndex:
+    """In-process cosine-similarity index over KB chunk embeddings.
+
+    Snapshots live in a directory as ``<agent_id>.npy`` (float32, rows
+    L2-normalized) plus ``<agent_id>.json`` (chunk ids and contents). The
+    ``.npy`` files are opened memory-mapped and read-only, so pre-forked
+    workers and separate processes share the same physical pages through
+    the page cache. Chunks added at runtime are kept in process memory.
+
+    Agents with at least ``two_stage_min_chunks`` chunks are searched in
+    two stages when ``prefilter_dims`` is set. Every chunk is scored on a
+    per-agent PCA projection (see ``Prefilter``), and only the best
+    ``candidates`` are re-scored at full dimension. Snapshots can carry the
+    projection as ``<agent_id>.pca.npz`` plus ``<agent_id>.reduced.npy``;
+    otherwise it is fitted on load.
+
+    Under ``--prefork`` each worker holds its own copy, and only the worker
+    that changed a knowledge base applies the change. Agents therefore
+    carry the ``kb_version`` they reflect: callers pass the version from
+    the agent row to ``has_agent``, and ``advance`` drops an agent that
+    missed a change made by another process.
+    """
+
+    def __init__(self, prefilter_dims: int = 0, candidates: int = 256, two_stage_min_chunks: int = 10000):
+        self.agents: Dict[str, AgentIndex] = {}
+        self.directory: Optional[str] = None
+        self.configure(prefilter_dims, candidates, two_stage_min_chunks)
+
+    def configure(self, prefilter_dims: int = 0, candidates: int = 256, two_stage_min_chunks: int = 10000):
+        """Set up two-stage search; applies to agents loaded or set afterwards"""
+        self.prefilter_dims = prefilter_dims
+        self.candidates = candidates
+        self.two_stage_min_chunks = two_stage_min_chunks
+
+    def _with_prefilter(self, index: AgentIndex) -> AgentIndex:
+        """Fit a prefilter for an agent that is large enough and has none yet"""
+        if (
+            index.prefilter is None
+            and self.prefilter_dims
+            and len(index) >= self.two_stage_min_chunks
+            and self.prefilter_dims < index.embeddings.shape[1]
+        ):
+            index.prefilter = Prefilter.fit(index.embeddings, self.prefilter_dims)
+        return index
+
+    def has_agent(self, agent_id: str, model: Optional[str] = None, version: Optional[int] = None) -> bool:
+        """Whether the agent is loaded, with vectors from ``model`` and at
+        ``kb_version`` ``version`` when those are given"""
+        index = self.agents.get(agent_id)
+        if index is None:
+            return False
+        if version is not None and index.version is not None and index.version != version:
+            return False
+        return model is None or index.model is None or index.model == model
+
+    def advance(self, agent_id: str, version: Optional[int]) -> bool:
+        """Record that a change moved the agent's KB to ``version``.
+
+        Returns whether the change should be applied to the loaded agent.
+        An agent that was not at the version just before missed a change
+        from another process, so it is dropped and searches go to the
+        database instead.
+        """
+        index = self.agents.get(agent_id)
+        if index is None:
+            return False
+        if index.version is None:
+            return True
+        if version is not None and version == index.version + 1:
+            index.version = version
+            return True
+        logger.info(f"Local vector index for agent {agent_id} is out of date (v{index.version}, now v{version}); dropped")
+        self.drop_agent(agent_id)
+        return False
+
+    def load(self, directory: str, mmap: bool = True) -> int:
+        """Load every agent snapshot in a directory, returning the chunk count"""
+        total = 0
+        for file_name in sorted(os.listdir(directory)):
+            if not file_name.endswith(".npy") or file_name.endswith(REDUCED_SUFFIX):
+                continue
+            agent_id = file_name[:-4]
+            with open(os.path.join(directory, f"{agent_id}.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            embeddings = np.load(
+                os.path.join(directory, file_name),
+                mmap_mode="r" if mmap else None
+            )
+            prefilter = None
+            pca_path = os.path.join(directory, agent_id + PCA_SUFFIX)
+            if self.prefilter_dims and os.path.exists(pca_path):
+                with np.load(pca_path) as pca:
+                    components, offset = pca["components"], pca["offset"]
+                reduced = np.load(os.path.join(directory, agent_id + REDUCED_SUFFIX), mmap_mode="r" if mmap else None)
+                if reduced.shape[0] == len(meta["ids"]):
+                    prefilter = Prefilter(components, offset, reduced)
+                else:
+                    # Left over from an older snapshot; refitted below
+                    logger.warning(f"Ignoring stale prefilter for agent {agent_id}")
+            self.agents[agent_id] = self._with_prefilter(
+                AgentIndex(meta["ids"], meta["contents"], embeddings, prefilter, meta.get("model"), meta.get("version"))
+            )
+            total += len(meta["ids"])
+        self.directory = directory
+        logger.info(f"Loaded vector index for {len(self.agents)} agents ({total} chunks) from {directory}")
+        return total
+
+    def set_agent(
+        self,
+        agent_id: str,
+        ids: List[str],
+        contents: List[str],
+        embeddings,
+        model: Optional[str] = None,
+        version: Optional[int] = None
+    ):
+        self.agents[agent_id] = self._with_prefilter(
+            AgentIndex(list(ids), list(contents), _normalize(embeddings), model=model, version=version)
+        )
+
+    def add_chunks(self, agent_id: str, ids: List[str], contents: List[str], embeddings):
+        """Append chunks to a loaded agent; the mmap'd base is copied, never written"""
+        current = self.agents.get(agent_id)
+        if current is None:
+            return
+        new_rows = _normalize(embeddings)
+        # New chunks are projected with the existing components, not refitted
+        self.agents[agent_id] = self._with_prefilter(AgentIndex(
+            current.ids + list(ids),
+            current.contents + list(contents),
+            np.concatenate([current.embeddings, new_rows]) if len(current) else new_rows,
+            current.prefilter.extend(new_rows) if current.prefilter is not None else None,
+            current.model,
+            current.version
+        ))
+
+    def remove_chunks(self, agent_id: str, ids: List[str]) -> int:
+        """Drop chunks from a loaded agent, returning how many were removed"""
+        current = self.agents.get(agent_id)
+        if current is None or not ids:
+            return 0
+        removed = set(ids)
+        keep = [i for i, chunk_id in enumerate(current.ids) if chunk_id not in removed]
+        if len(keep) == len(current):
+            return 0
+        # Fancy indexing copies, so an mmap'd base is never written
+        self.agents[agent_id] = AgentIndex(
+            [current.ids[i] for i in keep],
+            [current.contents[i] for i in keep],
+            current.embeddings[keep],
+            current.prefilter.select(keep) if current.prefilter is not None else None,
+            current.model,
+            current.version
+        )
+        return len(current) - len(keep)
+
+    def drop_agent(self, agent_id: str):
+        self.agents.pop(agent_id, None)
+
+    def search(
+        self,
+        agent_id: str,
+        query_embedding: List[float],
+        limit: int = 5,
+        threshold: float = 0.0
+    ) -> List[Dict[str, Any]]:
+        """Return the top chunks by cosine similarity, shaped like match_kb_chunks rows"""
+        index = self.agents.get(agent_id)
+        if index is None or not len(index):
+            return []
+
+        query = _normalize(query_embedding)[0]
+        pool = max(self.candidates, limit)
+        if index.prefilter is not None and self.candidates and len(index) > pool:
+            # Stage 1: rank everything in the reduced space; stage 2: exact
+            # scores for the candidate pool only
+            coarse = index.prefilter.reduced @ (index.prefilter.components @ query)
+            candidates = np.sort(np.argpartition(-coarse, pool)[:pool])
+            candidate_scores = index.embeddings[candidates] @ query
+            best = _top_k(candidate_scores, limit)
+            top, top_scores = candidates[best], candidate_scores[best]
+        else:
+            scores = index.embeddings @ query
+            top = _top_k(scores, limit)
+            top_scores = scores[top]
+
+        return [
+            {
+                "id": index.ids[i],
+                "agent_id": agent_id,
+                "content": index.contents[i],
+                "similarity": float(score)
+            }
+            for i, score in zip(top, top_scores)
+            if score >= threshold
+        ]
+
+    @staticmethod
+    def write_snapshot(
+        directory: str,
+        agent_id: str,
+        ids: List[str],
+        contents: List[str],
+        embeddings,
+        prefilter_dims: int = 0,
+        model: Optional[str] = None,
+        version: Optional[int] = None
+    ):
+        """Write one agent's snapshot files (atomically replaced).
+
+        With ``prefilter_dims``, the PCA prefilter is fitted now and written
+        alongside, so loading does not have to fit it.
+        """
+        os.makedirs(directory, exist_ok=True)
+        matrix = _normalize(embeddings) if len(ids) else np.zeros((0, 0), dtype=np.float32)
+        npy_path = os.path.join(directory, f"{agent_id}.npy")
+        json_path = os.path.join(directory, f"{agent_id}.json")
+
+        pca_path = os.path.join(directory, agent_id + PCA_SUFFIX)
+        reduced_path = os.path.join(directory, agent_id + REDUCED_SUFFIX)
+        if prefilter_dims and len(ids) and prefilter_dims < matrix.shape[1]:
+            prefilter = Prefilter.fit(matrix, prefilter_dims)
+            with open(pca_path + ".tmp", "wb") as f:
+                np.savez(f, components=prefilter.components, offset=prefilter.offset)
+            with open(reduced_path + ".tmp", "wb") as f:
+                np.save(f, prefilter.reduced)
+            os.replace(pca_path + ".tmp", pca_path)
+            os.replace(reduced_path + ".tmp", reduced_path)
+        else:
+            # A prefilter from an earlier snapshot would not match these rows
+            for path in (pca_path, reduced_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+        with open(npy_path + ".tmp", "wb") as f:
+            np.save(f, matrix)
+        with open(json_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"ids": list(ids), "contents": list(contents), "model": model, "version": version}, f)
+        os.replace(json_path + ".tmp", json_path)
+        os.replace(npy_path + ".tmp", npy_path)
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    if k >= len(scores):
+        return np.argsort(-scores)
+    candidates = np.argpartition(-scores, k)[:k]
+    return candidates[np.argsort(-scores[candidates])]
+
+
+def parse_embedding(value) -> Optional[List[float]]:
+    """Embeddings come back from PostgREST as a list (JSONB) or a '[...]' string (pgvector)"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return json.loads(value)
+    return list(value)
+
+
+async def build_snapshot(db, directory: str, prefilter_dims: int = 0, two_stage_min_chunks: int = 0) -> int:
+    """Export every agent's KB chunks from the database into snapshot files.
+
+    Agents with at least ``two_stage_min_chunks`` chunks also get a
+    ``prefilter_dims`` PCA prefilter. Each snapshot keeps the chunks of the
+    agent's most common embedding model; chunks from another model are left
+    over from a model change and are skipped until they are re-embedded.
+    Each snapshot records the agent's ``kb_version`` from before the export,
+    so a change made while it runs makes the snapshot out of date rather
+    than silently missing.
+    """
+    versions = await db.storage.list_kb_versions()
+    by_agent: Dict[str, Dict[str, Dict[str, list]]] = {}
+    async for row in db.iter_kb_chunk_embeddings():
+        embedding = parse_embedding(row.get("embedding") or row.get("embedding_json"))
+        if embedding is None:
+            continue
+        models = by_agent.setdefault(row["agent_id"], {})
+        agent = models.setdefault(row.get("embedding_model"), {"ids": [], "contents": [], "embeddings": []})
+        agent["ids"].append(row["id"])
+        agent["contents"].append(row["content"])
+        agent["embeddings"].append(embedding)
+
+    total = 0
+    for agent_id, models in by_agent.items():
+        model, agent = max(models.items(), key=lambda item: len(item[1]["ids"]))
+        VectorIndex.write_snapshot(
+            directory, agent_id, agent["ids"], agent["contents"], agent["embeddings"],
+            prefilter_dims=prefilter_dims if len(agent["ids"]) >= two_stage_min_chunks else 0,
+            model=model,
+            version=versions.get(agent_id)
+        )
+        total += len(agent["ids"])
+    logger.info(f"Wrote vector index snapshot for {len(by_agent)} agents ({total} chunks) to {directory}")
+    return total
+
+
+# Shared process-wide index, loaded at startup or in the pre-fork master
+vector_index = VectorIndex()
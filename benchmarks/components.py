@@ -0,0 +1,538 @@
+#!/usr/bin/env python3
+"""
+Offline micro-benchmarks for the ingestion and retrieval hot paths:
+
+    pdf        PDFParser.parse_pdf on generated PDFs of several page counts
+    chunkers   PDFParser._split_text_into_chunks and EmbeddingService.chunk_text
+    sanitizers the three text sanitizers (parser, KB route, database)
+    embedding  EmbeddingService.generate_embeddings at several batch sizes, per
+               backend (torch, onnx int8, onnx fp32), in sentences/sec; and a
+               mixed-length upload (PDF chunks plus short notes) embedded with
+               length-bucketed batches vs one plain encode call
+    retrieval  VectorIndex.search over 1k/10k/100k synthetic chunks (or a real
+               snapshot with --index-dir), single-stage vs the two-stage PCA
+               prefilter at several candidate pools, with recall@10 of the
+               two-stage results against single-stage
+    serialization
+               list responses (Pydantic models + stdlib json vs trusted rows +
+               orjson), WebSocket frame encoding, gzip/brotli compression
+
+Nothing talks to Supabase or Ollama. Groups whose dependencies are missing
+(pypdf, numpy, fastapi, a cached embedding model) are reported as skipped.
+
+Results are written as JSON so runs can be compared across commits:
+
+    python -m benchmarks.components --output before.json
+    python -m benchmarks.components --output after.json --compare before.json
+    python -m benchmarks.components --only retrieval --quick
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+GROUPS = ("pdf", "chunkers", "sanitizers", "embedding", "retrieval", "serialization")
+
+WORDS = (
+    "the model retrieves relevant context from the knowledge base before answering "
+    "each question embeddings are normalized and compared by cosine similarity while "
+    "documents are split into overlapping chunks of roughly five hundred characters"
+).split()
+
+
+def make_text(rng: random.Random, words: int) -> str:
+    """Sentences of pseudo-random words, with a few control characters mixed in"""
+    parts = []
+    for i in range(words):
+        word = rng.choice(WORDS)
+        if i % 12 == 11:
+            word += rng.choice(".!?")
+        elif i % 97 == 0:
+            word += "\x0b"
+        parts.append(word)
+    return " ".join(parts)
+
+
+def make_pdf(pages: int, lines_per_page: int = 45, seed: int = 0) -> bytes:
+    """Build a minimal text PDF without third-party writers"""
+    rng = random.Random(seed)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_refs = []
+    for _ in range(pages):
+        lines = []
+        for _ in range(lines_per_page):
+            line = make_text(rng, 14).replace("\x0b", "")
+            lines.append("(" + line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ") '")
+        stream = ("BT /F1 10 Tf 12 TL 40 800 Td\n" + "\n".join(lines) + "\nET").encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_ref = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_ref
+        )
+        page_refs.append(len(objects))
+    kids = b" ".join(b"%d 0 R" % ref for ref in page_refs)
+    objects[1] = b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % pages
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def measure(fn, repeat: int, min_time: float = 0.05) -> dict:
+    """Median/min/mean milliseconds per call over ``repeat`` timed batches.
+
+    Each batch runs ``fn`` enough times to take at least ``min_time`` so
+    very fast calls are not dominated by timer resolution.
+    """
+    fn()  # warm caches and lazy imports
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= 2
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) / number * 1000)
+    return {
+        "median_ms": round(statistics.median(samples), 6),
+        "min_ms": round(min(samples), 6),
+        "mean_ms": round(statistics.fmean(samples), 6),
+        "calls_per_sample": number,
+        "samples": repeat,
+    }
+
+
+def run_sync(loop: asyncio.AbstractEventLoop, coro_fn):
+    return lambda: loop.run_until_complete(coro_fn())
+
+
+def result(group: str, name: str, params: dict, timing: dict, **extra) -> dict:
+    return {"group": group, "name": name, "params": params, **timing, **extra}
+
+
+def bench_pdf(loop, args):
+    from backend.pdf_parser import PDFParser
+    import pypdf  # noqa: F401 - skip the group early when it is missing
+
+    parser = PDFParser()
+    results = []
+    for pages in args.pdf_pages:
+        pdf = make_pdf(pages)
+        chunks = loop.run_until_complete(parser.parse_pdf(pdf))
+        timing = measure(run_sync(loop, lambda: parser.parse_pdf(pdf)), args.repeat)
+        results.append(result(
+            "pdf", "parse_pdf", {"pages": pages}, timing,
+            bytes=len(pdf), chunks=len(chunks),
+            pages_per_sec=round(pages / (timing["median_ms"] / 1000), 1)
+        ))
+    return results
+
+
+def bench_chunkers(loop, args):
+    from backend.embedding_service import EmbeddingService
+    from backend.pdf_parser import PDFParser
+
+    parser = PDFParser()
+    embedding_service = EmbeddingService()
+    results = []
+    for chars in args.text_sizes:
+        text = make_text(random.Random(chars), chars // 6)[:chars]
+        for name, chunker in (
+            ("pdf_parser.split_text_into_chunks", parser._split_text_into_chunks),
+            ("embedding_service.chunk_text", embedding_service.chunk_text),
+        ):
+            chunks = loop.run_until_complete(chunker(text))
+            timing = measure(run_sync(loop, lambda: chunker(text)), args.repeat)
+            results.append(result(
+                "chunkers", name, {"chars": len(text)}, timing,
+                chunks=len(chunks),
+                mb_per_sec=round(len(text) / 1e6 / (timing["median_ms"] / 1000), 2)
+            ))
+    return results
+
+
+def bench_sanitizers(loop, args):
+    from backend.pdf_parser import PDFParser
+
+    sanitizers = [("pdf_parser._sanitize_text", PDFParser()._sanitize_text)]
+    try:
+        from backend.routes.knowledge_base import _sanitize_text_content
+        sanitizers.append(("knowledge_base._sanitize_text_content", _sanitize_text_content))
+    except (ImportError, ValueError) as e:
+        # The routes import settings, which fail validation (a ValueError)
+        # without the SUPABASE_* variables
+        print(f"  skipping knowledge_base sanitizer: {str(e).splitlines()[0]}", file=sys.stderr)
+    try:
+        from backend.database import DatabaseManager
+        # The method does not touch self, so no client is needed
+        sanitizers.append((
+            "database._sanitize_chunk_content",
+            lambda text: DatabaseManager._sanitize_chunk_content(None, text)
+        ))
+    except ImportError as e:
+        print(f"  skipping database sanitizer: {e}", file=sys.stderr)
+
+    results = []
+    for chars in args.text_sizes:
+        text = make_text(random.Random(chars), chars // 6)[:chars]
+        for name, sanitize in sanitizers:
+            timing = measure(lambda: sanitize(text), args.repeat)
+            results.append(result(
+                "sanitizers", name, {"chars": len(text)}, timing,
+                mb_per_sec=round(len(text) / 1e6 / (timing["median_ms"] / 1000), 2)
+            ))
+    return results
+
+
+def mixed_upload(loop, pages: int, rng: random.Random) -> list:
+    """Chunks of a parsed PDF shuffled with short notes, like a bulk upload"""
+    try:
+        from backend.pdf_parser import PDFParser
+        chunks = loop.run_until_complete(PDFParser().parse_pdf(make_pdf(pages, seed=3)))
+    except ImportError:
+        chunks = [make_text(rng, 90) for _ in range(pages * 6)]
+    notes = [make_text(rng, rng.randint(3, 15)) for _ in range(len(chunks))]
+    texts = chunks + notes
+    rng.shuffle(texts)
+    return texts
+
+
+def bench_embedding(loop, args):
+    from backend.embedding_service import EmbeddingService
+
+    variants = {
+        "torch": dict(backend="torch"),
+        "onnx": dict(backend="onnx", onnx_dir=args.onnx_dir, quantized=True),
+        "onnx-fp32": dict(backend="onnx", onnx_dir=args.onnx_dir, quantized=False),
+    }
+    rng = random.Random(1)
+    batches = {batch_size: [make_text(rng, 80) for _ in range(batch_size)] for batch_size in args.batch_sizes}
+    upload = mixed_upload(loop, args.upload_pages, rng)
+    results = []
+    loaded = 0
+    for variant in args.embedding_backends:
+        service = EmbeddingService(**variants[variant])
+        try:
+            service.preload()
+        except (ImportError, OSError) as e:
+            # e.g. onnxruntime missing or the model not exported yet
+            print(f"  skipping embedding backend {variant}: {e}", file=sys.stderr)
+            continue
+        loaded += 1
+        for batch_size, texts in batches.items():
+            timing = measure(run_sync(loop, lambda: service.generate_embeddings(texts)), args.repeat, min_time=0)
+            results.append(result(
+                "embedding", "generate_embeddings",
+                {"batch_size": batch_size, "model": service.model_name, "backend": variant}, timing,
+                texts_per_sec=round(batch_size / (timing["median_ms"] / 1000), 1)
+            ))
+        for mode, fn in (
+            ("bucketed", lambda: loop.run_until_complete(service.generate_embeddings(upload))),
+            ("plain", lambda: service.model.encode(upload, convert_to_tensor=False)),
+        ):
+            timing = measure(fn, args.repeat, min_time=0)
+            results.append(result(
+                "embedding", f"upload.{mode}",
+                {"texts": len(upload), "model": service.model_name, "backend": variant}, timing,
+                texts_per_sec=round(len(upload) / (timing["median_ms"] / 1000), 1)
+            ))
+    if not loaded:
+        raise ImportError("no embedding backend could be loaded")
+    return results
+
+
+def synthetic_embeddings(rng, chunks: int, dims: int):
+    """Rows with a decaying spectrum in a random basis, like sentence embeddings.
+
+    Isotropic noise would be the worst case for a PCA prefilter; real
+    embeddings concentrate most of their variance in a few dozen directions.
+    """
+    import numpy as np
+
+    scales = (1.0 / np.arange(1, dims + 1) ** 0.5).astype(np.float32)
+    basis, _ = np.linalg.qr(rng.standard_normal((dims, dims)).astype(np.float32))
+    return (rng.standard_normal((chunks, dims), dtype=np.float32) * scales) @ basis.T
+
+
+def retrieval_queries(rng, embeddings, count: int):
+    """Perturbed copies of random rows, so each query has real near neighbours"""
+    import numpy as np
+
+    rows = np.asarray(embeddings[rng.choice(len(embeddings), count, replace=False)], dtype=np.float32)
+    noise = rng.standard_normal(rows.shape, dtype=np.float32) * np.linalg.norm(rows, axis=1, keepdims=True) * 0.05
+    return rows + noise
+
+
+def bench_retrieval(loop, args):
+    import numpy as np
+    from backend.vector_index import VectorIndex
+
+    rng = np.random.default_rng(0)
+    limit = 10
+    indexes = []
+    if args.index_dir:
+        snapshot = VectorIndex()
+        snapshot.load(args.index_dir, mmap=True)
+        for agent_id, agent in snapshot.agents.items():
+            if len(agent):
+                indexes.append((f"snapshot:{agent_id}", np.asarray(agent.embeddings)))
+    else:
+        for chunks in args.index_sizes:
+            indexes.append((f"synthetic:{chunks}", synthetic_embeddings(rng, chunks, args.dims)))
+
+    results = []
+    for source, embeddings in indexes:
+        chunks, dims = embeddings.shape
+        ids = [str(i) for i in range(chunks)]
+        queries = [query.tolist() for query in retrieval_queries(rng, embeddings, min(50, chunks))]
+        single = VectorIndex()
+        single.set_agent("bench", ids, ids, embeddings)
+        exact = [{r["id"] for r in single.search("bench", query, limit=limit)} for query in queries]
+
+        def run_queries(index):
+            return lambda: [index.search("bench", query, limit=limit) for query in queries]
+
+        params = {"source": source, "chunks": chunks, "dims": dims, "limit": limit, "queries": len(queries)}
+        timing = measure(run_queries(single), args.repeat)
+        per_query = timing["median_ms"] / len(queries)
+        results.append(result(
+            "retrieval", "vector_index.search", params, timing,
+            ms_per_query=round(per_query, 4), queries_per_sec=round(1000 / per_query, 1)
+        ))
+
+        if args.prefilter_dims >= dims:
+            continue
+        for candidates in args.candidates:
+            if candidates >= chunks:
+                continue
+            two_stage = VectorIndex(args.prefilter_dims, candidates, two_stage_min_chunks=0)
+            two_stage.set_agent("bench", ids, ids, embeddings)
+            found = [{r["id"] for r in two_stage.search("bench", query, limit=limit)} for query in queries]
+            recall = statistics.fmean(len(a & b) / len(a) for a, b in zip(exact, found))
+            timing = measure(run_queries(two_stage), args.repeat)
+            per_query = timing["median_ms"] / len(queries)
+            results.append(result(
+                "retrieval", "vector_index.search.two_stage",
+                {**params, "prefilter_dims": args.prefilter_dims, "candidates": candidates}, timing,
+                ms_per_query=round(per_query, 4), queries_per_sec=round(1000 / per_query, 1),
+                recall_at_10=round(recall, 4)
+            ))
+    return results
+
+
+def bench_serialization(loop, args):
+    from typing import List
+
+    from pydantic import TypeAdapter
+    from backend.compression import brotli, compress
+    from backend.models import KBChunkResponse
+    from backend.serialization import dumps_bytes, orjson, trusted_rows
+    from backend.streaming import FrameEncoder
+
+    rng = random.Random(2)
+    adapter = TypeAdapter(List[KBChunkResponse])
+    results = []
+    for count in args.row_counts:
+        rows = [
+            {
+                "id": f"{i:08d}-0000-4000-8000-000000000000",
+                "agent_id": "00000000-0000-4000-8000-000000000001",
+                "content": make_text(rng, 80),
+                "created_at": "2024-05-01T12:00:00.123456+00:00",
+            }
+            for i in range(count)
+        ]
+
+        def pydantic_path():
+            # What a response_model route did: build models, FastAPI dumps,
+            # re-validates and serializes them, then the stdlib encodes
+            models = [KBChunkResponse(**row) for row in rows]
+            validated = adapter.validate_python([model.model_dump() for model in models])
+            return json.dumps(adapter.dump_python(validated, mode="json")).encode("utf-8")
+
+        paths = [
+            ("list_response.pydantic_json", pydantic_path),
+            ("list_response.trusted_rows", lambda: dumps_bytes(trusted_rows(KBChunkResponse, rows))),
+            ("encode.stdlib_json", lambda: json.dumps(rows).encode("utf-8")),
+        ]
+        if orjson is not None:
+            paths.append(("encode.orjson", lambda: orjson.dumps(rows)))
+        body = dumps_bytes(rows)
+        for name, fn in paths:
+            timing = measure(fn, args.repeat)
+            results.append(result(
+                "serialization", name, {"rows": count}, timing,
+                rows_per_sec=round(count / (timing["median_ms"] / 1000), 1)
+            ))
+
+        for encoding in ("gzip", "br") if brotli is not None else ("gzip",):
+            compressed = compress(body, encoding)
+            timing = measure(lambda: compress(body, encoding), args.repeat)
+            results.append(result(
+                "serialization", f"compress.{encoding}", {"rows": count}, timing,
+                bytes=len(body), compressed_bytes=len(compressed),
+                ratio=round(len(body) / len(compressed), 2)
+            ))
+
+    frame = {"type": "token", "content": "a few coalesced tokens of streamed text"}
+    encoder = FrameEncoder()
+    for name, fn in (
+        ("ws_frame.stdlib_json", lambda: json.dumps(frame)),
+        ("ws_frame.encoder", lambda: encoder.encode(frame)),
+    ):
+        timing = measure(fn, args.repeat)
+        results.append(result(
+            "serialization", name, {}, timing,
+            frames_per_sec=round(1000 / timing["median_ms"], 1)
+        ))
+    return results
+
+
+BENCHMARKS = {
+    "pdf": bench_pdf,
+    "chunkers": bench_chunkers,
+    "sanitizers": bench_sanitizers,
+    "embedding": bench_embedding,
+    "retrieval": bench_retrieval,
+    "serialization": bench_serialization,
+}
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def result_key(entry: dict) -> str:
+    params = ",".join(f"{k}={v}" for k, v in sorted(entry["params"].items()))
+    return f"{entry['group']}/{entry['name']}[{params}]"
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    """Return (key, baseline_ms, current_ms, ratio) for results slower than the threshold"""
+    previous = {result_key(r): r for r in baseline.get("results", [])}
+    regressions = []
+    for entry in current["results"]:
+        old = previous.get(result_key(entry))
+        if old is None or not old["median_ms"]:
+            continue
+        ratio = entry["median_ms"] / old["median_ms"]
+        if ratio > 1 + threshold:
+            regressions.append((result_key(entry), old["median_ms"], entry["median_ms"], ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="+", choices=GROUPS, default=list(GROUPS))
+    parser.add_argument("--quick", action="store_true", help="smaller inputs and fewer samples, for a smoke run")
+    parser.add_argument("--repeat", type=int, default=7, help="timed samples per benchmark")
+    parser.add_argument("--pdf-pages", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--text-sizes", type=int, nargs="+", default=[2_000, 50_000, 500_000])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--index-sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--embedding-backends", nargs="+", choices=("torch", "onnx", "onnx-fp32"),
+                        default=["torch", "onnx", "onnx-fp32"])
+    parser.add_argument("--upload-pages", type=int, default=20,
+                        help="PDF pages in the mixed-length upload workload")
+    parser.add_argument("--onnx-dir", default=None,
+                        help="exported ONNX model (default: models/all-MiniLM-L6-v2-onnx)")
+    parser.add_argument("--dims", type=int, default=384)
+    parser.add_argument("--prefilter-dims", type=int, default=64)
+    parser.add_argument("--candidates", type=int, nargs="+", default=[64, 256, 1024],
+                        help="candidate pools re-scored at full dimension by two-stage search")
+    parser.add_argument("--index-dir", default=None,
+                        help="benchmark retrieval on a snapshot from --build-index instead of synthetic data")
+    parser.add_argument("--row-counts", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--output", help="write results to this JSON file (default: stdout)")
+    parser.add_argument("--compare", metavar="BASELINE", help="JSON results of an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="with --compare, exit 1 if any median is this much slower (0.15 = 15%%)")
+    args = parser.parse_args()
+
+    if args.quick:
+        args.repeat = min(args.repeat, 3)
+        args.pdf_pages = [1, 5]
+        args.text_sizes = [2_000, 20_000]
+        args.batch_sizes = [1, 16]
+        args.index_sizes = [1_000, 10_000]
+        args.row_counts = [10, 100]
+        args.upload_pages = 5
+
+    loop = asyncio.new_event_loop()
+    report = {"environment": environment(), "results": [], "skipped": {}}
+    for group in args.only:
+        print(f"running {group}...", file=sys.stderr)
+        try:
+            report["results"].extend(BENCHMARKS[group](loop, args))
+        except ImportError as e:
+            report["skipped"][group] = f"missing dependency: {e.name or e}"
+        except OSError as e:
+            # e.g. the embedding model is not in the local cache and we are offline
+            report["skipped"][group] = str(e)
+    loop.close()
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    for group, reason in report["skipped"].items():
+        print(f"skipped {group}: {reason}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        for key, old, new, ratio in regressions:
+            print(f"REGRESSION {key}: {old:.4f}ms -> {new:.4f}ms ({ratio:.2f}x)", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions above {args.threshold:.0%} against {args.compare}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
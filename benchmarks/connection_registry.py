@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Load test the WebSocket connection registry with many concurrent idle
+sessions in one worker: registration throughput, memory per connection and
+the cost of one heartbeat sweep (ping every socket, evict idle ones).
+
+Sockets are in-process stand-ins, so this measures the registry itself;
+use the end-to-end load generator for real network sockets.
+
+Usage:
+    python -m benchmarks.connection_registry --connections 10000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from backend.connections import ConnectionRegistry
+
+
+class IdleWebSocket:
+    """Stand-in socket that accepts pings and closes"""
+
+    __slots__ = ("pings", "closed")
+
+    def __init__(self):
+        self.pings = 0
+        self.closed = False
+
+    async def send_text(self, data: str):
+        self.pings += 1
+        await asyncio.sleep(0)
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        self.closed = True
+
+
+async def run(connections: int, users: int, agents: int, idle_fraction: float):
+    registry = ConnectionRegistry(
+        max_connections_per_user=0,
+        heartbeat_interval=0,
+        idle_timeout=60.0,
+    )
+
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    start = time.perf_counter()
+    registered = [
+        registry.register(IdleWebSocket(), f"user-{i % users}", f"agent-{i % agents}")
+        for i in range(connections)
+    ]
+    register_s = time.perf_counter() - start
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # First sweep pings everything
+    start = time.perf_counter()
+    await registry.sweep()
+    ping_sweep_s = time.perf_counter() - start
+
+    # Age a share of the sockets past the idle timeout and sweep again
+    idle_count = int(connections * idle_fraction)
+    for connection in registered[:idle_count]:
+        connection.last_seen -= 120
+    start = time.perf_counter()
+    await registry.sweep()
+    evict_sweep_s = time.perf_counter() - start
+
+    lookup_start = time.perf_counter()
+    for i in range(users):
+        registry.for_user(f"user-{i}")
+    lookup_s = time.perf_counter() - lookup_start
+
+    start = time.perf_counter()
+    for connection in registered:
+        registry.unregister(connection.id)
+    unregister_s = time.perf_counter() - start
+
+    return {
+        "connections": connections,
+        "register_per_sec": round(connections / register_s),
+        "unregister_per_sec": round(connections / unregister_s),
+        "bytes_per_connection": round((after - before) / connections),
+        "ping_sweep_ms": round(ping_sweep_s * 1000, 2),
+        "evict_sweep_ms": round(evict_sweep_s * 1000, 2),
+        "evicted": idle_count,
+        "user_lookup_us": round(lookup_s / users * 1e6, 3),
+        "remaining_after_unregister": len(registry.connections),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--connections", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=4000)
+    parser.add_argument("--agents", type=int, default=500)
+    parser.add_argument("--idle-fraction", type=float, default=0.1)
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.connections, args.users, args.agents, args.idle_fraction))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""
+Local stand-ins for Ollama and Supabase, used by the load tests.
+
+Both are ASGI apps built by factories that read their knobs from the
+environment, so they can be started in their own processes:
+
+    FAKE_OLLAMA_TOKEN_RATE=40 python -m uvicorn --factory benchmarks.fakes:create_ollama_app --port 11435
+    FAKE_SUPABASE_USERS=200 python -m uvicorn --factory benchmarks.fakes:create_supabase_app --port 54321
+
+The Supabase fake implements the slice of PostgREST and GoTrue that the
+backend uses (eq/neq/ilike/in/gt/lt filters, select, order, limit/offset,
+single-object responses, insert/update/delete with representation, RPCs and
+``GET /auth/v1/user``) over in-memory tables. Users, tokens and one agent per
+user are seeded deterministically; see ``loadtest_identity``.
+"""
+
+import asyncio
+import json
+import math
+import os
+import re
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import FastAPI, Header, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+NAMESPACE = uuid.UUID("6f1c2b1e-6d3a-4f5e-9a57-2f1a4c0d7b10")
+
+REPLY_WORDS = (
+    "Sure", ",", " here", " is", " what", " the", " knowledge", " base", " says", " about",
+    " that", ":", " the", " setting", " controls", " how", " often", " the", " index", " is",
+    " refreshed", ",", " and", " you", " can", " change", " it", " at", " any", " time", "."
+)
+
+
+def loadtest_identity(index: int) -> Tuple[str, str, str]:
+    """Return (token, user_id, agent_id) for the seeded load-test user ``index``"""
+    return (
+        f"loadtest-token-{index}",
+        str(uuid.uuid5(NAMESPACE, f"user-{index}")),
+        str(uuid.uuid5(NAMESPACE, f"agent-{index}")),
+    )
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+# --- Ollama -----------------------------------------------------------------
+
+def create_ollama_app() -> FastAPI:
+    """Fake Ollama that streams NDJSON tokens at a fixed rate.
+
+    FAKE_OLLAMA_TOKEN_RATE    tokens per second per generation (0 = unthrottled)
+    FAKE_OLLAMA_REPLY_TOKENS  tokens per reply
+    FAKE_OLLAMA_FIRST_TOKEN_MS delay before the first token (prompt evaluation)
+    FAKE_OLLAMA_MODEL         model name reported by /api/tags and /api/ps
+    """
+    token_rate = float(os.environ.get("FAKE_OLLAMA_TOKEN_RATE", "50"))
+    reply_tokens = int(os.environ.get("FAKE_OLLAMA_REPLY_TOKENS", "120"))
+    first_token_s = float(os.environ.get("FAKE_OLLAMA_FIRST_TOKEN_MS", "150")) / 1000
+    model = os.environ.get("FAKE_OLLAMA_MODEL", "llama2")
+
+    app = FastAPI()
+    model_info = {"name": f"{model}:latest", "model": f"{model}:latest", "size": 3_825_819_519}
+    app.state.generate_requests = []
+
+    @app.get("/api/tags")
+    async def tags():
+        return {"models": [model_info]}
+
+    @app.get("/api/ps")
+    async def running_models():
+        return {"models": [dict(model_info, expires_at="2099-01-01T00:00:00Z")]}
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        body = await request.json()
+        app.state.generate_requests.append(body)
+        if not body.get("prompt"):
+            # Without a prompt Ollama only loads the model and refreshes its keep-alive
+            return {"model": model, "created_at": _now(), "response": "", "done": True, "done_reason": "load"}
+        words = [REPLY_WORDS[i % len(REPLY_WORDS)] for i in range(reply_tokens)]
+
+        if not body.get("stream", True):
+            duration = first_token_s + (reply_tokens / token_rate if token_rate > 0 else 0)
+            await asyncio.sleep(duration)
+            return {"model": model, "created_at": _now(), "response": "".join(words), "done": True}
+
+        async def stream():
+            loop = asyncio.get_running_loop()
+            await asyncio.sleep(first_token_s)
+            interval = 1.0 / token_rate if token_rate > 0 else 0
+            next_at = loop.time()
+            for word in words:
+                yield json.dumps({"model": model, "created_at": _now(), "response": word, "done": False}) + "\n"
+                if interval:
+                    # Schedule against the clock so the rate does not drift under load
+                    next_at += interval
+                    await asyncio.sleep(max(0.0, next_at - loop.time()))
+            yield json.dumps({
+                "model": model, "created_at": _now(), "response": "", "done": True,
+                "eval_count": reply_tokens
+            }) + "\n"
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    return app
+
+
+# --- Supabase ---------------------------------------------------------------
+
+class FakeStore:
+    """In-memory tables with PostgREST-style filtering"""
+
+    def __init__(self):
+        self.tables: Dict[str, List[Dict[str, Any]]] = {}
+        self.users_by_token: Dict[str, Dict[str, Any]] = {}
+
+    def seed(self, users: int):
+        for i in range(users):
+            token, user_id, agent_id = loadtest_identity(i)
+            created_at = _now()
+            self.users_by_token[token] = {
+                "id": user_id,
+                "aud": "authenticated",
+                "role": "authenticated",
+                "email": f"loadtest{i}@example.com",
+                "app_metadata": {"provider": "email"},
+                "user_metadata": {},
+                "created_at": created_at,
+            }
+            self.table("profiles").append({"id": user_id, "role": "user", "created_at": created_at})
+            self.table("agents").append({
+                "id": agent_id,
+                "user_id": user_id,
+                "name": f"Load test agent {i}",
+                "system_prompt": "You are a helpful assistant used for load testing.",
+                "prompt_status": "ready",
+                "created_at": created_at,
+                "updated_at": created_at,
+            })
+
+    def table(self, name: str) -> List[Dict[str, Any]]:
+        return self.tables.setdefault(name, [])
+
+    def insert(self, name: str, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        created = []
+        for row in rows:
+            now = _now()
+            row = {"id": str(uuid.uuid4()), "created_at": now, "updated_at": now, **row}
+            self.table(name).append(row)
+            created.append(row)
+        return created
+
+
+def _matches(value: Any, op: str, operand: str) -> bool:
+    text = "" if value is None else (str(value).lower() if isinstance(value, bool) else str(value))
+    if op == "eq":
+        return text == operand
+    if op == "neq":
+        return text != operand
+    if op == "is":
+        return (value is None) if operand == "null" else text == operand
+    if op in ("like", "ilike"):
+        pattern = re.escape(operand).replace("\\*", ".*").replace("%", ".*")
+        flags = re.DOTALL | (re.IGNORECASE if op == "ilike" else 0)
+        return re.fullmatch(pattern, text, flags) is not None
+    if op == "in":
+        return text in [item.strip().strip('"') for item in operand.strip("()").split(",")]
+    if value is None:
+        return False
+    for number_op, compare in (("gt", lambda a, b: a > b), ("gte", lambda a, b: a >= b),
+                               ("lt", lambda a, b: a < b), ("lte", lambda a, b: a <= b)):
+        if op == number_op:
+            try:
+                return compare(float(value), float(operand))
+            except ValueError:
+                return compare(text, operand)
+    raise ValueError(f"unsupported filter operator {op!r}")
+
+
+def _apply_query(rows: List[Dict[str, Any]], params: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+    """Filter rows by every non-reserved query param (``column=op.value``)"""
+    for column, expression in params:
+        if column in ("select", "order", "limit", "offset", "columns", "on_conflict"):
+            continue
+        op, _, operand = expression.partition(".")
+        rows = [row for row in rows if _matches(row.get(column), op, operand)]
+    return rows
+
+
+def _order_and_page(rows, params: Dict[str, str], range_header: Optional[str]):
+    for term in reversed(params.get("order", "").split(",")) if params.get("order") else ():
+        column, *modifiers = term.split(".")
+        rows = sorted(rows, key=lambda row: (row.get(column) is None, row.get(column) or ""),
+                      reverse="desc" in modifiers)
+    offset = int(params.get("offset", 0))
+    limit = int(params["limit"]) if "limit" in params else None
+    if range_header and "-" in range_header:
+        start, _, end = range_header.partition("-")
+        offset, limit = int(start), int(end) - int(start) + 1
+    return rows[offset:offset + limit if limit is not None else None]
+
+
+def _project(rows, select: Optional[str]):
+    if not select or select.strip() == "*":
+        return [dict(row) for row in rows]
+    columns = [column.strip() for column in select.split(",") if "(" not in column]
+    return [{column: row.get(column) for column in columns} for row in rows]
+
+
+def _cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def create_supabase_app() -> FastAPI:
+    """Fake Supabase REST/auth surface.
+
+    FAKE_SUPABASE_USERS  number of users (and agents) to seed
+    """
+    store = FakeStore()
+    store.seed(int(os.environ.get("FAKE_SUPABASE_USERS", "100")))
+    app = FastAPI()
+    app.state.store = store
+
+    @app.get("/health")
+    async def health():
+        return {"status": "healthy"}
+
+    @app.get("/auth/v1/user")
+    async def get_user(authorization: str = Header("")):
+        user = store.users_by_token.get(authorization.replace("Bearer ", "", 1))
+        if user is None:
+            return JSONResponse({"code": 401, "msg": "invalid JWT"}, status_code=401)
+        return user
+
+    @app.post("/rest/v1/rpc/{function}")
+    async def rpc(function: str, request: Request):
+        args = await request.json()
+        if function != "match_kb_chunks":
+            return JSONResponse({"message": f"function {function} not found"}, status_code=404)
+        rows = []
+        for chunk in store.table("kb_chunks"):
+            if chunk.get("agent_id") != args.get("agent_id") or not chunk.get("embedding"):
+                continue
+            embedding = chunk["embedding"]
+            if isinstance(embedding, str):
+                embedding = json.loads(embedding)
+            similarity = _cosine(args["query_embedding"], embedding)
+            if similarity >= args.get("match_threshold", 0):
+                rows.append({"id": chunk["id"], "agent_id": chunk["agent_id"],
+                             "content": chunk["content"], "similarity": similarity})
+        rows.sort(key=lambda row: row["similarity"], reverse=True)
+        return rows[:args.get("match_count", 5)]
+
+    @app.api_route("/rest/v1/{table}", methods=["GET", "POST", "PATCH", "DELETE"])
+    async def table(table: str, request: Request):
+        params = request.query_params
+        filters = list(params.multi_items())
+        wants_object = "vnd.pgrst.object" in request.headers.get("accept", "")
+
+        if request.method == "POST":
+            body = await request.json()
+            rows = store.insert(table, body if isinstance(body, list) else [body])
+        elif request.method == "PATCH":
+            update = await request.json()
+            rows = _apply_query(store.table(table), filters)
+            for row in rows:
+                row.update(update, updated_at=_now())
+        elif request.method == "DELETE":
+            rows = _apply_query(store.table(table), filters)
+            doomed = {id(row) for row in rows}
+            store.tables[table] = [row for row in store.table(table) if id(row) not in doomed]
+        else:
+            rows = _apply_query(store.table(table), filters)
+            rows = _order_and_page(rows, dict(params), request.headers.get("range"))
+
+        rows = _project(rows, params.get("select"))
+        headers = {"Content-Range": f"0-{max(len(rows) - 1, 0)}/{len(rows)}"}
+        if wants_object:
+            if len(rows) != 1:
+                return JSONResponse(
+                    {"code": "PGRST116", "message": "JSON object requested, multiple (or no) rows returned"},
+                    status_code=406
+                )
+            return JSONResponse(rows[0], headers=headers)
+        return JSONResponse(rows, status_code=201 if request.method == "POST" else 200, headers=headers)
+
+    return app
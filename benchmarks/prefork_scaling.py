@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Measure pre-fork serving: retrieval throughput and per-worker memory as the
+worker count grows.
+
+Each run starts a pre-fork server (backend.prefork.serve_prefork) whose
+workers embed a query with the shared SentenceTransformer and search a
+synthetic memory-mapped vector index, i.e. the retrieval hot path without
+Supabase. Memory is read from /proc/<pid>/smaps_rollup (Linux only):
+Pss splits shared pages between the processes that map them, Private is
+what each worker owns outright.
+
+Usage:
+    python -m benchmarks.prefork_scaling --workers 1 2 4 8 --chunks 20000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fastapi import FastAPI
+
+INDEX_ENV = "PREFORK_BENCH_INDEX_DIR"
+MODEL_NAME = "all-MiniLM-L6-v2"
+BENCH_AGENT = "bench-agent"
+
+app = FastAPI()
+
+
+@app.get("/search")
+async def search(q: str):
+    from backend.embedding_service import EmbeddingService
+    from backend.vector_index import vector_index
+
+    embedding = await EmbeddingService(MODEL_NAME).generate_embedding(q)
+    return {"results": vector_index.search(BENCH_AGENT, embedding, limit=5)}
+
+
+def preload():
+    from backend.embedding_service import EmbeddingService
+    from backend.vector_index import vector_index
+
+    EmbeddingService(MODEL_NAME).preload()
+    vector_index.load(os.environ[INDEX_ENV], mmap=True)
+
+
+def write_synthetic_index(directory: str, chunks: int, dims: int = 384):
+    import numpy as np
+    from backend.vector_index import VectorIndex
+
+    rng = np.random.default_rng(0)
+    VectorIndex.write_snapshot(
+        directory,
+        BENCH_AGENT,
+        [f"chunk-{i}" for i in range(chunks)],
+        [f"synthetic chunk {i}" for i in range(chunks)],
+        rng.standard_normal((chunks, dims), dtype=np.float32),
+    )
+
+
+def read_memory_kb(pid: int) -> dict:
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].rstrip(":") in ("Rss", "Pss", "Private_Clean", "Private_Dirty"):
+                    fields[parts[0].rstrip(":")] = int(parts[1])
+    except OSError:
+        return {}
+    return {
+        "rss_kb": fields.get("Rss"),
+        "pss_kb": fields.get("Pss"),
+        "private_kb": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+    }
+
+
+def child_pids(pid: int) -> list:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+
+
+async def drive(url: str, concurrency: int, duration: float) -> dict:
+    import httpx
+
+    done = 0
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def client_loop(client, n):
+        nonlocal done, errors
+        while time.perf_counter() < deadline:
+            try:
+                response = await client.get(url, params={"q": f"how do I configure feature {n}?"})
+                if response.status_code == 200:
+                    done += 1
+                else:
+                    errors += 1
+            except Exception:
+                errors += 1
+
+    async with httpx.AsyncClient(timeout=30.0) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(client_loop(client, n) for n in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return {"requests_per_sec": round(done / elapsed, 1), "errors": errors}
+
+
+def wait_ready(url: str, timeout: float = 180.0):
+    import httpx
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url, params={"q": "warmup"}, timeout=10.0).status_code == 200:
+                return
+        except Exception:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError("server did not become ready")
+
+
+def run_one(workers: int, port: int, index_dir: str, concurrency: int, duration: float) -> dict:
+    env = dict(os.environ, **{INDEX_ENV: index_dir})
+    master = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.prefork_scaling", "--serve", str(workers), "--port", str(port)],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}/search"
+    try:
+        wait_ready(url)
+        # Let every worker serve a few requests so lazy state is touched
+        asyncio.run(drive(url, workers * 2, 2.0))
+        result = asyncio.run(drive(url, concurrency, duration))
+        worker_pids = child_pids(master.pid)
+        result.update({
+            "workers": workers,
+            "master_memory": read_memory_kb(master.pid),
+            "worker_memory": [read_memory_kb(pid) for pid in worker_pids],
+        })
+        return result
+    finally:
+        master.send_signal(signal.SIGTERM)
+        master.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        from backend.prefork import serve_prefork
+        serve_prefork("benchmarks.prefork_scaling:app", host="127.0.0.1", port=args.port,
+                      workers=args.serve, log_level="warning", preload=preload)
+        return
+
+    with tempfile.TemporaryDirectory() as index_dir:
+        write_synthetic_index(index_dir, args.chunks)
+        results = [
+            run_one(n, args.port, index_dir, args.concurrency, args.duration)
+            for n in args.workers
+        ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Benchmark WebSocket token framing: one JSON frame per token (the old
+behaviour) versus coalesced frames in each supported wire format.
+
+Frames are written to a real socketpair so the syscall cost is included.
+
+Usage:
+    python -m benchmarks.ws_framing --tokens 20000 --token-rate 0
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from backend.streaming import FrameSender, TokenCoalescer, negotiate_framing, msgpack
+
+
+class SocketPairWebSocket:
+    """Minimal stand-in for a Starlette WebSocket that writes to a socket"""
+
+    def __init__(self):
+        self.sock, self._peer = socket.socketpair()
+        self.bytes_sent = 0
+        self._drainer = threading.Thread(target=self._drain, daemon=True)
+        self._drainer.start()
+
+    def _drain(self):
+        while True:
+            data = self._peer.recv(65536)
+            if not data:
+                break
+
+    async def send_text(self, data: str):
+        await self.send_bytes(data.encode("utf-8"))
+
+    async def send_bytes(self, data: bytes):
+        self.sock.sendall(data)
+        self.bytes_sent += len(data)
+
+    def close(self):
+        self.sock.close()
+        self._drainer.join(timeout=1)
+        self._peer.close()
+
+
+async def fake_token_stream(count: int, token_rate: float):
+    words = ["The", " quick", " brown", " fox", " jumps", " over", " the", " lazy", " dog", "."]
+    delay = 1.0 / token_rate if token_rate > 0 else 0
+    for i in range(count):
+        if delay:
+            await asyncio.sleep(delay)
+        yield words[i % len(words)]
+
+
+async def run_per_token(tokens: int, token_rate: float):
+    ws = SocketPairWebSocket()
+    frames = 0
+    async for token in fake_token_stream(tokens, token_rate):
+        await ws.send_text(json.dumps({"type": "token", "content": token}))
+        frames += 1
+    ws.close()
+    return frames, ws.bytes_sent
+
+
+async def run_coalesced(tokens: int, token_rate: float, framing: str, interval_ms: int, max_bytes: int):
+    ws = SocketPairWebSocket()
+    sender = FrameSender(ws, negotiate_framing(framing))
+    coalescer = TokenCoalescer(sender.send, flush_interval_ms=interval_ms, flush_max_bytes=max_bytes)
+    async for token in fake_token_stream(tokens, token_rate):
+        await coalescer.add(token)
+    await coalescer.flush()
+    ws.close()
+    return sender.frames_sent, ws.bytes_sent
+
+
+def measure(name, coro_factory, tokens):
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    frames, sent = asyncio.run(coro_factory())
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+    return {
+        "name": name,
+        "tokens": tokens,
+        "frames": frames,
+        "bytes": sent,
+        "frames_per_sec": round(frames / wall, 1),
+        "cpu_us_per_token": round(cpu / tokens * 1e6, 3),
+        "wall_s": round(wall, 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=20000)
+    parser.add_argument("--token-rate", type=float, default=0, help="tokens/sec emitted by the fake model (0 = unthrottled)")
+    parser.add_argument("--interval-ms", type=int, default=25)
+    parser.add_argument("--max-bytes", type=int, default=512)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    framings = ["json", "binary"] + (["msgpack"] if msgpack is not None else [])
+    results = [measure("per-token-json", lambda: run_per_token(args.tokens, args.token_rate), args.tokens)]
+    for framing in framings:
+        results.append(measure(
+            f"coalesced-{framing}",
+            lambda f=framing: run_coalesced(args.tokens, args.token_rate, f, args.interval_ms, args.max_bytes),
+            args.tokens,
+        ))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'mode':<20}{'frames':>10}{'bytes':>12}{'frames/s':>14}{'cpu us/token':>15}")
+    for r in results:
+        print(f"{r['name']:<20}{r['frames']:>10}{r['bytes']:>12}{r['frames_per_sec']:>14}{r['cpu_us_per_token']:>15}")
+
+
+if __name__ == "__main__":
+    main()
@@ -17,8 +17,8 @@ const getAuthToken = async () => {
   }
 }
 
-// Helper function to make authenticated requests
-const apiRequest = async (endpoint, options = {}) => {
+// Helper function to make authenticated requests, returning the response
+const apiFetch = async (endpoint, options = {}) => {
   const token = await getAuthToken()
   
   if (!token) {
@@ -48,9 +48,34 @@ const apiRequest = async (endpoint, options = {}) => {
     throw new Error(error.detail || `HTTP error! status: ${response.status}`)
   }
   
+  return response
+}
+
+// Helper function to make authenticated requests, returning the JSON body
+const apiRequest = async (endpoint, options = {}) => {
+  const response = await apiFetch(endpoint, options)
   return response.json()
 }
 
+// List endpoints return one page at a time; follow the X-Next-Cursor header
+// until the last page and return all items
+const PAGE_SIZE = 500
+
+const apiRequestAllPages = async (endpoint) => {
+  const items = []
+  let cursor = null
+  do {
+    const params = new URLSearchParams({ limit: PAGE_SIZE })
+    if (cursor) {
+      params.set('cursor', cursor)
+    }
+    const response = await apiFetch(`${endpoint}?${params}`)
+    items.push(...(await response.json()))
+    cursor = response.headers.get('X-Next-Cursor')
+  } while (cursor)
+  return items
+}
+
 // Agents API
 export const agentsApi = {
   // Create a new agent
@@ -123,7 +148,7 @@ export const kbApi = {
 
   // Get KB chunks for an agent
   getChunks: async (agentId) => {
-    return apiRequest(`/agents/${agentId}/kb`)
+    return apiRequestAllPages(`/agents/${agentId}/kb`)
   },
 
   // Search KB chunks
@@ -143,12 +168,12 @@ export const kbApi = {
 export const chatApi = {
   // Get chat logs for an agent
   getLogs: async (agentId) => {
-    return apiRequest(`/chat/logs/${agentId}`)
+    return apiRequestAllPages(`/chat/logs/${agentId}`)
   },
 
   // Get messages for a conversation
   getMessages: async (conversationId) => {
-    return apiRequest(`/chat/conversations/${conversationId}/messages`)
+    return apiRequestAllPages(`/chat/conversations/${conversationId}/messages`)
   },
 
   // Create new conversation
@@ -8,8 +8,8 @@ import {
   ArrowLeft, 
   Bot, 
   Send, 
+  Square,
   User, 
-  Sparkles,
   MessageSquare,
   Wifi,
   WifiOff,
@@ -30,6 +30,7 @@ export default function ChatPage() {
     connectWebSocket, 
     disconnectWebSocket, 
     sendMessage,
+    stopGeneration,
     startNewConversation,
     error,
     clearError
@@ -332,15 +333,16 @@ export default function ChatPage() {
             </div>
             
             <motion.button
-              onClick={handleSendMessage}
-              disabled={!input.trim() || !isConnected || isTyping}
+              onClick={isTyping ? stopGeneration : handleSendMessage}
+              disabled={!isConnected || (!isTyping && !input.trim())}
+              title={isTyping ? 'Stop generating' : 'Send message'}
               className="px-6 py-4 bg-gradient-to-r from-varia-purple to-varia-blue text-white rounded-2xl hover:shadow-lg hover:shadow-varia-purple/25 transition-all duration-300 disabled:opacity-50 disabled:cursor-not-allowed flex items-center justify-center min-w-[64px]"
               whileHover={{ scale: 1.05, y: -2 }}
               whileTap={{ scale: 0.95 }}
               transition={{ type: "spring", stiffness: 400, damping: 17 }}
             >
               {isTyping ? (
-                <Sparkles className="w-5 h-5 animate-pulse" />
+                <Square className="w-5 h-5 fill-current" />
               ) : (
                 <Send className="w-5 h-5" />
               )}
@@ -32,7 +32,10 @@ export const useChatStore = create((set, get) => ({
       newWs.onmessage = (event) => {
         const data = JSON.parse(event.data)
         
-        if (data.type === 'token') {
+        if (data.type === 'ping') {
+          // Heartbeat: keeps the server from evicting this socket as idle
+          newWs.send(JSON.stringify({ type: 'pong' }))
+        } else if (data.type === 'token') {
           set(state => ({
             messages: state.messages.map(msg => 
               msg.id === 'typing' 
@@ -44,11 +47,13 @@ export const useChatStore = create((set, get) => ({
           set(state => ({
             messages: state.messages.map(msg => 
               msg.id === 'typing' 
-                ? { ...msg, id: data.message_id, isTyping: false }
+                ? { ...msg, id: data.message_id || Date.now().toString(), isTyping: false, stopped: !!data.stopped }
                 : msg
             ),
             isTyping: false
           }))
+        } else if (data.type === 'error') {
+          set({ error: data.content })
         }
       }
 
@@ -142,6 +147,14 @@ export const useChatStore = create((set, get) => ({
     }
   },
 
+  // Stop the response that is currently being generated
+  stopGeneration: () => {
+    const { ws, isTyping } = get()
+    if (ws && ws.readyState === WebSocket.OPEN && isTyping) {
+      ws.send(JSON.stringify({ type: 'stop' }))
+    }
+  },
+
   // Fetch conversation history
   fetchConversations: async (agentId) => {
     try {
@@ -1,8 +1,18 @@
 #!/usr/bin/env python3
 """
 Simple script to run the FastAPI backend server
+
+    python run_backend.py                          # single process with auto-reload
+    python run_backend.py --workers 4              # uvicorn multi-process (no sharing)
+    python run_backend.py --prefork --workers 4    # preload model/index once, fork workers
+    python run_backend.py --build-index ./index    # export KB embeddings for the local index
+    python run_backend.py --export-onnx            # ONNX + int8 embedding model for EMBEDDING_BACKEND=onnx
+    python run_backend.py --reindex                # re-embed KB chunks after EMBEDDING_MODEL changes
+    python run_backend.py --profile-startup        # import time per module, init time per service
 """
 
+import argparse
+import asyncio
 import uvicorn
 import os
 import sys
@@ -10,11 +20,102 @@ import sys
 # Add backend directory to Python path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend'))
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the FastAPI backend server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--prefork", action="store_true",
+                        help="load the embedding model and vector index once, then fork workers")
+    parser.add_argument("--no-reload", action="store_true", help="disable auto-reload")
+    parser.add_argument("--build-index", metavar="DIR",
+                        help="write a vector index snapshot of all KB chunks to DIR and exit")
+    parser.add_argument("--export-onnx", metavar="DIR", nargs="?", const="",
+                        help="export the embedding model to ONNX with an int8 copy (default DIR: "
+                             "EMBEDDING_ONNX_DIR or models/<model>-onnx) and exit")
+    parser.add_argument("--reindex", action="store_true",
+                        help="re-embed chunks from other embedding models with EMBEDDING_MODEL and exit")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="report import time per module and init time per service, then exit")
+    parser.add_argument("--import-budget-ms", type=float, default=None,
+                        help="with --profile-startup, exit non-zero if importing the app takes longer")
+    return parser.parse_args()
+
+def build_index(directory: str):
+    from backend.config import settings
+    from backend.services import services
+    from backend.vector_index import build_snapshot
+
+    total = asyncio.run(build_snapshot(
+        services.db,
+        directory,
+        prefilter_dims=settings.retrieval_prefilter_dims,
+        two_stage_min_chunks=settings.retrieval_two_stage_min_chunks
+    ))
+    print(f"Wrote {total} chunks to {directory}")
+
+def reindex():
+    from backend.config import settings
+    from backend.reindex import reindex_job
+    from backend.services import services
+
+    async def run():
+        task = asyncio.create_task(reindex_job.run(
+            services.db,
+            services.embedding_service,
+            batch_size=settings.reindex_batch_size,
+            max_chunks_per_second=settings.reindex_max_chunks_per_second
+        ))
+        while not task.done():
+            await asyncio.wait([task], timeout=5)
+            status = reindex_job.progress()
+            print(
+                f"{status['state']}: {status.get('chunks_done', 0)}/{status.get('chunks_total', 0)} chunks, "
+                f"{status.get('agents_done', 0)}/{status.get('agents_total', 0)} agents, "
+                f"{status.get('chunks_per_second', 0)} chunks/s"
+            )
+        return reindex_job.status["state"] == "done"
+
+    if not asyncio.run(run()):
+        print(f"Re-embedding failed: {reindex_job.status.get('error')}")
+        sys.exit(1)
+
+def export_onnx_model(directory: str):
+    from backend.config import settings
+    from backend.onnx_embedding import export_onnx
+
+    directory = directory or settings.embedding_onnx_dir or f"models/{settings.embedding_model}-onnx"
+    export_onnx(settings.embedding_model, directory)
+    print(f"Exported {settings.embedding_model} to {directory}; set EMBEDDING_BACKEND=onnx to use it")
+
 if __name__ == "__main__":
-    uvicorn.run(
-    "backend.main:app",
-    host="0.0.0.0",
-    port=8000,
-    reload=True,
-    log_level="info"
-)
\ No newline at end of file
+    args = parse_args()
+
+    if args.profile_startup:
+        from backend.startup_profile import print_report
+        if not print_report(budget_ms=args.import_budget_ms):
+            sys.exit(1)
+    elif args.build_index:
+        build_index(args.build_index)
+    elif args.export_onnx is not None:
+        export_onnx_model(args.export_onnx)
+    elif args.reindex:
+        reindex()
+    elif args.prefork:
+        from backend.prefork import serve_prefork
+        serve_prefork(
+            "backend.main:app",
+            host=args.host,
+            port=args.port,
+            workers=args.workers,
+            log_level="info"
+        )
+    else:
+        uvicorn.run(
+            "backend.main:app",
+            host=args.host,
+            port=args.port,
+            reload=not args.no_reload and args.workers == 1,
+            workers=args.workers,
+            log_level="info"
+        )
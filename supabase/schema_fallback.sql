@@ -10,6 +10,7 @@ CREATE TABLE IF NOT EXISTS public.agents (
     user_id UUID REFERENCES auth.users(id) ON DELETE CASCADE,
     name TEXT NOT NULL,
     system_prompt TEXT NOT NULL,
+    prompt_status TEXT NOT NULL DEFAULT 'ready' CHECK (prompt_status IN ('pending', 'ready', 'fallback')),
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
@@ -43,12 +44,121 @@ CREATE TABLE IF NOT EXISTS public.messages (
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- Background system prompt generation status
+ALTER TABLE public.agents ADD COLUMN IF NOT EXISTS prompt_status TEXT NOT NULL DEFAULT 'ready'
+    CHECK (prompt_status IN ('pending', 'ready', 'fallback'));
+
+-- Source file of each chunk, so a file's chunks can be deleted as a set
+ALTER TABLE public.kb_chunks ADD COLUMN IF NOT EXISTS file_id UUID REFERENCES public.kb_files(id) ON DELETE CASCADE;
+
+-- Embedding model of each chunk's vector and of each agent's searches;
+-- existing rows were embedded with the original default model
+ALTER TABLE public.agents ADD COLUMN IF NOT EXISTS embedding_model TEXT NOT NULL DEFAULT 'all-MiniLM-L6-v2';
+ALTER TABLE public.agents ADD COLUMN IF NOT EXISTS reindex_model TEXT;
+ALTER TABLE public.kb_chunks ADD COLUMN IF NOT EXISTS embedding_model TEXT NOT NULL DEFAULT 'all-MiniLM-L6-v2';
+
+-- Re-embedded vectors staged until the agent's migration switches over
+ALTER TABLE public.kb_chunks ADD COLUMN IF NOT EXISTS embedding_next JSONB;
+
+-- Rolling summary of each conversation's older messages, and the
+-- (created_at, id) of the last message it covers
+ALTER TABLE public.conversations ADD COLUMN IF NOT EXISTS summary TEXT;
+ALTER TABLE public.conversations ADD COLUMN IF NOT EXISTS summary_until_at TIMESTAMP WITH TIME ZONE;
+ALTER TABLE public.conversations ADD COLUMN IF NOT EXISTS summary_until_id UUID;
+
+-- Incremented on every change to an agent's chunks, so processes with a
+-- local vector index notice changes made by other processes
+ALTER TABLE public.agents ADD COLUMN IF NOT EXISTS kb_version INTEGER NOT NULL DEFAULT 0;
+
 -- Create indexes
 CREATE INDEX idx_agents_user_id ON public.agents(user_id);
 CREATE INDEX idx_kb_chunks_agent_id ON public.kb_chunks(agent_id);
+CREATE INDEX IF NOT EXISTS idx_kb_chunks_file_id ON public.kb_chunks(file_id);
+CREATE INDEX IF NOT EXISTS idx_kb_chunks_agent_model ON public.kb_chunks(agent_id, embedding_model);
 CREATE INDEX idx_conversations_agent_id ON public.conversations(agent_id);
 CREATE INDEX idx_messages_conversation_id ON public.messages(conversation_id);
 
+-- Keyset pagination on (created_at, id) for the list endpoints
+CREATE INDEX IF NOT EXISTS idx_kb_chunks_agent_created ON public.kb_chunks(agent_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_conversations_agent_created ON public.conversations(agent_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_messages_conversation_created ON public.messages(conversation_id, created_at, id);
+
+-- Conversation list with per-conversation message counts and last message
+-- time in one query: page the conversations first, then aggregate only those
+CREATE OR REPLACE FUNCTION public.list_conversations_with_stats(
+    p_agent_id UUID,
+    p_limit INT DEFAULT NULL,
+    p_after_created_at TIMESTAMPTZ DEFAULT NULL,
+    p_after_id UUID DEFAULT NULL
+)
+RETURNS TABLE (
+    id UUID,
+    agent_id UUID,
+    created_at TIMESTAMPTZ,
+    message_count BIGINT,
+    last_message_at TIMESTAMPTZ
+)
+LANGUAGE sql STABLE
+AS $$
+    SELECT c.id, c.agent_id, c.created_at, s.message_count, s.last_message_at
+    FROM (
+        SELECT conversations.id, conversations.agent_id, conversations.created_at
+        FROM public.conversations
+        WHERE conversations.agent_id = p_agent_id
+          AND (p_after_created_at IS NULL
+               OR (conversations.created_at, conversations.id) < (p_after_created_at, p_after_id))
+        ORDER BY conversations.created_at DESC, conversations.id DESC
+        LIMIT p_limit
+    ) c
+    LEFT JOIN LATERAL (
+        SELECT COUNT(*) AS message_count, MAX(m.created_at) AS last_message_at
+        FROM public.messages m
+        WHERE m.conversation_id = c.id
+    ) s ON TRUE
+    ORDER BY c.created_at DESC, c.id DESC;
+$$;
+
+-- Re-embedding: store a batch of new vectors by chunk id in one statement
+CREATE OR REPLACE FUNCTION public.stage_kb_chunk_embeddings(p_agent_id UUID, p_rows JSONB)
+RETURNS INT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    staged INT;
+BEGIN
+    UPDATE public.kb_chunks k
+    SET embedding_next = r->'embedding'
+    FROM jsonb_array_elements(p_rows) r
+    WHERE k.id = (r->>'id')::UUID AND k.agent_id = p_agent_id;
+    GET DIAGNOSTICS staged = ROW_COUNT;
+    RETURN staged;
+END $$;
+
+-- Knowledge base changed: increment the agent's kb_version and return it
+CREATE OR REPLACE FUNCTION public.bump_kb_version(p_agent_id UUID)
+RETURNS INT
+LANGUAGE sql
+AS $$
+    UPDATE public.agents SET kb_version = kb_version + 1 WHERE id = p_agent_id RETURNING kb_version;
+$$;
+
+-- Re-embedding: swap the staged vectors in and point the agent at the new
+-- model in one transaction, so searches never see a mix
+CREATE OR REPLACE FUNCTION public.switch_kb_chunk_embeddings(p_agent_id UUID, p_model TEXT)
+RETURNS INT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    switched INT;
+BEGIN
+    UPDATE public.kb_chunks
+    SET embedding_json = embedding_next, embedding_next = NULL, embedding_model = p_model
+    WHERE agent_id = p_agent_id AND embedding_next IS NOT NULL;
+    GET DIAGNOSTICS switched = ROW_COUNT;
+    UPDATE public.agents SET embedding_model = p_model, reindex_model = NULL WHERE id = p_agent_id;
+    RETURN switched;
+END $$;
+
 -- Create GIN index for JSONB embeddings (for basic text search)
 CREATE INDEX IF NOT EXISTS idx_kb_chunks_embedding_json ON public.kb_chunks USING GIN (embedding_json);
 
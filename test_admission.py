@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Test script for per-tenant admission control: token buckets and
+concurrency limits
+"""
+
+import pytest
+
+from backend.admission import ConcurrencyLimit, RateLimit, RateLimited
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_rate_limit_charges_both_buckets_or_neither():
+    clock = FakeClock()
+    limit = RateLimit("chat_messages", per_user_per_minute=3, per_agent_per_minute=4, clock=clock)
+    for _ in range(3):
+        limit.take("alice", "agent-1")
+    with pytest.raises(RateLimited) as e:
+        limit.take("alice", "agent-1")
+    assert e.value.scope == "user"
+    assert e.value.retry_after_header() == {"Retry-After": "20"}
+
+    # Bob has his own user bucket but shares the agent's, which has one left
+    limit.take("bob", "agent-1")
+    with pytest.raises(RateLimited) as e:
+        limit.take("bob", "agent-1")
+    assert e.value.scope == "agent" and e.value.frame()["code"] == "rate_limited"
+    # The rejection charged neither bucket: Bob can still use another agent twice
+    limit.take("bob", "agent-2")
+    limit.take("bob", "agent-2")
+
+    # Buckets refill continuously, one token every 20s for Alice
+    clock.now = 20.0
+    limit.take("alice", "agent-2")
+    with pytest.raises(RateLimited):
+        limit.take("alice", "agent-2")
+
+
+def test_rate_limit_admits_one_oversized_request_into_debt():
+    clock = FakeClock()
+    limit = RateLimit("upload_mb", per_user_per_minute=10, per_agent_per_minute=0, clock=clock)
+    limit.take("alice", "agent-1", 25.0)
+    # 15 MB in debt: 1.5 minutes until the bucket is back to empty, 2 until 5 MB fit
+    clock.now = 90.0
+    with pytest.raises(RateLimited) as e:
+        limit.take("alice", "agent-1", 5.0)
+    assert e.value.retry_after == pytest.approx(30.0)
+    clock.now = 120.0
+    limit.take("alice", "agent-1", 5.0)
+
+
+def test_concurrency_limit_rejects_without_queueing_and_releases():
+    limit = ConcurrencyLimit("ingestions", per_user=1, per_agent=2)
+    limit.acquire("alice", "agent-1")
+    with pytest.raises(RateLimited) as e:
+        limit.acquire("alice", "agent-1")
+    assert e.value.scope == "user" and e.value.retry_after_header() == {}
+    with limit.hold("bob", "agent-1"):
+        with pytest.raises(RateLimited) as e:
+            limit.acquire("carol", "agent-1")
+        assert e.value.scope == "agent"
+    assert limit.in_flight == 1
+    limit.release("alice", "agent-1")
+    assert limit.in_flight == 0 and not limit.active
+
+
+if __name__ == "__main__":
+    test_rate_limit_charges_both_buckets_or_neither()
+    test_rate_limit_admits_one_oversized_request_into_debt()
+    test_concurrency_limit_rejects_without_queueing_and_releases()
+    print("✅ Admission control tests passed")
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Test script for chat turns: the concurrent pipeline, failures, and
+stopping a turn before or during generation
+"""
+
+import asyncio
+import os
+import time
+from types import SimpleNamespace
+
+# The chat routes load settings on import; nothing here talks to Supabase
+for name, value in (
+    ("SUPABASE_URL", "http://127.0.0.1:1"),
+    ("SUPABASE_ANON_KEY", "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYW5vbiJ9.dGVzdA"),
+    ("SUPABASE_SERVICE_ROLE_KEY", "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYW5vbiJ9.dGVzdA"),
+):
+    os.environ.setdefault(name, value)
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from backend.config import settings
+from backend.routes import chat
+from backend.services import services
+
+AGENT = {"id": "agent-1", "user_id": "user-1", "system_prompt": "Be brief", "embedding_model": None}
+
+
+class FakeDB:
+    """Records messages and the order of storage calls"""
+
+    def __init__(self):
+        self.calls = []
+        self.messages = []
+
+    async def get_agent(self, agent_id, user_id):
+        return AGENT if agent_id == AGENT["id"] and user_id == AGENT["user_id"] else None
+
+    async def create_conversation(self, agent_id):
+        return {"id": "conversation-1", "agent_id": agent_id}
+
+    async def get_conversation_memory(self, conversation_id, max_messages):
+        self.calls.append("memory")
+        return {"summary": "", "messages": []}
+
+    async def create_message(self, conversation_id, role, content):
+        self.calls.append(f"persist_{role}")
+        self.messages.append((role, content))
+        return {"id": f"message-{len(self.messages)}"}
+
+
+class FakeOllama:
+    """Streams ``tokens``, then hangs until cancelled when ``hang`` is set or
+    raises ``error``"""
+
+    def __init__(self, tokens, hang=False, error=None):
+        self.tokens = tokens
+        self.hang = hang
+        self.error = error
+        self.closed = False
+        self.contexts = []
+
+    async def stream_chat(self, message, system_prompt, context="", summary="", history=None):
+        self.contexts.append(context)
+        try:
+            for token in self.tokens:
+                yield token
+            if self.error is not None:
+                raise self.error
+            if self.hang:
+                await asyncio.sleep(3600)
+        finally:
+            self.closed = True
+
+
+class RecordingSender:
+    def __init__(self):
+        self.frames = []
+
+    async def send(self, frame):
+        self.frames.append(frame)
+
+
+def use_fake_services(monkeypatch) -> FakeDB:
+    """A fake db and retrieval, one frame per token, no summaries or drafts"""
+    db = FakeDB()
+    monkeypatch.setitem(services._instances, "db", db)
+    monkeypatch.setattr(settings, "ws_flush_interval_ms", 0)
+    monkeypatch.setattr(settings, "ws_flush_max_bytes", 0)
+    monkeypatch.setattr(settings, "chat_summary_enabled", False)
+    monkeypatch.setattr(settings, "chat_drafts_enabled", False)
+    monkeypatch.setattr(settings, "chat_history_messages", 0)
+
+    async def search(timer, agent, message):
+        return "context"
+
+    monkeypatch.setattr(chat, "_search_context", search)
+    return db
+
+
+@pytest.fixture
+def chat_services(monkeypatch):
+    return use_fake_services(monkeypatch)
+
+
+def _run_turn(message="Hi"):
+    async def run():
+        sender = RecordingSender()
+        await asyncio.wait_for(chat.handle_chat_turn(sender, "conversation-1", AGENT, message), timeout=5)
+        return sender.frames
+
+    return asyncio.run(run())
+
+
+def test_user_message_is_saved_alongside_retrieval_and_before_the_reply(chat_services, monkeypatch):
+    monkeypatch.setitem(services._instances, "ollama_client", FakeOllama(["Hello"]))
+    db = chat_services
+    create_message = db.create_message
+    events = {"search": asyncio.Event(), "save": asyncio.Event()}
+
+    async def search(timer, agent, message):
+        db.calls.append("search")
+        events["search"].set()
+        # Only finishes once the save has started: fails if they ran one after the other
+        await asyncio.wait_for(events["save"].wait(), timeout=1)
+        return "context"
+
+    async def save(conversation_id, role, content):
+        if role == "user":
+            events["save"].set()
+            await asyncio.wait_for(events["search"].wait(), timeout=1)
+        return await create_message(conversation_id, role, content)
+
+    monkeypatch.setattr(chat, "_search_context", search)
+    monkeypatch.setattr(db, "create_message", save)
+
+    frames = _run_turn()
+    assert [f["type"] for f in frames] == ["token", "end"] and "stopped" not in frames[-1]
+    # History is read before the user message is stored, so it is not part of it
+    assert db.calls.index("memory") < db.calls.index("persist_user") < db.calls.index("persist_agent")
+    assert db.messages == [("user", "Hi"), ("agent", "Hello")]
+
+
+def test_failed_retrieval_answers_without_context_after_an_error_frame(chat_services, monkeypatch):
+    ollama = FakeOllama(["Hello"])
+    monkeypatch.setitem(services._instances, "ollama_client", ollama)
+
+    async def failing_search(timer, agent, message):
+        raise RuntimeError("embedding service down")
+
+    monkeypatch.setattr(chat, "_search_context", failing_search)
+    frames = _run_turn()
+    assert [f["type"] for f in frames] == ["error", "token", "end"]
+    assert ollama.contexts == [""]
+    assert chat_services.messages == [("user", "Hi"), ("agent", "Hello")]
+
+
+def test_failed_save_or_generation_sends_an_error_and_still_ends_the_turn(chat_services, monkeypatch):
+    db = chat_services
+    create_message = db.create_message
+
+    async def failing_user_save(conversation_id, role, content):
+        if role == "user":
+            raise RuntimeError("database unavailable")
+        return await create_message(conversation_id, role, content)
+
+    monkeypatch.setattr(db, "create_message", failing_user_save)
+    monkeypatch.setitem(services._instances, "ollama_client", FakeOllama(["Hello"]))
+    frames = _run_turn()
+    assert [f["type"] for f in frames] == ["token", "error", "end"]
+    assert db.messages == [("agent", "Hello")]
+
+    monkeypatch.setattr(db, "create_message", create_message)
+    ollama = FakeOllama(["Hal"], error=RuntimeError("Ollama went away"))
+    monkeypatch.setitem(services._instances, "ollama_client", ollama)
+    frames = _run_turn()
+    assert [f["type"] for f in frames] == ["token", "error", "end"] and "stopped" not in frames[-1]
+    assert ollama.closed
+    assert db.messages[-2:] == [("user", "Hi"), ("agent", "Hal")]
+
+
+def test_stop_frame_mid_stream_saves_the_partial_reply_and_releases_the_slot(chat_services, monkeypatch):
+    ollama = FakeOllama(["Hel", "lo"], hang=True)
+    monkeypatch.setitem(services._instances, "ollama_client", ollama)
+    monkeypatch.setitem(services._instances, "auth_client", SimpleNamespace(auth=SimpleNamespace(
+        get_user=lambda token: SimpleNamespace(user=SimpleNamespace(id="user-1"))
+    )))
+    app = FastAPI()
+    app.include_router(chat.router)
+
+    with TestClient(app) as client, client.websocket_connect("/chat/agent-1?token=t") as ws:
+        assert ws.receive_json()["type"] == "ready"
+        ws.send_json({"message": "Hi"})
+        assert ws.receive_json() == {"type": "token", "content": "Hel"}
+        assert ws.receive_json() == {"type": "token", "content": "lo"}
+        assert chat.generations.in_flight == 1
+
+        ws.send_json({"type": "stop"})
+        end = ws.receive_json()
+        assert end["type"] == "end" and end["stopped"] is True and end["message_id"] == "message-2"
+
+        # The slot is released by the turn's done callback
+        deadline = time.monotonic() + 2
+        while chat.generations.in_flight and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert chat.generations.in_flight == 0
+
+    assert ollama.closed
+    assert chat_services.messages == [("user", "Hi"), ("agent", "Hello")]
+
+
+def test_stop_before_generation_still_ends_the_turn(chat_services, monkeypatch):
+    ollama = FakeOllama(["never sent"])
+    monkeypatch.setitem(services._instances, "ollama_client", ollama)
+    retrieval_started = None
+
+    async def slow_search(timer, agent, message):
+        retrieval_started.set()
+        await asyncio.sleep(3600)
+
+    monkeypatch.setattr(chat, "_search_context", slow_search)
+
+    async def run():
+        nonlocal retrieval_started
+        retrieval_started = asyncio.Event()
+        sender = RecordingSender()
+        task = asyncio.create_task(chat.handle_chat_turn(sender, "conversation-1", AGENT, "Hi"))
+        await retrieval_started.wait()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return sender.frames
+
+    frames = asyncio.run(run())
+    assert frames == [{"type": "end", "message_id": "message-2", "trace_id": None, "stopped": True}]
+    assert chat_services.messages == [("user", "Hi"), ("agent", "")]
+    assert not ollama.closed
+
+
+def test_a_second_cancel_does_not_drop_the_shielded_save(chat_services, monkeypatch):
+    monkeypatch.setitem(services._instances, "ollama_client", FakeOllama(["Par", "tial"], hang=True))
+    db = chat_services
+    saving = None
+    release = None
+    create_message = db.create_message
+
+    async def slow_create_message(conversation_id, role, content):
+        if role == "agent":
+            saving.set()
+            await release.wait()
+        return await create_message(conversation_id, role, content)
+
+    monkeypatch.setattr(db, "create_message", slow_create_message)
+
+    async def run():
+        nonlocal saving, release
+        saving, release = asyncio.Event(), asyncio.Event()
+        sender = RecordingSender()
+        task = asyncio.create_task(chat.handle_chat_turn(sender, "conversation-1", AGENT, "Hi"))
+        while len(sender.frames) < 2:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        await saving.wait()
+        # Disconnect cleanup cancels again while the reply is being saved
+        task.cancel()
+        release.set()
+        await asyncio.gather(task, return_exceptions=True)
+        await asyncio.sleep(0.01)
+
+    asyncio.run(run())
+    assert db.messages == [("user", "Hi"), ("agent", "Partial")]
+
+
+if __name__ == "__main__":
+    for test in (test_user_message_is_saved_alongside_retrieval_and_before_the_reply,
+                 test_failed_retrieval_answers_without_context_after_an_error_frame,
+                 test_failed_save_or_generation_sends_an_error_and_still_ends_the_turn,
+                 test_stop_frame_mid_stream_saves_the_partial_reply_and_releases_the_slot,
+                 test_stop_before_generation_still_ends_the_turn,
+                 test_a_second_cancel_does_not_drop_the_shielded_save):
+        with pytest.MonkeyPatch.context() as monkeypatch:
+            test(use_fake_services(monkeypatch), monkeypatch)
+    print("✅ Chat turn tests passed")
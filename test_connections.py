@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Test script for the WebSocket connection registry
+"""
+
+import asyncio
+
+from backend.connections import ConnectionRegistry, ConnectionLimitExceeded
+
+
+class FakeWebSocket:
+    def __init__(self, broken=False):
+        self.sent = []
+        self.closed_with = None
+        self.broken = broken
+
+    async def send_text(self, data):
+        if self.broken:
+            raise RuntimeError("socket gone")
+        self.sent.append(data)
+
+    async def close(self, code=1000, reason=""):
+        self.closed_with = code
+
+
+def test_multiple_sessions_per_user():
+    """A second tab no longer overwrites the first"""
+    registry = ConnectionRegistry(max_connections_per_user=2)
+    first = registry.register(FakeWebSocket(), "u1", "a1")
+    second = registry.register(FakeWebSocket(), "u1", "a2")
+
+    assert {c.id for c in registry.for_user("u1")} == {first.id, second.id}
+    assert [c.id for c in registry.for_agent("a2")] == [second.id]
+
+    try:
+        registry.register(FakeWebSocket(), "u1", "a1")
+        assert False, "expected the per-user cap to apply"
+    except ConnectionLimitExceeded:
+        pass
+
+    registry.unregister(first.id)
+    registry.unregister(first.id)  # unregistering twice is harmless
+    assert registry.stats()["active_connections"] == 1
+    assert registry.for_agent("a1") == []
+
+
+def test_sweep_pings_and_evicts():
+    """Idle and dead sockets are evicted, live ones get a ping"""
+    registry = ConnectionRegistry(idle_timeout=60)
+    live = registry.register(FakeWebSocket(), "u1", "a1")
+    idle = registry.register(FakeWebSocket(), "u2", "a1")
+    dead = registry.register(FakeWebSocket(broken=True), "u3", "a1")
+    idle.last_seen -= 120
+
+    asyncio.run(registry.sweep())
+
+    assert list(registry.connections) == [live.id]
+    assert live.websocket.sent == ['{"type": "ping"}']
+    assert idle.websocket.closed_with == 4008
+    assert registry.stats()["evicted_total"] == 2
+    assert dead.id not in registry.connections
+
+
+if __name__ == "__main__":
+    test_multiple_sessions_per_user()
+    test_sweep_pings_and_evicts()
+    print("✅ Connection registry tests passed")
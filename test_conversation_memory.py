@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Test script for rolling conversation summaries and prompt assembly
+"""
+
+import asyncio
+
+from backend.database import DatabaseManager
+from backend.ollama_client import OllamaClient
+from backend.storage.sqlite_backend import SQLiteStorage
+from backend.summarizer import ConversationSummarizer
+
+
+class FakeSummaries:
+    """Summarizes by listing the folded message contents after the old summary"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def summarize_conversation(self, summary, messages):
+        self.calls.append([m["content"] for m in messages])
+        return " ".join([summary] + [m["content"] for m in messages]).strip()
+
+
+async def _conversation_with_messages(db, count):
+    agent = await db.create_agent("user-1", "Helper", "Be helpful")
+    conversation = await db.create_conversation(agent["id"])
+    for i in range(count):
+        await db.create_message(conversation["id"], "user" if i % 2 == 0 else "agent", f"m{i}")
+    return conversation["id"]
+
+
+def test_summaries_fold_older_messages_and_bound_the_prompt_history():
+    async def run():
+        db = DatabaseManager(SQLiteStorage(":memory:"))
+        conversation_id = await _conversation_with_messages(db, 9)
+        client = FakeSummaries()
+        summarizer = ConversationSummarizer(keep_messages=4, batch_messages=4)
+
+        # 5 messages are due: folded in one batch, the newest 4 stay verbatim
+        assert await summarizer.summarize(db, client, conversation_id) == 5
+        memory = await db.get_conversation_memory(conversation_id, 8)
+        assert memory["summary"] == "m0 m1 m2 m3 m4"
+        assert [m["content"] for m in memory["messages"]] == ["m5", "m6", "m7", "m8"]
+
+        # Fewer than a batch due: nothing is folded and nothing is lost
+        for i in range(9, 12):
+            await db.create_message(conversation_id, "user", f"m{i}")
+        assert await summarizer.summarize(db, client, conversation_id) == 0
+        memory = await db.get_conversation_memory(conversation_id, 8)
+        assert [m["content"] for m in memory["messages"]] == [f"m{i}" for i in range(5, 12)]
+
+        # Then the next batch rolls into the existing summary
+        await db.create_message(conversation_id, "agent", "m12")
+        assert await summarizer.summarize(db, client, conversation_id) == 4
+        memory = await db.get_conversation_memory(conversation_id, 8)
+        assert memory["summary"] == "m0 m1 m2 m3 m4 m5 m6 m7 m8"
+        assert [m["content"] for m in memory["messages"]] == ["m9", "m10", "m11", "m12"]
+        assert client.calls == [["m0", "m1", "m2", "m3", "m4"], ["m5", "m6", "m7", "m8"]]
+
+    asyncio.run(run())
+
+
+def test_worker_queues_each_conversation_once_and_yields_to_generations():
+    async def run():
+        db = DatabaseManager(SQLiteStorage(":memory:"))
+        conversation_id = await _conversation_with_messages(db, 6)
+        client = FakeSummaries()
+        busy = [True]
+        summarizer = ConversationSummarizer(keep_messages=2, batch_messages=2, max_wait_s=5.0, busy=lambda: busy[0])
+
+        summarizer.schedule(db, client, conversation_id)
+        summarizer.schedule(db, client, conversation_id)
+        await asyncio.sleep(0.05)
+        assert client.calls == []
+        busy[0] = False
+        await asyncio.sleep(0.6)
+        await summarizer.stop()
+        assert client.calls == [["m0", "m1", "m2", "m3"]]
+        assert summarizer.queue.empty() and not summarizer.pending
+
+    asyncio.run(run())
+
+
+def test_prompt_carries_summary_then_recent_messages():
+    prompt = OllamaClient.build_prompt(
+        "And in Lyon?", "Be brief", context="Paris is in France",
+        summary="The user is planning a trip to France.",
+        history=[{"role": "user", "content": "Weather in Paris?"}, {"role": "agent", "content": "Sunny."}]
+    )
+    assert prompt == (
+        "Context information:\nParis is in France\n\n"
+        "System: Be brief\n\n"
+        "Summary of the earlier conversation:\nThe user is planning a trip to France.\n\n"
+        "User: Weather in Paris?\n\nAssistant: Sunny.\n\n"
+        "User: And in Lyon?\n\nAssistant:"
+    )
+    # Without history the prompt is unchanged
+    assert OllamaClient.build_prompt("Hi", "Be brief") == "System: Be brief\n\nUser: Hi\n\nAssistant:"
+
+
+if __name__ == "__main__":
+    test_summaries_fold_older_messages_and_bound_the_prompt_history()
+    test_worker_queues_each_conversation_once_and_yields_to_generations()
+    test_prompt_carries_summary_then_recent_messages()
+    print("✅ Conversation memory tests passed")
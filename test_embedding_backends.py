@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Test script for the embedding backends: length-bucketed batching and the
+ONNX pooling logic offline, and cosine parity of ONNX against torch when
+both runtimes are installed
+"""
+
+import asyncio
+import os
+import tempfile
+
+import numpy as np
+import pytest
+
+from backend.embedding_service import EmbeddingService, plan_batches
+from backend.onnx_embedding import OnnxEmbeddingModel
+
+SENTENCES = [
+    "How do I reset my password?",
+    "The knowledge base is split into chunks of about five hundred characters.",
+    "Embeddings are compared by cosine similarity.",
+    "Short",
+    "Ollama streams tokens back as newline-delimited JSON while the model generates the answer.",
+]
+
+
+def test_plan_batches_fits_the_token_budget():
+    lengths = [10, 200, 12, 180, 11, 9]
+    batches = plan_batches(lengths, batch_tokens=400, max_batch_size=3)
+    assert batches == [[1, 3], [2, 4, 0], [5]]
+    for batch in batches:
+        assert len(batch) * max(lengths[i] for i in batch) <= 400
+    # A text longer than the budget still gets a batch of its own
+    assert plan_batches([1000, 5], batch_tokens=100, max_batch_size=8) == [[0], [1]]
+
+
+class RecordingModel:
+    """Embeds each text as [length, batch size] and records the batches"""
+
+    max_seq_length = 256
+
+    def __init__(self):
+        self.batches = []
+
+    def encode(self, texts, batch_size=32, convert_to_tensor=False):
+        self.batches.append(list(texts))
+        return np.array([[len(text), len(texts)] for text in texts], dtype=np.float32)
+
+
+def test_generate_embeddings_buckets_by_length_and_keeps_order():
+    service = EmbeddingService(batch_tokens=64, max_batch_size=4)
+    service.model = RecordingModel()
+    texts = ["x" * 200, "short", "y" * 210, "tiny", "z" * 8, "w" * 190]
+    updates = []
+
+    embeddings = asyncio.run(service.generate_embeddings(texts, progress=lambda done, total: updates.append((done, total))))
+
+    assert [row[0] for row in embeddings] == [len(text) for text in texts]
+    # Long texts (~52 tokens) go one per batch, the short ones share a batch
+    assert [len(batch) for batch in service.model.batches] == [1, 1, 1, 3]
+    assert updates == [(1, 6), (2, 6), (3, 6), (6, 6)]
+    assert asyncio.run(service.generate_embeddings([])) == []
+
+
+class FakeEncoding:
+    def __init__(self, ids, attention_mask):
+        self.ids = ids
+        self.attention_mask = attention_mask
+
+
+class FakeTokenizer:
+    """One token per word, padded to the longest text in the batch"""
+
+    def encode_batch(self, texts):
+        lengths = [len(text.split()) for text in texts]
+        width = max(lengths)
+        return [FakeEncoding([n] * n + [0] * (width - n), [1] * n + [0] * (width - n)) for n in lengths]
+
+
+class FakeSession:
+    """Token embeddings of [word count, 1] for real tokens and a large value for padding"""
+
+    def run(self, outputs, feed):
+        ids = feed["input_ids"].astype(np.float32)
+        padding = (feed["attention_mask"] == 0)[:, :, None] * 100.0
+        return [np.stack([ids, np.ones_like(ids)], axis=-1) + padding]
+
+
+def test_onnx_model_pools_masks_and_restores_order():
+    model = OnnxEmbeddingModel.__new__(OnnxEmbeddingModel)
+    model.config = {"dimensions": 2}
+    model.normalize = True
+    model._session = FakeSession()
+    model._tokenizer = FakeTokenizer()
+    model._input_names = ["input_ids", "attention_mask"]
+    model._pid = os.getpid()
+
+    texts = ["a b c", "a", "a b"]
+    embeddings = model.encode(texts, batch_size=2)
+    # Padding is masked out of the mean, rows are unit length and in input order
+    expected = np.array([[3.0, 1.0], [1.0, 1.0], [2.0, 1.0]])
+    expected /= np.linalg.norm(expected, axis=1, keepdims=True)
+    assert np.allclose(embeddings, expected)
+    assert model.encode("a b").shape == (2,)
+
+
+_exported = {}
+
+
+def _exported_model_dir() -> str:
+    """An exported model from EMBEDDING_ONNX_DIR, or one exported once for this run"""
+    for module in ("onnxruntime", "tokenizers", "sentence_transformers", "torch"):
+        pytest.importorskip(module)
+    directory = os.environ.get("EMBEDDING_ONNX_DIR")
+    if directory:
+        return directory
+    if "dir" not in _exported:
+        from backend.onnx_embedding import export_onnx
+        try:
+            _exported["dir"] = export_onnx("all-MiniLM-L6-v2", tempfile.mkdtemp(prefix="onnx-embedding-"))
+        except OSError as e:
+            pytest.skip(f"embedding model not available: {e}")
+    return _exported["dir"]
+
+
+def _cosines(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return (a * b).sum(axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+
+
+def test_onnx_backend_matches_torch():
+    directory = _exported_model_dir()
+    from sentence_transformers import SentenceTransformer
+
+    reference = SentenceTransformer("all-MiniLM-L6-v2").encode(SENTENCES, convert_to_tensor=False)
+
+    fp32 = OnnxEmbeddingModel(directory, quantized=False).encode(SENTENCES)
+    assert fp32.shape == reference.shape
+    assert _cosines(fp32, reference).min() > 0.999
+
+    int8 = OnnxEmbeddingModel(directory, quantized=True).encode(SENTENCES)
+    cosines = _cosines(int8, reference)
+    assert cosines.mean() > 0.98 and cosines.min() > 0.95, cosines
+
+    # Rankings survive quantization: each sentence is still its own nearest neighbour
+    assert (np.argmax(int8 @ reference.T, axis=1) == np.arange(len(SENTENCES))).all()
+
+
+if __name__ == "__main__":
+    test_plan_batches_fits_the_token_budget()
+    test_generate_embeddings_buckets_by_length_and_keeps_order()
+    test_onnx_model_pools_masks_and_restores_order()
+    try:
+        test_onnx_backend_matches_torch()
+    except pytest.skip.Exception as e:
+        print(f"skipped torch/ONNX parity: {e}")
+    print("✅ Embedding backend tests passed")
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Test script for the Prometheus metrics registry
+"""
+
+from backend.metrics import MetricsRegistry
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("op_seconds", "Operation latency", ["stage"], buckets=(0.1, 1.0))
+    histogram.observe(0.05, stage="embed")
+    histogram.observe(0.5, stage="embed")
+    histogram.observe(5.0, stage="embed")
+
+    text = registry.render()
+    assert "# TYPE op_seconds histogram" in text
+    assert 'op_seconds_bucket{stage="embed",le="0.1"} 1' in text
+    assert 'op_seconds_bucket{stage="embed",le="1.0"} 2' in text
+    assert 'op_seconds_bucket{stage="embed",le="+Inf"} 3' in text
+    assert 'op_seconds_count{stage="embed"} 3' in text
+    assert 'op_seconds_sum{stage="embed"} 5.55' in text
+
+
+def test_counter_and_gauge():
+    registry = MetricsRegistry()
+    errors = registry.counter("errors_total", "Errors", ["stage"])
+    errors.inc(stage="search")
+    errors.inc(2, stage="search")
+    registry.gauge("active", "Active things", lambda: 7)
+
+    text = registry.render()
+    assert 'errors_total{stage="search"} 3' in text
+    assert "active 7" in text
+    assert errors.value(stage="search") == 3
+
+
+def test_label_values_are_escaped():
+    registry = MetricsRegistry()
+    registry.counter("c_total", "C", ["route"]).inc(route='a"b')
+    assert 'c_total{route="a\\"b"} 1' in registry.render()
+
+
+if __name__ == "__main__":
+    test_histogram_renders_cumulative_buckets()
+    test_counter_and_gauge()
+    test_label_values_are_escaped()
+    print("✅ Metrics tests passed")
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Test script for Ollama model preloading, keep-alive and residency
+reporting, against the fake Ollama from the benchmarks
+"""
+
+import asyncio
+import functools
+
+import httpx
+
+from backend import ollama_client
+from backend.ollama_client import ModelKeepAlive, OllamaClient
+from benchmarks.fakes import create_ollama_app
+
+
+def _client_for(app, monkeypatch, keep_alive: str) -> OllamaClient:
+    transport = httpx.ASGITransport(app=app)
+    monkeypatch.setattr(ollama_client.httpx, "AsyncClient", functools.partial(httpx.AsyncClient, transport=transport))
+    return OllamaClient("http://ollama", "llama2", keep_alive)
+
+
+def test_load_and_chat_send_keep_alive_and_status_reports_residency(monkeypatch):
+    monkeypatch.setenv("FAKE_OLLAMA_TOKEN_RATE", "0")
+    monkeypatch.setenv("FAKE_OLLAMA_FIRST_TOKEN_MS", "0")
+    app = create_ollama_app()
+    client = _client_for(app, monkeypatch, "-1")
+
+    async def run():
+        assert await client.load_model()
+        reply = [token async for token in client.stream_chat("hi", "Be brief")]
+        assert reply
+        return await client.model_status()
+
+    status = asyncio.run(run())
+    load, chat = app.state.generate_requests
+    assert "prompt" not in load and load["keep_alive"] == -1
+    assert chat["prompt"] and chat["keep_alive"] == -1
+    # "llama2" matches the "llama2:latest" Ollama reports
+    assert status["resident"] and status["reachable"] and status["expires_at"]
+
+    client.keep_alive = "30m"
+    asyncio.run(client.load_model("mistral"))
+    assert app.state.generate_requests[-1] == {"model": "mistral", "stream": False, "keep_alive": "30m"}
+
+
+def test_keepalive_pings_only_while_sessions_are_active(monkeypatch):
+    app = create_ollama_app()
+    client = _client_for(app, monkeypatch, "")
+    sessions = []
+
+    async def run():
+        keeper = ModelKeepAlive(0.01, lambda: bool(sessions))
+        keeper.start(client)
+        await asyncio.sleep(0.05)
+        assert keeper.pings == 0
+        sessions.append("socket")
+        await asyncio.sleep(0.05)
+        await keeper.stop()
+        return keeper.pings
+
+    assert asyncio.run(run()) >= 2
+    assert all("keep_alive" not in body for body in app.state.generate_requests)
+
+
+if __name__ == "__main__":
+    import pytest
+    for test in (test_load_and_chat_send_keep_alive_and_status_reports_residency,
+                 test_keepalive_pings_only_while_sessions_are_active):
+        with pytest.MonkeyPatch.context() as monkeypatch:
+            test(monkeypatch)
+    print("✅ Ollama keep-alive tests passed")
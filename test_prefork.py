@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Test script for the pre-fork master: crashed workers are restarted with a
+backoff, and a worker that keeps failing stops the master
+"""
+
+import gc
+import logging
+import os
+
+import pytest
+
+from backend import prefork
+
+
+async def app(scope, receive, send):
+    pass
+
+
+def _failing_worker(config, sock, workers):
+    raise RuntimeError("model failed to load")
+
+
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork()")
+def test_master_gives_up_on_a_worker_that_keeps_crashing(monkeypatch):
+    monkeypatch.setattr(prefork, "_run_worker", _failing_worker)
+    handler = RecordingHandler()
+    prefork.logger.addHandler(handler)
+    try:
+        with pytest.raises(SystemExit) as e:
+            prefork.serve_prefork(
+                "test_prefork:app", host="127.0.0.1", port=0, workers=1, preload=None,
+                restart_backoff_s=0.01, max_crashes=3, crash_window_s=60.0
+            )
+    finally:
+        prefork.logger.removeHandler(handler)
+        gc.unfreeze()
+    assert e.value.code == 1
+
+    # Failures exit non-zero; two restarts with a growing backoff, then the third crash gives up
+    restarts = [m for m in handler.messages if "restarting" in m]
+    assert len(restarts) == 2 and all("exited with status 1" in m for m in restarts)
+    assert restarts[0].endswith("restarting in 0.01s") and restarts[1].endswith("restarting in 0.02s")
+    assert handler.messages[-1] == "Worker 0 exited 3 times within 60s (last status 1); stopping"
+
+
+if __name__ == "__main__":
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        test_master_gives_up_on_a_worker_that_keeps_crashing(monkeypatch)
+    print("✅ Pre-fork master tests passed")
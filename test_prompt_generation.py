@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Test script for background, de-duplicated system prompt generation
+"""
+
+import asyncio
+
+from backend.prompt_generation import (
+    SystemPromptGenerator,
+    PROMPT_STATUS_READY,
+    PROMPT_STATUS_FALLBACK,
+)
+
+
+class FakeOllama:
+    def __init__(self, fail=False):
+        self.calls = 0
+        self.fail = fail
+
+    async def request_system_prompt(self, name, description):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        if self.fail:
+            raise RuntimeError("ollama down")
+        return f"prompt for {name}"
+
+
+class FakeDB:
+    def __init__(self):
+        self.updates = {}
+
+    async def update_agent_system_prompt(self, agent_id, system_prompt, prompt_status):
+        self.updates[agent_id] = (system_prompt, prompt_status)
+
+
+def test_identical_agents_share_one_generation():
+    """Concurrent and repeated (name, description) pairs hit Ollama once"""
+    ollama, db = FakeOllama(), FakeDB()
+
+    async def run():
+        generator = SystemPromptGenerator(db, ollama)
+        generator.schedule("a1", "Helper", "Helps")
+        generator.schedule("a2", "Helper", "Helps")
+        await generator.wait_idle()
+        generator.schedule("a3", "Helper", "Helps")
+        await generator.wait_idle()
+
+    asyncio.run(run())
+    assert ollama.calls == 1
+    assert db.updates == {
+        "a1": ("prompt for Helper", PROMPT_STATUS_READY),
+        "a2": ("prompt for Helper", PROMPT_STATUS_READY),
+        "a3": ("prompt for Helper", PROMPT_STATUS_READY),
+    }
+
+
+def test_failed_generation_keeps_fallback():
+    """A failed generation only flips the status"""
+    ollama, db = FakeOllama(fail=True), FakeDB()
+
+    async def run():
+        generator = SystemPromptGenerator(db, ollama)
+        generator.schedule("a1", "Helper", "Helps")
+        await generator.wait_idle()
+
+    asyncio.run(run())
+    assert db.updates == {"a1": (None, PROMPT_STATUS_FALLBACK)}
+
+
+if __name__ == "__main__":
+    test_identical_agents_share_one_generation()
+    test_failed_generation_keeps_fallback()
+    print("✅ Prompt generation tests passed")
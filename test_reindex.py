@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Test script for re-embedding KB chunks after the embedding model changes
+"""
+
+import asyncio
+
+from backend.database import DatabaseManager
+from backend.reindex import ReindexJob
+from backend.storage.sqlite_backend import SQLiteStorage
+from backend.vector_index import vector_index
+
+
+class SwappedEmbeddings:
+    """A "new model" whose space swaps the two axes of the old one.
+
+    On its first batch it checks that searches still use the old vectors
+    and uploads a chunk with the old model, like a user mid-migration.
+    """
+
+    model_name = "new-model"
+
+    def __init__(self, db, agent_id):
+        self.db = db
+        self.agent_id = agent_id
+        self.batches = []
+
+    async def generate_embeddings(self, texts):
+        if not self.batches:
+            matches = await self.db.search_kb_chunks(self.agent_id, "", query_embedding=[1.0, 0.0], embedding_model="old-model")
+            assert [m["content"] for m in matches] == ["Cats purr"]
+            await self.db.create_kb_chunks(self.agent_id, ["Cows moo"], [[0.0, 1.0]], embedding_model="old-model")
+        self.batches.append(list(texts))
+        return [[0.0, 1.0] if text.startswith("Cats") else [1.0, 0.0] for text in texts]
+
+
+def test_reindex_switches_each_agent_after_its_last_batch():
+    async def run():
+        db = DatabaseManager(SQLiteStorage(":memory:"), embedding_model="old-model")
+        agent = await db.create_agent("user-1", "Helper", "Be helpful")
+        chunks = await db.create_kb_chunks(agent["id"], ["Cats purr", "Dogs bark"], [[1.0, 0.0], [0.0, 1.0]])
+        vector_index.set_agent(
+            agent["id"], [c["id"] for c in chunks], ["Cats purr", "Dogs bark"], [[1.0, 0.0], [0.0, 1.0]],
+            model="old-model"
+        )
+
+        service = SwappedEmbeddings(db, agent["id"])
+        job = ReindexJob()
+        await job.run(db, service, batch_size=1)
+        try:
+            assert job.status["state"] == "done", job.status
+            # Two original chunks plus the one uploaded during the migration
+            assert job.status["chunks_done"] == 3 and job.status["chunks_total"] == 2
+            assert sum(len(batch) for batch in service.batches) == 3
+
+            migrated = await db.storage.get_agent(agent["id"], "user-1")
+            assert migrated["embedding_model"] == "new-model" and migrated["reindex_model"] is None
+            assert await db.storage.count_kb_chunks_to_reindex(agent["id"], "new-model") == 0
+            # Searches now use the new space, from the reloaded local index
+            assert vector_index.agents[agent["id"]].model == "new-model"
+            matches = await db.search_kb_chunks(agent["id"], "", query_embedding=[0.0, 1.0], embedding_model="new-model")
+            assert [m["content"] for m in matches] == ["Cats purr"]
+            assert not vector_index.has_agent(agent["id"], "old-model")
+
+            # Nothing left to do the second time
+            await job.run(db, service, batch_size=1)
+            assert job.status["agents_total"] == 0 and job.status["state"] == "done"
+        finally:
+            vector_index.drop_agent(agent["id"])
+
+    asyncio.run(run())
+
+
+def test_reindex_drops_vectors_staged_for_another_model():
+    async def run():
+        db = DatabaseManager(SQLiteStorage(":memory:"), embedding_model="old-model")
+        agent = await db.create_agent("user-1", "Helper", "Be helpful")
+        chunks = await db.create_kb_chunks(agent["id"], ["Cats purr"], [[1.0, 0.0]])
+        await db.start_agent_reindex(agent, "abandoned-model")
+        await db.storage.stage_kb_chunk_embeddings(agent["id"], {chunks[0]["id"]: [0.5, 0.5]})
+        assert await db.storage.count_kb_chunks_to_reindex(agent["id"], "new-model") == 0
+
+        agent = await db.storage.get_agent(agent["id"], "user-1")
+        await db.start_agent_reindex(agent, "new-model")
+        assert await db.storage.count_kb_chunks_to_reindex(agent["id"], "new-model") == 1
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_reindex_switches_each_agent_after_its_last_batch()
+    test_reindex_drops_vectors_staged_for_another_model()
+    print("✅ Re-embedding tests passed")
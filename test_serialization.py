@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Test script for the JSON fast paths and response compression
+"""
+
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from fastapi.testclient import TestClient
+
+from backend.compression import CompressionMiddleware, negotiate_encoding
+from backend.models import ConversationResponse
+from backend.serialization import dumps, loads, trusted_response, trusted_rows
+
+
+def test_trusted_rows_match_the_model_keys():
+    rows = [{"id": "c1", "agent_id": "a1", "created_at": "2024-01-01T00:00:00+00:00", "extra": 1}]
+    shaped = trusted_rows(ConversationResponse, rows)
+    assert shaped == [{
+        "id": "c1",
+        "agent_id": "a1",
+        "created_at": "2024-01-01T00:00:00+00:00",
+        "message_count": 0,
+        "last_message_at": None,
+    }]
+    assert set(shaped[0]) == set(ConversationResponse(**rows[0]).model_dump())
+    assert loads(trusted_response(ConversationResponse, rows[0]).body) == shaped[0]
+    assert loads(dumps({"text": "héllo"})) == {"text": "héllo"}
+
+
+def test_negotiate_encoding():
+    assert negotiate_encoding("") is None
+    assert negotiate_encoding("identity") is None
+    assert negotiate_encoding("gzip, deflate") == "gzip"
+    assert negotiate_encoding("gzip;q=0") is None
+
+
+def test_compression_middleware():
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=100)
+
+    @app.get("/big")
+    def big():
+        return [{"content": "chunk text " * 5, "index": i} for i in range(50)]
+
+    @app.get("/small")
+    def small():
+        return {"ok": True}
+
+    @app.get("/text")
+    def text():
+        return PlainTextResponse("x" * 500, media_type="application/octet-stream")
+
+    client = TestClient(app)
+    response = client.get("/big", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    # httpx decodes the body; Content-Length is the compressed size
+    assert int(response.headers["content-length"]) < len(response.content)
+    assert response.json()[49]["index"] == 49
+
+    assert "content-encoding" not in client.get("/small", headers={"Accept-Encoding": "gzip"}).headers
+    assert "content-encoding" not in client.get("/text", headers={"Accept-Encoding": "gzip"}).headers
+    assert "content-encoding" not in client.get("/big", headers={"Accept-Encoding": "identity"}).headers
+
+
+if __name__ == "__main__":
+    test_trusted_rows_match_the_model_keys()
+    test_negotiate_encoding()
+    test_compression_middleware()
+    print("✅ Serialization tests passed")
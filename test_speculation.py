@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Test script for speculative retrieval on draft frames
+"""
+
+import asyncio
+
+from backend.speculation import DraftRetriever
+
+
+class RecordingRetrieval:
+    def __init__(self):
+        self.queries = []
+
+    async def __call__(self, query):
+        self.queries.append(query)
+        await asyncio.sleep(0.01)
+        return f"context for {query}"
+
+
+def test_draft_context_is_reused_when_the_message_extends_it():
+    async def run():
+        retrieve = RecordingRetrieval()
+        drafts = DraftRetriever(retrieve, debounce_ms=20, min_chars=4, min_coverage=0.8)
+
+        # Typing fast: only the last draft survives the debounce
+        drafts.update("How do I")
+        drafts.update("How do I reset")
+        drafts.update("How do  I reset my password")
+        await asyncio.sleep(0.05)
+        assert retrieve.queries == ["How do I reset my password"]
+        assert await drafts.take("How do I reset my password?") == "context for How do I reset my password"
+
+        # Consumed: the next message retrieves normally
+        assert await drafts.take("How do I reset my password?") is None
+
+        # A message that goes well beyond the draft does not reuse it
+        drafts.update("Pricing")
+        await asyncio.sleep(0.05)
+        assert await drafts.take("Pricing for teams of more than fifty people") is None
+
+    asyncio.run(run())
+
+
+def test_message_during_debounce_skips_speculation():
+    async def run():
+        retrieve = RecordingRetrieval()
+        drafts = DraftRetriever(retrieve, debounce_ms=50, min_chars=4)
+        drafts.update("What is the refund policy")
+        # Sent before the debounce ran out, then a retrieval still in flight is awaited
+        assert await drafts.take("What is the refund policy") is None
+        drafts.update("What is the refund policy")
+        await asyncio.sleep(0.055)
+        assert await drafts.take("What is the refund policy") == "context for What is the refund policy"
+        assert retrieve.queries == ["What is the refund policy"]
+
+        # Too short to be worth a retrieval
+        drafts.update("Hi")
+        assert drafts.task is None
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_draft_context_is_reused_when_the_message_extends_it()
+    test_message_during_debounce_skips_speculation()
+    print("✅ Speculative retrieval tests passed")
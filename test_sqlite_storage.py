@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Test script for the embedded SQLite storage backend
+"""
+
+import asyncio
+import os
+import tempfile
+from datetime import datetime, timezone
+
+import numpy as np
+import pydantic
+
+from backend.database import DatabaseManager
+from backend.models import KBChunkDeleteRequest
+from backend.pagination import InvalidCursor, decode_cursor, encode_cursor
+from backend.storage.sqlite_backend import SQLiteStorage, decode_embedding, encode_embedding
+from backend.vector_index import VectorIndex, build_snapshot, vector_index
+
+
+def test_embeddings_roundtrip_as_float32_blobs():
+    blob = encode_embedding([0.5, -1.0, 2.0])
+    assert len(blob) == 12
+    assert decode_embedding(blob) == [0.5, -1.0, 2.0]
+
+
+def test_database_manager_on_sqlite():
+    async def run():
+        db = DatabaseManager(SQLiteStorage(":memory:"))
+        agent = await db.create_agent("user-1", "Helper", "Be helpful", prompt_status="pending")
+        assert await db.get_agent(agent["id"], "user-2") is None
+        updated = await db.update_agent_system_prompt(agent["id"], "Be very helpful", "ready")
+        assert updated["system_prompt"] == "Be very helpful"
+        assert [a["id"] for a in await db.get_user_agents("user-1")] == [agent["id"]]
+
+        chunks = await db.create_kb_chunks(
+            agent["id"],
+            ["Cats purr", "Dogs bark", "  "],
+            [[1.0, 0.0], [0.0, 1.0], [1.0, 1.0]]
+        )
+        assert len(chunks) == 2
+        matches = await db.search_kb_chunks(agent["id"], "cats", query_embedding=[0.9, 0.1])
+        assert [m["content"] for m in matches] == ["Cats purr"]
+        # No vector match above the threshold falls back to text search
+        matches = await db.search_kb_chunks(agent["id"], "bark", query_embedding=[-1.0, 0.0])
+        assert [m["content"] for m in matches] == ["Dogs bark"]
+
+        exported = [row async for row in db.iter_kb_chunk_embeddings(page_size=1)]
+        assert sorted(row["embedding"] for row in exported) == [[0.0, 1.0], [1.0, 0.0]]
+
+        conversation = await db.create_conversation(agent["id"])
+        await db.create_message(conversation["id"], "user", "hi")
+        await db.create_message(conversation["id"], "agent", "hello")
+        messages = await db.get_conversation_messages(conversation["id"], "user-1")
+        assert [m["content"] for m in messages.items] == ["hi", "hello"]
+        assert (await db.get_conversation_messages(conversation["id"], "user-2")).items == []
+
+        empty = await db.create_conversation(agent["id"])
+        stats = {c["id"]: c for c in (await db.get_conversations(agent["id"])).items}
+        assert stats[conversation["id"]]["message_count"] == 2
+        assert stats[conversation["id"]]["last_message_at"] == messages.items[-1]["created_at"]
+        assert stats[empty["id"]]["message_count"] == 0
+        assert stats[empty["id"]]["last_message_at"] is None
+        await db.close()
+
+    asyncio.run(run())
+
+
+def test_prompts_left_pending_by_an_earlier_process_fall_back():
+    async def run():
+        db = DatabaseManager(SQLiteStorage(":memory:"))
+        stale = await db.create_agent("user-1", "Old", "Fallback prompt", prompt_status="pending")
+        done = await db.create_agent("user-1", "Done", "Generated prompt")
+        started_at = datetime.now(timezone.utc)
+        # Created by this process, so its generation is still running
+        fresh = await db.create_agent("user-1", "New", "Fallback prompt", prompt_status="pending")
+
+        assert await db.release_pending_prompts(started_at) == [stale["id"]]
+        agents = {a["id"]: a for a in await db.get_user_agents("user-1")}
+        assert agents[stale["id"]]["prompt_status"] == "fallback"
+        assert agents[stale["id"]]["system_prompt"] == "Fallback prompt"
+        assert agents[done["id"]]["prompt_status"] == "ready"
+        assert agents[fresh["id"]]["prompt_status"] == "pending"
+        assert await db.release_pending_prompts(started_at) == []
+
+    asyncio.run(run())
+
+
+def test_keyset_pagination():
+    """Pages follow (created_at, id), including rows that share a timestamp"""
+    async def run():
+        db = DatabaseManager(SQLiteStorage(":memory:"))
+        agent = await db.create_agent("user-1", "Helper", "Be helpful")
+        # One batch insert, so every chunk has the same created_at
+        await db.create_kb_chunks(agent["id"], [f"chunk {i}" for i in range(7)], [[1.0, 0.0]] * 7)
+
+        seen, cursor = [], None
+        while True:
+            page = await db.get_kb_chunks(agent["id"], limit=3, cursor=cursor)
+            assert len(page.items) <= 3
+            assert all("embedding" not in chunk for chunk in page.items)
+            seen.extend(chunk["id"] for chunk in page.items)
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        assert len(seen) == 7 and seen == sorted(seen)
+
+        conversations = [await db.create_conversation(agent["id"]) for _ in range(3)]
+        first = await db.get_conversations(agent["id"], limit=2)
+        rest = await db.get_conversations(agent["id"], limit=2, cursor=first.next_cursor)
+        assert [c["id"] for c in first.items + rest.items] == [c["id"] for c in reversed(conversations)]
+        assert rest.next_cursor is None
+
+        try:
+            await db.get_conversations(agent["id"], cursor="not-a-cursor")
+        except InvalidCursor:
+            pass
+        else:
+            raise AssertionError("bad cursor accepted")
+        await db.close()
+
+    asyncio.run(run())
+
+
+def test_cursors_only_carry_a_timestamp_and_a_uuid():
+    row = {"created_at": "2026-01-02T03:04:05.123456+00:00", "id": "0b5a3c1e-9f7d-4c1a-8e2b-6d4f1a2b3c4d"}
+    assert decode_cursor(encode_cursor(row)) == (row["created_at"], row["id"])
+    assert decode_cursor(encode_cursor({"created_at": "2026-01-02T03:04:05Z", "id": row["id"]}))
+
+    # Values end up in PostgREST filter expressions, so nothing else gets through
+    for crafted in (
+        {"created_at": row["created_at"], "id": "x,agent_id.neq.0"},
+        {"created_at": '2026-01-02T03:04:05")', "id": row["id"]},
+        {"created_at": "yesterday", "id": row["id"]},
+    ):
+        try:
+            decode_cursor(encode_cursor(crafted))
+        except InvalidCursor:
+            pass
+        else:
+            raise AssertionError(f"crafted cursor accepted: {crafted}")
+
+
+def test_bulk_deletes_keep_the_vector_index_in_step():
+    async def run():
+        db = DatabaseManager(SQLiteStorage(":memory:"))
+        agent = await db.create_agent("user-1", "Helper", "Be helpful")
+        vector_index.set_agent(agent["id"], [], [], np.zeros((0, 2), dtype=np.float32))
+        try:
+            files = await db.create_kb_files(agent["id"], ["a.txt", "b.txt"])
+            chunks = await db.create_kb_chunks(
+                agent["id"],
+                ["A one", "A two", "B one"],
+                [[1.0, 0.0], [1.0, 0.1], [0.0, 1.0]],
+                [files[0]["id"], files[0]["id"], files[1]["id"]]
+            )
+            assert len(vector_index.agents[agent["id"]]) == 3
+
+            assert await db.delete_kb_chunks(agent["id"], [chunks[0]["id"], "missing"]) == 1
+            assert await db.delete_kb_chunks("other-agent", [chunks[1]["id"]]) == 0
+            assert vector_index.agents[agent["id"]].ids == [chunks[1]["id"], chunks[2]["id"]]
+
+            assert await db.delete_kb_file(agent["id"], files[0]["id"]) == 1
+            assert await db.delete_kb_file(agent["id"], files[0]["id"]) is None
+            assert vector_index.agents[agent["id"]].ids == [chunks[2]["id"]]
+
+            conversation = await db.create_conversation(agent["id"])
+            await db.create_message(conversation["id"], "user", "hi")
+            assert not await db.delete_agent(agent["id"], "user-2")
+            assert await db.delete_agent(agent["id"], "user-1")
+            assert not vector_index.has_agent(agent["id"])
+            # Files, chunks and conversations cascade with the agent
+            counts = await db.storage._run("kb_chunks", "select", lambda conn: [
+                conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in ("kb_files", "kb_chunks", "conversations", "messages")
+            ])
+            assert counts == [0, 0, 0, 0]
+        finally:
+            vector_index.drop_agent(agent["id"])
+            await db.close()
+
+    asyncio.run(run())
+
+
+def test_chunk_delete_requests_only_take_uuids():
+    chunk_id = "0b5a3c1e-9f7d-4c1a-8e2b-6d4f1a2b3c4d"
+    assert [str(i) for i in KBChunkDeleteRequest(chunk_ids=[chunk_id]).chunk_ids] == [chunk_id]
+    try:
+        KBChunkDeleteRequest(chunk_ids=[chunk_id, "1 or 1=1"])
+    except pydantic.ValidationError:
+        pass
+    else:
+        raise AssertionError("non-UUID chunk id accepted")
+
+
+def test_kb_version_keeps_a_worker_from_serving_a_stale_index():
+    async def run():
+        db = DatabaseManager(SQLiteStorage(":memory:"))
+        agent = await db.create_agent("user-1", "Helper", "Be helpful")
+        try:
+            await db.create_kb_chunks(agent["id"], ["Cats purr"], [[1.0, 0.0]])
+            # Snapshots record the version they were exported at
+            with tempfile.TemporaryDirectory() as directory:
+                await build_snapshot(db, directory)
+                loaded = VectorIndex()
+                loaded.load(directory, mmap=False)
+            assert loaded.agents[agent["id"]].version == 1
+            vector_index.agents[agent["id"]] = loaded.agents[agent["id"]]
+
+            # This worker's own change keeps its index current
+            await db.create_kb_chunks(agent["id"], ["Dogs bark"], [[0.0, 1.0]])
+            assert vector_index.agents[agent["id"]].version == 2
+
+            # Another worker adds a chunk, which this index does not have
+            await db.storage.create_kb_chunks([{"agent_id": agent["id"], "content": "Birds sing", "embedding": [0.6, 0.8]}])
+            await db.storage.bump_kb_version(agent["id"])
+            agent = await db.get_agent(agent["id"], "user-1")
+            assert agent["kb_version"] == 3
+            assert not vector_index.has_agent(agent["id"], version=agent["kb_version"])
+            matches = await db.search_kb_chunks(agent["id"], "", query_embedding=[0.6, 0.8], kb_version=agent["kb_version"])
+            assert [m["content"] for m in matches] == ["Birds sing", "Dogs bark"]
+
+            # The next local change sees the gap and drops the stale copy
+            await db.delete_kb_chunks(agent["id"], [matches[0]["id"]])
+            assert not vector_index.has_agent(agent["id"])
+        finally:
+            vector_index.drop_agent(agent["id"])
+            await db.close()
+
+    asyncio.run(run())
+
+
+def test_file_database_uses_wal():
+    async def run():
+        with tempfile.TemporaryDirectory() as directory:
+            storage = SQLiteStorage(os.path.join(directory, "app.db"))
+            mode = await storage._run("pragma", "select", lambda db: db.execute("PRAGMA journal_mode").fetchone()[0])
+            assert mode == "wal"
+            await storage.close()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_embeddings_roundtrip_as_float32_blobs()
+    test_database_manager_on_sqlite()
+    test_prompts_left_pending_by_an_earlier_process_fall_back()
+    test_keyset_pagination()
+    test_cursors_only_carry_a_timestamp_and_a_uuid()
+    test_bulk_deletes_keep_the_vector_index_in_step()
+    test_chunk_delete_requests_only_take_uuids()
+    test_kb_version_keeps_a_worker_from_serving_a_stale_index()
+    test_file_database_uses_wal()
+    print("✅ SQLite storage tests passed")
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Test script for WebSocket token coalescing and frame encoding
+"""
+
+import asyncio
+import json
+import struct
+
+from backend.streaming import (
+    BinaryFrameEncoder,
+    FrameEncoder,
+    TokenCoalescer,
+    negotiate_framing,
+)
+
+
+def test_coalescer_flushes_on_size():
+    """Tokens are grouped into frames once the byte limit is reached"""
+    frames = []
+
+    async def send(frame):
+        frames.append(frame)
+
+    async def run():
+        coalescer = TokenCoalescer(send, flush_interval_ms=10_000, flush_max_bytes=10)
+        for token in ["hello", " ", "world", "!", " more"]:
+            await coalescer.add(token)
+        await coalescer.flush()
+
+    asyncio.run(run())
+    assert [f["content"] for f in frames] == ["hello world", "! more"]
+    assert all(f["type"] == "token" for f in frames)
+
+
+def test_coalescer_flushes_on_interval():
+    """A slow token stream is still flushed after the interval"""
+    frames = []
+
+    async def send(frame):
+        frames.append(frame)
+
+    async def run():
+        coalescer = TokenCoalescer(send, flush_interval_ms=10, flush_max_bytes=10_000)
+        await coalescer.add("slow")
+        await asyncio.sleep(0.05)
+        assert [f["content"] for f in frames] == ["slow"]
+        await coalescer.flush()
+
+    asyncio.run(run())
+    assert len(frames) == 1
+
+
+def test_timed_flush_never_lands_after_the_end_frame():
+    """close() settles a timed flush that is already sending before the end frame goes out"""
+    frames = []
+
+    async def slow_send(frame):
+        await asyncio.sleep(0.03)
+        frames.append(frame)
+
+    async def run():
+        coalescer = TokenCoalescer(slow_send, flush_interval_ms=10, flush_max_bytes=10_000)
+        await coalescer.add("a")
+        # The timer fires and its flush is now in the middle of sending "a"
+        await asyncio.sleep(0.015)
+        assert coalescer._flush_task is not None
+        await coalescer.add("b")
+        await coalescer.close()
+        await slow_send({"type": "end"})
+
+        # Stopped right after a token: the pending timer is cancelled
+        await coalescer.add("c")
+        await coalescer.close()
+        await slow_send({"type": "end"})
+        await asyncio.sleep(0.05)
+
+    asyncio.run(run())
+    assert frames == [
+        {"type": "token", "content": "a"},
+        {"type": "token", "content": "b"},
+        {"type": "end"},
+        {"type": "token", "content": "c"},
+        {"type": "end"},
+    ]
+
+
+def test_coalescer_per_token_mode():
+    """Zero interval and size send one frame per token"""
+    frames = []
+
+    async def send(frame):
+        frames.append(frame)
+
+    async def run():
+        coalescer = TokenCoalescer(send, flush_interval_ms=0, flush_max_bytes=0)
+        for token in ["a", "b", "c"]:
+            await coalescer.add(token)
+
+    asyncio.run(run())
+    assert [f["content"] for f in frames] == ["a", "b", "c"]
+
+
+def test_binary_framing():
+    """Binary frames are length-prefixed with a type code"""
+    encoder = BinaryFrameEncoder()
+    data = encoder.encode({"type": "token", "content": "héllo"})
+    code, length = struct.unpack("!BI", data[:5])
+    assert code == 0x01
+    assert data[5:].decode("utf-8") == "héllo"
+    assert length == len(data) - 5
+
+    data = encoder.encode({"type": "end", "message_id": "abc"})
+    code, length = struct.unpack("!BI", data[:5])
+    assert code == 0x02
+    assert json.loads(data[5:]) == {"type": "end", "message_id": "abc"}
+
+
+def test_negotiate_framing_defaults_to_json():
+    assert isinstance(negotiate_framing(None), FrameEncoder)
+    assert negotiate_framing("bogus").name == "json"
+    assert negotiate_framing("binary").name == "binary"
+
+
+if __name__ == "__main__":
+    test_coalescer_flushes_on_size()
+    test_coalescer_flushes_on_interval()
+    test_timed_flush_never_lands_after_the_end_frame()
+    test_coalescer_per_token_mode()
+    test_binary_framing()
+    test_negotiate_framing_defaults_to_json()
+    print("✅ Streaming tests passed")
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Test script for request tracing and the sampling profiler
+"""
+
+import asyncio
+import logging
+import threading
+import time
+
+from backend.profiler import SamplingProfiler
+from backend.tracing import TraceIdFilter, current_trace_id, event, span, start_trace
+
+
+def test_spans_are_recorded_on_the_current_trace():
+    with start_trace("turn", trace_id="abc") as trace:
+        with span("embed"):
+            pass
+        event("first_token")
+        assert current_trace_id() == "abc"
+    assert current_trace_id() is None
+    assert [name for name, _, _ in trace.spans] == ["embed", "first_token"]
+    assert trace.spans[1][2] is None
+
+
+def test_tasks_inherit_the_trace():
+    async def child():
+        with span("child"):
+            return current_trace_id()
+
+    async def run():
+        with start_trace("turn") as trace:
+            trace_id = await asyncio.create_task(child())
+        return trace, trace_id
+
+    trace, trace_id = asyncio.run(run())
+    assert trace_id == trace.trace_id
+    assert trace.spans[0][0] == "child"
+
+
+def test_log_filter_adds_trace_id():
+    record = logging.LogRecord("x", logging.INFO, __file__, 1, "msg", None, None)
+    with start_trace("turn", trace_id="t1"):
+        TraceIdFilter().filter(record)
+    assert record.trace_id == "t1"
+
+
+def test_profiler_collapses_stacks():
+    worker = threading.Thread(target=time.sleep, args=(0.1,), name="busy-worker")
+    worker.start()
+    profiler = SamplingProfiler(interval=0.001)
+    profiler.run(0.02)
+    worker.join()
+
+    lines = profiler.collapsed().splitlines()
+    assert profiler.sample_count > 0
+    assert any(line.startswith("busy-worker;") for line in lines)
+    for line in lines:
+        stack, count = line.rsplit(" ", 1)
+        assert int(count) > 0
+
+
+if __name__ == "__main__":
+    test_spans_are_recorded_on_the_current_trace()
+    test_tasks_inherit_the_trace()
+    test_log_filter_adds_trace_id()
+    test_profiler_collapses_stacks()
+    print("✅ Tracing tests passed")
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Test script for upload handling: body size limits enforced before and
+while the body arrives, and PDF parsing from spooled files
+"""
+
+import asyncio
+import mmap
+from tempfile import SpooledTemporaryFile
+
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+
+from backend.body_limit import BodySizeLimitMiddleware
+from backend.pdf_parser import PDFParser, _open_pdf
+from benchmarks.components import make_pdf
+
+
+def test_pdf_parses_the_same_from_bytes_memory_and_mapped_files():
+    pdf = make_pdf(3, seed=1)
+    expected = asyncio.run(PDFParser().parse_pdf(pdf))
+    assert expected
+
+    in_memory = SpooledTemporaryFile(max_size=len(pdf) + 1)
+    in_memory.write(pdf)
+    on_disk = SpooledTemporaryFile(max_size=1024)
+    on_disk.write(pdf)
+
+    with _open_pdf(in_memory) as stream:
+        assert stream is in_memory
+    # Looking for a descriptor must not push a small upload to disk
+    assert not in_memory._rolled
+    with _open_pdf(on_disk) as stream:
+        assert isinstance(stream, mmap.mmap) and len(stream) == len(pdf)
+
+    for spooled in (in_memory, on_disk):
+        assert asyncio.run(PDFParser().parse_pdf(spooled)) == expected
+
+
+def test_body_limit_rejects_declared_and_streamed_oversize_bodies():
+    app = FastAPI()
+    app.add_middleware(BodySizeLimitMiddleware, limits=[(r"^/upload$", 1024)])
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        return {"size": file.size}
+
+    @app.post("/other")
+    async def other(file: UploadFile = File(...)):
+        return {"size": file.size}
+
+    client = TestClient(app)
+    assert client.post("/upload", files={"file": ("a.txt", b"x" * 100)}).json() == {"size": 100}
+    assert client.post("/upload", files={"file": ("a.txt", b"x" * 2000)}).status_code == 413
+    assert client.post("/other", files={"file": ("a.txt", b"x" * 2000)}).json() == {"size": 2000}
+
+    def chunked():
+        yield b'--b\r\nContent-Disposition: form-data; name="file"; filename="a.txt"\r\n\r\n'
+        for _ in range(4):
+            yield b"y" * 512
+        yield b"\r\n--b--\r\n"
+
+    response = client.post("/upload", content=chunked(), headers={"content-type": "multipart/form-data; boundary=b"})
+    assert response.status_code == 413 and "too large" in response.json()["detail"]
+
+
+if __name__ == "__main__":
+    test_pdf_parses_the_same_from_bytes_memory_and_mapped_files()
+    test_body_limit_rejects_declared_and_streamed_oversize_bodies()
+    print("✅ Upload handling tests passed")
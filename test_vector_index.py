@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Test script for the local memory-mapped vector index
+"""
+
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from backend.vector_index import PCA_SUFFIX, REDUCED_SUFFIX, VectorIndex, parse_embedding
+
+
+def test_snapshot_roundtrip_and_search():
+    """Snapshots load memory-mapped and rank by cosine similarity"""
+    embeddings = np.eye(4, dtype=np.float32)
+    with tempfile.TemporaryDirectory() as directory:
+        VectorIndex.write_snapshot(directory, "agent-1", ["a", "b", "c", "d"], ["A", "B", "C", "D"], embeddings)
+
+        index = VectorIndex()
+        assert index.load(directory) == 4
+        assert isinstance(index.agents["agent-1"].embeddings, np.memmap)
+
+        results = index.search("agent-1", [0.1, 0.9, 0.0, 0.0], limit=2)
+        assert [r["id"] for r in results] == ["b", "a"]
+        assert results[0]["content"] == "B"
+
+        # Thresholds drop weak matches
+        assert [r["id"] for r in index.search("agent-1", [0, 1, 0, 0], limit=4, threshold=0.5)] == ["b"]
+
+
+def test_add_chunks_does_not_touch_the_mapped_file():
+    with tempfile.TemporaryDirectory() as directory:
+        VectorIndex.write_snapshot(directory, "agent-1", ["a"], ["A"], [[1.0, 0.0]])
+        index = VectorIndex()
+        index.load(directory)
+        index.add_chunks("agent-1", ["b"], ["B"], [[0.0, 2.0]])
+
+        assert [r["id"] for r in index.search("agent-1", [0, 1], limit=1)] == ["b"]
+        assert VectorIndex().load(directory) == 1
+
+
+def test_remove_chunks_copies_instead_of_writing_the_mapped_file():
+    with tempfile.TemporaryDirectory() as directory:
+        VectorIndex.write_snapshot(directory, "agent-1", ["a", "b"], ["A", "B"], [[1.0, 0.0], [0.0, 1.0]])
+        index = VectorIndex()
+        index.load(directory)
+
+        assert index.remove_chunks("agent-1", ["a", "missing"]) == 1
+        assert [r["id"] for r in index.search("agent-1", [1, 0], limit=2)] == ["b"]
+        assert VectorIndex().load(directory) == 2
+
+        index.drop_agent("agent-1")
+        assert not index.has_agent("agent-1")
+
+
+def _low_rank(rows: int, dims: int = 32, rank: int = 6) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    return (rng.standard_normal((rows, rank)) @ rng.standard_normal((rank, dims))).astype(np.float32)
+
+
+def test_two_stage_search_matches_single_stage():
+    embeddings = _low_rank(2000)
+    ids = [str(i) for i in range(len(embeddings))]
+    single = VectorIndex()
+    single.set_agent("agent-1", ids, ids, embeddings)
+    two_stage = VectorIndex(prefilter_dims=8, candidates=50, two_stage_min_chunks=1000)
+    two_stage.set_agent("agent-1", ids, ids, embeddings)
+    assert two_stage.agents["agent-1"].prefilter.reduced.shape == (2000, 8)
+
+    for query in embeddings[:20]:
+        expected = single.search("agent-1", query.tolist(), limit=5)
+        found = two_stage.search("agent-1", query.tolist(), limit=5)
+        assert [r["id"] for r in found] == [r["id"] for r in expected]
+        assert np.allclose([r["similarity"] for r in found], [r["similarity"] for r in expected], atol=1e-5)
+
+    # Small agents are searched in one stage
+    two_stage.set_agent("agent-2", ids[:10], ids[:10], embeddings[:10])
+    assert two_stage.agents["agent-2"].prefilter is None
+
+
+def test_prefilter_follows_adds_removes_and_snapshots():
+    embeddings, extra = np.split(_low_rank(305), [300])
+    ids = [str(i) for i in range(len(embeddings))]
+    with tempfile.TemporaryDirectory() as directory:
+        VectorIndex.write_snapshot(directory, "agent-1", ids, ids, embeddings, prefilter_dims=8)
+        index = VectorIndex(prefilter_dims=8, candidates=20, two_stage_min_chunks=100)
+        assert index.load(directory) == 300
+        assert isinstance(index.agents["agent-1"].prefilter.reduced, np.memmap)
+
+        index.add_chunks("agent-1", ["x0", "x1", "x2", "x3", "x4"], ["X"] * 5, extra)
+        index.remove_chunks("agent-1", ["0", "1", "x4"])
+        agent = index.agents["agent-1"]
+        assert len(agent.prefilter.reduced) == len(agent) == 302
+        assert np.allclose(agent.prefilter.reduced, agent.prefilter.project(agent.embeddings), atol=1e-4)
+        assert index.search("agent-1", extra[2].tolist(), limit=1)[0]["id"] == "x2"
+
+
+def test_rewritten_snapshot_does_not_keep_a_stale_prefilter():
+    embeddings = _low_rank(300)
+    ids = [str(i) for i in range(len(embeddings))]
+    with tempfile.TemporaryDirectory() as directory, tempfile.TemporaryDirectory() as backup:
+        VectorIndex.write_snapshot(directory, "agent-1", ids, ids, embeddings, prefilter_dims=8)
+        for suffix in (PCA_SUFFIX, REDUCED_SUFFIX):
+            shutil.copy(os.path.join(directory, "agent-1" + suffix), backup)
+
+        # The agent shrank below the two-stage threshold: no prefilter this time
+        VectorIndex.write_snapshot(directory, "agent-1", ids[:10], ids[:10], embeddings[:10])
+        assert sorted(os.listdir(directory)) == ["agent-1.json", "agent-1.npy"]
+        index = VectorIndex(prefilter_dims=8, candidates=4, two_stage_min_chunks=5)
+        assert index.load(directory) == 10
+        assert index.search("agent-1", embeddings[3].tolist(), limit=1)[0]["id"] == "3"
+
+        # Prefilter files that do not match the rows are refitted on load
+        for suffix in (PCA_SUFFIX, REDUCED_SUFFIX):
+            shutil.copy(os.path.join(backup, "agent-1" + suffix), directory)
+        index = VectorIndex(prefilter_dims=8, candidates=4, two_stage_min_chunks=5)
+        index.load(directory)
+        assert index.agents["agent-1"].prefilter.reduced.shape == (10, 8)
+        assert index.search("agent-1", embeddings[7].tolist(), limit=1)[0]["id"] == "7"
+
+
+def test_parse_embedding():
+    assert parse_embedding("[0.5, 1]") == [0.5, 1]
+    assert parse_embedding([1, 2]) == [1, 2]
+    assert parse_embedding(None) is None
+
+
+if __name__ == "__main__":
+    test_snapshot_roundtrip_and_search()
+    test_add_chunks_does_not_touch_the_mapped_file()
+    test_remove_chunks_copies_instead_of_writing_the_mapped_file()
+    test_two_stage_search_matches_single_stage()
+    test_prefilter_follows_adds_removes_and_snapshots()
+    test_rewritten_snapshot_does_not_keep_a_stale_prefilter()
+    test_parse_embedding()
+    print("✅ Vector index tests passed")